@@ -1,21 +1,770 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import argparse
+import asyncio
+import base64
+import bisect
+import contextlib
+import csv
+import functools
+import gzip
+import hashlib
 import http.server
+import io
+import itertools
+import logging
+import logging.handlers
 import socketserver
 import json
 import sqlite3
 import os
+import queue
+import re
+import selectors
+import shutil
+import socket
+import sys
+import threading
+import time
+import unicodedata
 import urllib.parse
+import zipfile
+import zlib
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
+from xml.sax.saxutils import escape as xml_escape
+
+try:
+    import brotli  # Optionnel : compression br si le module est installé
+except ImportError:
+    brotli = None
 
 # Configuration
 PORT = 5000
 DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'database', 'data.db'))
+WORKERS = 8  # Nombre de threads traitant les requêtes en parallèle
+ACCEPT_QUEUE = 32  # Connexions acceptées en attente d'un thread libre
+KEEPALIVE_TIMEOUT = 15  # Secondes avant fermeture d'une connexion keep-alive inactive
+
+# Paramètres des connexions SQLite
+DB_BUSY_TIMEOUT_MS = 5000  # Attente maximale d'un verrou avant SQLITE_BUSY
+DB_CACHE_SIZE_KB = 16384  # Cache de pages par connexion (16 Mo)
+DB_MMAP_SIZE = 256 * 1024 * 1024  # Lecture du fichier par mmap (256 Mo)
+
+# Partitions annuelles : chaque année close de ces tables est déplacée par
+# --archiver-annee dans son propre fichier, attaché en lecture seule
+TABLES_PARTITIONNEES = ('dece', 'arrets_travail')
+PARTITIONS_DOSSIER = None  # None : dossier « partitions » à côté de la base
+PARTITIONS_ATTACHEES_MAX = 10  # Par connexion : limite SQLite des bases attachées
+
+# Cache des réponses des endpoints de lecture
+CACHE_MAX_OCTETS = 32 * 1024 * 1024  # Taille maximale des réponses en cache (32 Mo)
+CACHE_TTL = 300  # Secondes avant expiration d'une réponse en cache
+
+# Compression des réponses négociée par Accept-Encoding
+COMPRESSION_SEUIL_OCTETS = 1024  # En dessous, la réponse est envoyée telle quelle
+COMPRESSION_NIVEAU_GZIP = 6
+COMPRESSION_NIVEAU_BROTLI = 5
+TYPES_COMPRESSIBLES = ('application/json', 'text/')  # Le XLSX est déjà compressé
+
+# Écritures groupées par un thread écrivain unique
+# Attente d'autres écritures avant le COMMIT. À 0, le groupe réunit les écritures arrivées
+# pendant le COMMIT précédent : pas de latence ajoutée pour un utilisateur seul
+ECRITURE_FENETRE_MS = 0
+ECRITURE_LOT_MAX = 256  # Écritures maximum par transaction
+ECRITURE_SYNCHRONOUS = 'FULL'  # Chaque COMMIT est synchronisé sur disque (durable même en cas de coupure)
+ECRITURE_DELAI_MAX_S = 60  # Attente maximale de la confirmation d'une écriture par l'appelant
+
+# Journalisation (écrite par un thread dédié, jamais par le thread de la requête)
+JOURNAL_NIVEAU = 'INFO'
+JOURNAL_FICHIER = None  # Fichier journal en plus de la sortie standard
+JOURNAL_TAILLE_MAX = 10 * 1024 * 1024  # Octets avant rotation du fichier journal
+JOURNAL_SAUVEGARDES = 5  # Anciens fichiers journaux conservés
+JOURNAL_FILE_MAX = 10000  # Entrées en attente d'écriture ; au-delà, elles sont abandonnées
+JOURNAL_ECHANTILLON_DEBUG = 1  # Une entrée DEBUG sur N est écrite
+JOURNAL_CORPS = False  # Corps des requêtes POST au niveau DEBUG (désactivé en production)
+# Champs remplacés par *** dans le journal : identité du patient et données médicales
+CHAMPS_MASQUES_JOURNAL = frozenset({
+    'nom', 'prenom', 'nom_ar', 'prenom_ar', 'pere', 'mere', 'perear', 'merear', 'conjoint',
+    'adresse', 'profession', 'date_naissance', 'dateNaissance', 'date_de_naissance', 'datePresume',
+    'lieu_naissance', 'cle_patient', 'causeDeces', 'causeDirecte', 'etatMorbide',
+    'CIM1', 'CIM2', 'CIM3', 'CIM4', 'CIM5', 'examen',
+})
+
+
+journal = logging.getLogger('certificats')
+
+
+def _masquer(valeur):
+    """Copie de valeur où les champs de CHAMPS_MASQUES_JOURNAL sont masqués"""
+    if isinstance(valeur, dict):
+        return {cle: '***' if cle in CHAMPS_MASQUES_JOURNAL and v not in (None, '') else _masquer(v)
+                for cle, v in valeur.items()}
+    if isinstance(valeur, (list, tuple)):
+        return [_masquer(v) for v in valeur]
+    return valeur
+
+
+class FormatJournal(logging.Formatter):
+    """Une ligne par entrée, texte ou JSON ; les champs structurés (extra={'champs': ...}) sont masqués"""
+
+    def __init__(self, json_lignes=False):
+        super().__init__('[%(asctime)s] %(levelname)s %(message)s', '%H:%M:%S')
+        self.json_lignes = json_lignes
+
+    def format(self, record):
+        champs = _masquer(getattr(record, 'champs', None) or {})
+        if not self.json_lignes:
+            ligne = super().format(record)
+            return f"{ligne} {json.dumps(champs, ensure_ascii=False, default=str)}" if champs else ligne
+        entree = {
+            'horodatage': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'niveau': record.levelname,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+            **champs,
+        }
+        if record.exc_info:
+            entree['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entree, ensure_ascii=False, default=str)
+
+
+class FiltreEchantillon(logging.Filter):
+    """Ne laisse passer qu'une entrée DEBUG sur taux ; les niveaux supérieurs passent toujours"""
+
+    def __init__(self, taux):
+        super().__init__()
+        self.taux = max(1, taux)
+        self._compteur = itertools.count()
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or next(self._compteur) % self.taux == 0
+
+
+class FileJournal(logging.handlers.QueueHandler):
+    """Dépose les entrées dans la file du thread d'écriture sans jamais attendre
+
+    Le formatage (message, masquage, JSON) est fait par le thread d'écriture.
+    File pleine : l'entrée est abandonnée et comptée plutôt que de bloquer la requête.
+    """
+
+    def __init__(self, file):
+        super().__init__(file)
+        self.abandonnees = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.abandonnees += 1
+
+
+_ecouteur_journal = None
+
+
+def configurer_journalisation(niveau=JOURNAL_NIVEAU, fichier=JOURNAL_FICHIER, json_lignes=False,
+                              echantillon_debug=JOURNAL_ECHANTILLON_DEBUG):
+    """Brancher le journal sur un thread d'écriture (sortie standard et fichier avec rotation)"""
+    global _ecouteur_journal
+    arreter_journalisation()
+    format_journal = FormatJournal(json_lignes)
+    sorties = [logging.StreamHandler(sys.stdout)]
+    if fichier:
+        sorties.append(logging.handlers.RotatingFileHandler(
+            fichier, maxBytes=JOURNAL_TAILLE_MAX, backupCount=JOURNAL_SAUVEGARDES, encoding='utf-8'))
+    for sortie in sorties:
+        sortie.setFormatter(format_journal)
+
+    file_journal = FileJournal(queue.Queue(JOURNAL_FILE_MAX))
+    file_journal.addFilter(FiltreEchantillon(echantillon_debug))
+    journal.handlers[:] = [file_journal]
+    journal.setLevel(niveau)
+    journal.propagate = False
+    metriques.jauge('journal_entrees_abandonnees', "Entrées de journal abandonnées (file pleine) depuis le démarrage",
+                    lambda: {(): file_journal.abandonnees})
+
+    _ecouteur_journal = logging.handlers.QueueListener(file_journal.queue, *sorties)
+    _ecouteur_journal.start()
+
+
+def arreter_journalisation():
+    """Écrire les entrées en attente puis arrêter le thread d'écriture"""
+    global _ecouteur_journal
+    if _ecouteur_journal is not None:
+        _ecouteur_journal.stop()
+        _ecouteur_journal = None
+
+
+class ConnectionPool:
+    """Une connexion SQLite par thread, ouverte et configurée une seule fois"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _connect(self):
+        # Chaque connexion n'est utilisée que par son thread ; check_same_thread
+        # est désactivé uniquement pour permettre close_all() à l'arrêt
+        # uri : les partitions sont attachées par « file:...?mode=ro »
+        conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                               cached_statements=256, check_same_thread=False,
+                               factory=ConnexionMesuree, uri=True)
+        conn.row_factory = sqlite3.Row
+        # WAL : les lecteurs ne bloquent pas l'écrivain (et inversement)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{DB_CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA mmap_size={DB_MMAP_SIZE}')
+        conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    def reouvrir(self):
+        """Fermer la connexion du thread courant ; la suivante est ouverte à neuf"""
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            with self._lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+            with contextlib.suppress(sqlite3.Error):
+                conn.close()
+
+    def taille(self):
+        """Nombre de connexions ouvertes"""
+        with self._lock:
+            return len(self._connections)
+
+    def close_all(self):
+        """Fermer toutes les connexions (arrêt du serveur)"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+db_pool = ConnectionPool()
+
+
+def get_connection():
+    """Connexion SQLite du thread courant"""
+    return db_pool.connection()
+
+
+class PartitionsAnnuelles:
+    """Fichiers annee-AAAA.db des années archivées et leur attachement aux connexions
+
+    La liste des années est relue dès que le dossier change : une année
+    archivée par un autre processus est lue sans redémarrer le serveur.
+    Chaque connexion attache à la demande, en lecture seule et par mmap, les
+    partitions dont une lecture a besoin et détache les moins récemment
+    utilisées au-delà de PARTITIONS_ATTACHEES_MAX.
+    """
+
+    _MOTIF = re.compile(r'annee-(\d{4})\.db$')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._signature = None
+        self._annees = ()
+
+    def dossier(self):
+        return PARTITIONS_DOSSIER or os.path.join(os.path.dirname(DB_PATH), 'partitions')
+
+    def chemin(self, annee):
+        return os.path.join(self.dossier(), f'annee-{annee}.db')
+
+    def annees(self):
+        """Années archivées, dans l'ordre"""
+        dossier = self.dossier()
+        try:
+            signature = (dossier, os.stat(dossier).st_mtime_ns)
+        except FileNotFoundError:
+            return ()
+        with self._lock:
+            if signature != self._signature:
+                self._annees = tuple(sorted(int(correspondance.group(1)) for correspondance in
+                                            map(self._MOTIF.match, os.listdir(dossier)) if correspondance))
+                self._signature = signature
+            return self._annees
+
+    def annees_periode(self, table, date_debut=None, date_fin=None):
+        """Années archivées de table que la période touche (toutes sans période)"""
+        if table not in TABLES_PARTITIONNEES:
+            return []
+        return [annee for annee in self.annees()
+                if (date_debut is None or str(annee) >= date_debut[:4])
+                and (date_fin is None or str(annee) <= date_fin[:4])]
+
+    def schemas(self, conn, table, date_debut=None, date_fin=None):
+        """Bases à lire pour table sur la période : 'main' puis les partitions attachées
+
+        ValueError si la période touche plus de PARTITIONS_ATTACHEES_MAX années
+        archivées (vérifié en amont par _valider_periode).
+        """
+        annees = self.annees_periode(table, date_debut, date_fin)
+        if len(annees) > PARTITIONS_ATTACHEES_MAX:
+            raise ValueError(f'Période trop longue : plus de {PARTITIONS_ATTACHEES_MAX} années archivées')
+        return ['main'] + [self.attacher(conn, annee) for annee in annees]
+
+    def attacher(self, conn, annee):
+        """Attacher la partition de annee à conn (si besoin) et renvoyer son nom de schéma"""
+        attachees = getattr(conn, 'partitions_attachees', None)
+        if attachees is None:
+            attachees = conn.partitions_attachees = OrderedDict()  # schéma -> {table: colonnes}
+        schema = f'p{annee}'
+        if schema in attachees:
+            attachees.move_to_end(schema)
+            return schema
+        while len(attachees) >= PARTITIONS_ATTACHEES_MAX:
+            conn.execute(f'DETACH DATABASE {attachees.popitem(last=False)[0]}')
+        uri = 'file:' + urllib.parse.quote(self.chemin(annee)) + '?mode=ro'
+        conn.execute(f'ATTACH DATABASE ? AS {schema}', (uri,))
+        conn.execute(f'PRAGMA {schema}.mmap_size={DB_MMAP_SIZE}')
+        attachees[schema] = {}
+        return schema
+
+    def colonnes(self, conn, schema, table):
+        """Colonnes de main.table lues dans schema.table (NULL si la partition,
+        archivée avant une migration, ne les a pas)"""
+        if schema == 'main':
+            return ', '.join(_colonnes_table(conn, 'main', table))
+        cache = conn.partitions_attachees[schema]
+        if table not in cache:
+            presentes = set(_colonnes_table(conn, schema, table))
+            cache[table] = ', '.join(colonne if colonne in presentes else f'NULL AS {colonne}'
+                                     for colonne in _colonnes_table(conn, 'main', table))
+        return cache[table]
+
+
+def _colonnes_table(conn, schema, table):
+    return [ligne[1] for ligne in conn.execute(f'PRAGMA {schema}.table_info({table})')]
+
+
+partitions = PartitionsAnnuelles()
+
+
+def _sql_sources(conn, table, condition, params, date_debut=None, date_fin=None, ordre=None, limite=None):
+    """Source FROM d'une lecture de table, élaguée aux partitions de la période
+
+    Sans partition concernée : « table WHERE condition », la requête d'avant
+    le partitionnement. Sinon, union de la même lecture sur la base courante
+    et chaque partition (chacune servie par ses index) ; avec limite, chaque
+    branche est triée par ordre et n'en renvoie que le début. -> (sql, params)
+    """
+    schemas = partitions.schemas(conn, table, date_debut, date_fin)
+    if len(schemas) == 1:
+        return f'{table} WHERE {condition}', list(params)
+    branches = []
+    for schema in schemas:
+        branche = f'SELECT {partitions.colonnes(conn, schema, table)} FROM {schema}.{table} WHERE {condition}'
+        if limite is not None:
+            branche = f'SELECT * FROM ({branche} ORDER BY {ordre} LIMIT {int(limite)})'
+        branches.append(branche)
+    return '(' + ' UNION ALL '.join(branches) + ')', list(params) * len(schemas)
+
+
+class CacheReponses:
+    """Cache LRU des réponses JSON sérialisées, borné en octets, avec durée de vie.
+
+    Chaque entrée est rattachée à des tables ; une écriture sur une table
+    incrémente sa génération et supprime les entrées qui en dépendent.
+    """
+
+    def __init__(self, max_octets=CACHE_MAX_OCTETS, ttl=CACHE_TTL):
+        self.max_octets = max_octets
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entrees = OrderedDict()  # cle -> (tables, expiration, corps, etag, encodage)
+        self._generations = {}
+        self._octets = 0
+
+    def generations(self, tables):
+        """Instantané des générations, à prendre AVANT de lire la base"""
+        with self._lock:
+            return tuple(self._generations.get(table, 0) for table in tables)
+
+    def lire(self, cle):
+        """(corps, etag, encodage) si l'entrée est présente et non expirée, sinon None"""
+        with self._lock:
+            entree = self._entrees.get(cle)
+            if entree is not None and entree[1] < time.monotonic():
+                self._retirer(cle)
+                entree = None
+            if entree is not None:
+                self._entrees.move_to_end(cle)
+        metriques.incrementer('api_cache_requetes_total', resultat='miss' if entree is None else 'hit')
+        return None if entree is None else (entree[2], entree[3], entree[4])
+
+    def stocker(self, cle, tables, generations, corps, etag, encodage=None):
+        if len(corps) > self.max_octets:
+            return
+        with self._lock:
+            # Une écriture a eu lieu pendant la lecture : résultat peut-être périmé
+            if generations != tuple(self._generations.get(table, 0) for table in tables):
+                return
+            if cle in self._entrees:
+                self._retirer(cle)
+            self._entrees[cle] = (tables, time.monotonic() + self.ttl, corps, etag, encodage)
+            self._octets += len(corps)
+            while self._octets > self.max_octets:
+                self._retirer(next(iter(self._entrees)))
+
+    def invalider(self, table):
+        """Appelé après chaque écriture validée sur la table"""
+        with self._lock:
+            self._generations[table] = self._generations.get(table, 0) + 1
+            for cle in [cle for cle, entree in self._entrees.items() if table in entree[0]]:
+                self._retirer(cle)
+
+    def vider(self):
+        with self._lock:
+            self._entrees.clear()
+            self._octets = 0
+
+    def taille(self):
+        """(nombre d'entrées, octets occupés)"""
+        with self._lock:
+            return len(self._entrees), self._octets
+
+    def _retirer(self, cle):
+        entree = self._entrees.pop(cle)
+        self._octets -= len(entree[2])
+
+
+cache_reponses = CacheReponses()
+
+
+# Bornes (secondes) des histogrammes de durée
+BORNES_DUREES = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _echapper_etiquette(valeur):
+    return str(valeur).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metriques:
+    """Compteurs, histogrammes et jauges exportés au format texte Prometheus"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._aides = {}  # nom -> (type, aide)
+        self._compteurs = {}  # (nom, etiquettes) -> valeur
+        self._histogrammes = {}  # (nom, etiquettes) -> [comptes par borne..., somme, nombre]
+        self._jauges = {}  # nom -> (aide, fonction renvoyant {etiquettes: valeur})
+
+    def decrire(self, nom, type_metrique, aide):
+        self._aides[nom] = (type_metrique, aide)
+
+    def incrementer(self, nom, valeur=1, **etiquettes):
+        cle = (nom, tuple(sorted(etiquettes.items())))
+        with self._lock:
+            self._compteurs[cle] = self._compteurs.get(cle, 0) + valeur
+
+    def observer(self, nom, duree, **etiquettes):
+        cle = (nom, tuple(sorted(etiquettes.items())))
+        with self._lock:
+            histogramme = self._histogrammes.get(cle)
+            if histogramme is None:
+                histogramme = self._histogrammes[cle] = [0] * (len(BORNES_DUREES) + 2)
+            index = bisect.bisect_left(BORNES_DUREES, duree)
+            if index < len(BORNES_DUREES):  # Au-delà de la dernière borne : seulement +Inf (le compte)
+                histogramme[index] += 1
+            histogramme[-2] += duree
+            histogramme[-1] += 1
+
+    def jauge(self, nom, aide, fonction):
+        """Jauge calculée à chaque export : fonction() -> {tuple d'étiquettes: valeur}"""
+        self._jauges[nom] = (aide, fonction)
+
+    @staticmethod
+    def _etiquettes(etiquettes, **supplementaires):
+        paires = list(etiquettes) + list(supplementaires.items())
+        if not paires:
+            return ''
+        return '{' + ','.join(f'{cle}="{_echapper_etiquette(valeur)}"' for cle, valeur in paires) + '}'
+
+    def exporter(self):
+        """Texte au format d'exposition Prometheus 0.0.4"""
+        with self._lock:
+            compteurs = dict(self._compteurs)
+            histogrammes = {cle: list(valeurs) for cle, valeurs in self._histogrammes.items()}
+
+        lignes = []
+        decrits = set()
+
+        def entete(nom, type_metrique, aide):
+            if nom not in decrits:
+                decrits.add(nom)
+                lignes.append(f'# HELP {nom} {aide}')
+                lignes.append(f'# TYPE {nom} {type_metrique}')
+
+        for (nom, etiquettes), valeur in sorted(compteurs.items()):
+            entete(nom, *self._aides.get(nom, ('counter', nom)))
+            lignes.append(f'{nom}{self._etiquettes(etiquettes)} {valeur}')
+
+        for (nom, etiquettes), valeurs in sorted(histogrammes.items()):
+            entete(nom, *self._aides.get(nom, ('histogram', nom)))
+            cumul = 0
+            for borne, compte in zip(BORNES_DUREES, valeurs):
+                cumul += compte
+                lignes.append(f'{nom}_bucket{self._etiquettes(etiquettes, le=borne)} {cumul}')
+            lignes.append(f'{nom}_bucket{self._etiquettes(etiquettes, le="+Inf")} {valeurs[-1]}')
+            lignes.append(f'{nom}_sum{self._etiquettes(etiquettes)} {valeurs[-2]:.6f}')
+            lignes.append(f'{nom}_count{self._etiquettes(etiquettes)} {valeurs[-1]}')
+
+        for nom, (aide, fonction) in sorted(self._jauges.items()):
+            entete(nom, 'gauge', aide)
+            for etiquettes, valeur in fonction().items():
+                lignes.append(f'{nom}{self._etiquettes(etiquettes)} {valeur}')
+
+        return '\n'.join(lignes) + '\n'
+
+
+metriques = Metriques()
+metriques.decrire('api_requetes_total', 'counter', "Requêtes HTTP traitées, par endpoint et statut")
+metriques.decrire('api_erreurs_total', 'counter', "Requêtes HTTP terminées en erreur (statut >= 400)")
+metriques.decrire('api_duree_requete_secondes', 'histogram', "Durée totale de traitement d'une requête")
+metriques.decrire('api_duree_phase_secondes', 'histogram',
+                  "Durée des phases d'une requête (lecture, base, ecriture, serialisation, compression)")
+metriques.decrire('sqlite_duree_requete_secondes', 'histogram',
+                  "Durée des requêtes SQLite (exécution et lecture des lignes)")
+metriques.decrire('api_cache_requetes_total', 'counter', "Consultations du cache de réponses")
+
+# Durées accumulées par phase pour la requête HTTP en cours, par thread
+mesure_requete = threading.local()
+
+
+def ajouter_duree_phase(phase, duree):
+    """Ajouter une durée à une phase de la requête en cours (sans effet hors requête)"""
+    phases = getattr(mesure_requete, 'phases', None)
+    if phases is not None:
+        phases[phase] = phases.get(phase, 0.0) + duree
+
+
+# Opérations dont la table lue ou écrite sert d'étiquette aux métriques SQL
+OPERATIONS_SQL_TABLE = frozenset(('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH'))
+_TABLE_SQL = re.compile(r'\b(?:FROM|INTO|UPDATE|JOIN)\s+(?:[A-Za-z_]\w*\.)?([A-Za-z_]\w*)', re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=1024)
+def _etiquettes_sql(sql):
+    """(opération, table) d'une requête SQL, pour des étiquettes de faible cardinalité"""
+    mots = sql.split(None, 1)
+    operation = mots[0].upper() if mots else ''
+    # DDL, PRAGMA et transactions : pas de table (ON / OF des triggers ne sont pas des tables)
+    if operation not in OPERATIONS_SQL_TABLE:
+        return operation, ''
+    # Schéma éventuel (main., partition) ignoré ; « FROM ( » passe à la sous-requête
+    correspondance = _TABLE_SQL.search(sql)
+    return operation, correspondance.group(1) if correspondance else ''
+
+
+class CurseurMesure(sqlite3.Cursor):
+    """Curseur qui mesure l'exécution et la lecture des lignes de chaque requête"""
+    _etiquettes_requete = ('', '')
+
+    def _mesurer(self, methode, *args):
+        debut = time.perf_counter()
+        try:
+            return methode(self, *args)
+        finally:
+            duree = time.perf_counter() - debut
+            operation, table = self._etiquettes_requete
+            metriques.observer('sqlite_duree_requete_secondes', duree, operation=operation, table=table)
+            ajouter_duree_phase('base', duree)
+
+    def execute(self, sql, *args):
+        self._etiquettes_requete = _etiquettes_sql(sql)
+        return self._mesurer(sqlite3.Cursor.execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        self._etiquettes_requete = _etiquettes_sql(sql)
+        return self._mesurer(sqlite3.Cursor.executemany, sql, *args)
+
+    def fetchone(self):
+        return self._mesurer(sqlite3.Cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._mesurer(sqlite3.Cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._mesurer(sqlite3.Cursor.fetchall)
+
+
+class ConnexionMesuree(sqlite3.Connection):
+    """Connexion dont tous les curseurs (y compris ceux de execute()) sont mesurés"""
+
+    def cursor(self, factory=CurseurMesure):
+        return super().cursor(factory)
+
+
+@contextlib.contextmanager
+def mesurer_phase(phase):
+    """Mesurer un bloc comme phase de la requête en cours"""
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        ajouter_duree_phase(phase, time.perf_counter() - debut)
+
+
+metriques.jauge('api_cache_entrees', "Réponses présentes dans le cache",
+                lambda: {(): cache_reponses.taille()[0]})
+metriques.jauge('api_cache_octets', "Octets occupés par le cache de réponses",
+                lambda: {(): cache_reponses.taille()[1]})
+metriques.jauge('sqlite_connexions_ouvertes', "Connexions SQLite ouvertes par le pool",
+                lambda: {(): db_pool.taille()})
+
+
+class EcrivainGroupe:
+    """Thread unique qui applique toutes les écritures, groupées en transactions
+
+    Les écritures arrivées pendant la fenêtre partagent un seul COMMIT (un
+    seul fsync). Chacune s'exécute dans son propre SAVEPOINT : l'échec de
+    l'une (doublon...) n'annule pas les autres. Avec un seul écrivain, les
+    écritures concurrentes ne se disputent plus le verrou (pas de SQLITE_BUSY).
+    """
+
+    def __init__(self, fenetre_ms=ECRITURE_FENETRE_MS, lot_max=ECRITURE_LOT_MAX):
+        self.fenetre = fenetre_ms / 1000
+        self.lot_max = lot_max
+        self._file = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def executer(self, table, operation):
+        """Exécuter operation(conn) dans le thread écrivain et attendre le COMMIT
+
+        table est la table dont le cache est invalidé (None : aucune, maintenance).
+        Renvoie le résultat de operation. Une exception levée par operation est
+        relevée ici, ses modifications (et seulement les siennes) annulées.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._demarrer()
+        futur = Future()
+        debut = time.perf_counter()
+        self._file.put((table, operation, futur))
+        try:
+            return futur.result(timeout=ECRITURE_DELAI_MAX_S)
+        except TimeoutError:
+            raise TimeoutError(f"Écriture non confirmée après {ECRITURE_DELAI_MAX_S} s") from None
+        finally:
+            ajouter_duree_phase('ecriture', time.perf_counter() - debut)
+
+    def taille_file(self):
+        return self._file.qsize()
+
+    def _demarrer(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._boucle, name='ecrivain-sqlite', daemon=True)
+                self._thread.start()
+
+    def arreter(self):
+        """Appliquer les écritures en attente puis arrêter le thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._file.put(None)
+            thread.join()
+
+    def _boucle(self):
+        conn = None
+        arret = False
+        while not arret:
+            element = self._file.get()
+            if element is None:
+                break
+            lot = [element]
+            limite = time.monotonic() + self.fenetre
+            while len(lot) < self.lot_max:
+                attente = limite - time.monotonic()
+                try:
+                    element = self._file.get(timeout=attente) if attente > 0 else self._file.get_nowait()
+                except queue.Empty:
+                    break
+                if element is None:
+                    arret = True
+                    break
+                lot.append(element)
+            try:
+                if conn is None:
+                    conn = get_connection()
+                    conn.execute(f'PRAGMA synchronous={ECRITURE_SYNCHRONOUS}')
+                self._appliquer(conn, lot)
+            except Exception as e:
+                # Connexion inutilisable : les écritures du groupe échouent, le
+                # thread continue avec une nouvelle connexion
+                journal.error("Écrivain SQLite: %s, connexion rouverte", e)
+                for _, _, futur in lot:
+                    if not futur.done():
+                        futur.set_exception(e)
+                db_pool.reouvrir()
+                conn = None
+
+    def _appliquer(self, conn, lot):
+        resultats = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for table, operation, futur in lot:
+                conn.execute('SAVEPOINT ecriture')
+                try:
+                    resultats.append((table, futur, operation(conn), None))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO ecriture')
+                    resultats.append((table, futur, None, e))
+                conn.execute('RELEASE ecriture')
+            conn.commit()
+        except Exception as e:
+            # BEGIN ou COMMIT impossible : aucune écriture du groupe n'est appliquée
+            journal.error("Échec de la transaction groupée (%s écritures): %s", len(lot), e)
+            for _, _, futur in lot:
+                if not futur.done():
+                    futur.set_exception(e)
+            # Un ROLLBACK impossible signale une connexion inutilisable (voir _boucle)
+            if conn.in_transaction:
+                conn.rollback()
+            return
+
+        metriques.incrementer('sqlite_transactions_groupees_total')
+        metriques.incrementer('sqlite_ecritures_total', len(lot))
+        # Invalider avant de répondre : l'appelant relit ses propres écritures
+        for table in {table for table, _, _, erreur in resultats if erreur is None and table}:
+            cache_reponses.invalider(table)
+        for _, futur, resultat, erreur in resultats:
+            if erreur is None:
+                futur.set_result(resultat)
+            else:
+                futur.set_exception(erreur)
+
+
+ecrivain = EcrivainGroupe()
+metriques.decrire('sqlite_transactions_groupees_total', 'counter', "Transactions d'écriture validées")
+metriques.decrire('sqlite_ecritures_total', 'counter', "Écritures validées (ajouts, modifications, suppressions, lots)")
+metriques.jauge('sqlite_ecritures_en_attente', "Écritures en attente du thread écrivain",
+                lambda: {(): ecrivain.taille_file()})
 
 def init_db():
     """Initialize the database (arrets_travail, prolongation and cbv tables)"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
     # Créer la table pour les arrêts de travail
@@ -149,1037 +898,2049 @@ def init_db():
     )''')
 
     conn.commit()
-    conn.close()
 
-class APIHandler(http.server.BaseHTTPRequestHandler):
-    def _set_headers(self, status_code=200):
-        self.send_response(status_code)
-        self.send_header('Content-type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
-    
-    def do_OPTIONS(self):
-        self._set_headers(200)
-    
-    def do_GET(self):
-        if self.path == '/api/test':
-            self._set_headers(200)
-            response = {
-                'success': True,
-                'message': 'API locale fonctionnelle'
-            }
-            self.wfile.write(json.dumps(response).encode())
-        else:
-            self._set_headers(404)
-            response = {'error': 'Endpoint non trouvé'}
-            self.wfile.write(json.dumps(response).encode())
-    
-    def do_POST(self):
-        if self.path == '/api/ajouter_arret_travail':
-            try:
-                # Lire le corps de la requête
-                content_length = int(self.headers['Content-Length'])
-                post_data = self.rfile.read(content_length)
-                data = json.loads(post_data.decode('utf-8'))
-                
-                print(f"Données reçues: {data}")
-                
-                # Appeler la fonction d'ajout d'arrêt de travail
-                success, message = ajouter_arret_travail(
-                    nom=data.get('nom', ''),
-                    prenom=data.get('prenom', ''),
-                    medecin=data.get('medecin', ''),
-                    nombre_jours=data.get('nombre_jours', 1),
-                    date_certificat=data.get('date_certificat', ''),
-                    date_naissance=data.get('date_naissance', None),
-                    age=data.get('age', None)
-                )
-                
-                if success:
-                    self._set_headers(200)
-                    response = {
-                        'success': True,
-                        'message': message
-                    }
-                else:
-                    self._set_headers(400)
-                    response = {
-                        'success': False,
-                        'error': message
-                    }
-                
-                self.wfile.write(json.dumps(response).encode())
-                
-            except Exception as e:
-                self._set_headers(500)
-                response = {
-                    'success': False,
-                    'error': f'Erreur serveur: {str(e)}'
-                }
-                self.wfile.write(json.dumps(response).encode())
-        elif self.path == '/api/ajouter_prolongation':
-            try:
-                # Lire le corps de la requête
-                content_length = int(self.headers['Content-Length'])
-                post_data = self.rfile.read(content_length)
-                data = json.loads(post_data.decode('utf-8'))
-                
-                print(f"Données de prolongation reçues: {data}")
-                
-                # Appeler la fonction d'ajout de prolongation
-                success, message = ajouter_prolongation(
-                    nom=data.get('nom', ''),
-                    prenom=data.get('prenom', ''),
-                    medecin=data.get('medecin', ''),
-                    nombre_jours=data.get('nombre_jours', 1),
-                    date_certificat=data.get('date_certificat', ''),
-                    date_naissance=data.get('date_naissance', None),
-                    age=data.get('age', None)
-                )
-                
-                if success:
-                    self._set_headers(200)
-                    response = {
-                        'success': True,
-                        'message': message
-                    }
-                else:
-                    self._set_headers(400)
-                    response = {
-                        'success': False,
-                        'error': message
-                    }
-                
-                self.wfile.write(json.dumps(response).encode())
-                
-            except Exception as e:
-                self._set_headers(500)
-                response = {
-                    'success': False,
-                    'error': f'Erreur serveur: {str(e)}'
-                }
-        elif self.path == "/api/ajouter_cbv":
-            try:
-                # Lire le corps de la requête
-                content_length = int(self.headers["Content-Length"])
-                post_data = self.rfile.read(content_length)
-                data = json.loads(post_data.decode("utf-8"))
-                
-                print(f"Données CBV reçues: {data}")
-                
-                # Appeler la fonction d"ajout de CBV
-                success, message = ajouter_cbv(
-                    nom=data.get("nom", ""),
-                    prenom=data.get("prenom", ""),
-                    medecin=data.get("medecin", ""),
-                    date_certificat=data.get("date_certificat", ""),
-                    heure=data.get("heure", None),
-                    date_naissance=data.get("date_naissance", None),
-                    titre=data.get("titre", None),
-                    examen=data.get("examen", None)
-                )
-                
-                self._set_headers(200)
-                response = {
-                    'success': success,
-                    'message': message
-                }
-                self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-                
-            except Exception as e:
-                self._set_headers(500)
-                response = {
-                    'success': False,
-                    'message': f'Erreur serveur: {str(e)}'
-                }
-                self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-                
-        elif self.path == "/api/ajouter_antirabique":
-            try:
-                # Lire le corps de la requête
-                content_length = int(self.headers["Content-Length"])
-                post_data = self.rfile.read(content_length)
-                data = json.loads(post_data.decode("utf-8"))
-                
-                print(f"Données antirabique reçues: {data}")
-                
-                # Appeler la fonction d'ajout antirabique
-                success, message = ajouter_antirabique(
-                    nom=data.get("nom", ""),
-                    prenom=data.get("prenom", ""),
-                    medecin=data.get("medecin", ""),
-                    classe=data.get("classe", ""),
-                    type_de_vaccin=data.get("type_de_vaccin", ""),
-                    shema=data.get("shema", ""),
-                    date_de_certificat=data.get("date_de_certificat", ""),
-                    date_de_naissance=data.get("date_de_naissance", None),
-                    animal=data.get("animal", "")
-                )
-                
-                self._set_headers(200)
-                response = {
-                    'success': success,
-                    'message': message
-                }
-                self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-                
-            except Exception as e:
-                self._set_headers(500)
-                response = {
-                    'success': False,
-                    'message': f'Erreur serveur: {str(e)}'
-                }
-                self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-                
-        elif self.path == "/api/ajouter_antirabique":
-            try:
-                # Lire le corps de la requête
-                content_length = int(self.headers["Content-Length"])
-                post_data = self.rfile.read(content_length)
-                data = json.loads(post_data.decode("utf-8"))
-                
-                print(f"Données antirabique reçues: {data}")
-                
-                # Appeler la fonction d'ajout antirabique
-                success, message = ajouter_antirabique(
-                    nom=data.get("nom", ""),
-                    prenom=data.get("prenom", ""),
-                    medecin=data.get("medecin", ""),
-                    classe=data.get("classe", ""),
-                    type_de_vaccin=data.get("type_de_vaccin", ""),
-                    shema=data.get("shema", ""),
-                    date_de_certificat=data.get("date_de_certificat", ""),
-                    date_de_naissance=data.get("date_de_naissance", None),
-                    animal=data.get("animal", "")
-                )
-                
-                if success:
-                    self._set_headers(200)
-                    response = {
-                        "success": True,
-                        "message": message
-                    }
-                else:
-                    self._set_headers(400)
-                    response = {
-                        "success": False,
-                        "error": message
-                    }
-                
-                self.wfile.write(json.dumps(response).encode())
-            
-            except Exception as e:
-                self._set_headers(500)
-                response = {
-                    'success': False,
-                    'error': f'Erreur serveur: {str(e)}'
-                }
-                self.wfile.write(json.dumps(response).encode())
-        elif self.path == "/api/recuperer_donnees":
-            try:
-                print("Endpoint /api/recuperer_donnees appelé")
-                
-                # Lire le corps de la requête
-                content_length = int(self.headers["Content-Length"])
-                post_data = self.rfile.read(content_length)
-                data = json.loads(post_data.decode("utf-8"))
-                
-                print(f"Données de récupération reçues: {data}")
-                print(f"Table: {data.get('table', '')}")
-                print(f"Date début: {data.get('date_debut', '')}")
-                print(f"Date fin: {data.get('date_fin', '')}")
-                
-                # Appeler la fonction de récupération des données
-                result = recuperer_donnees_entre_dates(
-                    table=data.get("table", ""),
-                    date_debut=data.get("date_debut", ""),
-                    date_fin=data.get("date_fin", "")
-                )
-                
-                print(f"Résultat de la récupération: {result}")
-                
-                if result['ok']:
-                    self._set_headers(200)
-                    response = {
-                        'success': True,
-                        'data': result['data'],
-                        'total': result['total'],
-                        'returned': result['returned']
-                    }
-                else:
-                    self._set_headers(400)
-                    response = {
-                        'success': False,
-                        'error': result['error']
-                    }
-                
-                self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-                
-            except Exception as e:
-                self._set_headers(500)
-                response = {
-                    'success': False,
-                    'error': f'Erreur serveur: {str(e)}'
-                }
-                self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-        elif self.path == "/api/modifier_enregistrement":
-            try:
-                # Lire le corps de la requête
-                content_length = int(self.headers["Content-Length"])
-                post_data = self.rfile.read(content_length)
-                data = json.loads(post_data.decode("utf-8"))
-                
-                print(f"Données de modification reçues: {data}")
-                
-                # Appeler la fonction de modification
-                result = modifier_enregistrement(
-                    table=data.get("table", ""),
-                    update_data=data.get("data", {})
-                )
-                
-                if result['ok']:
-                    self._set_headers(200)
-                    response = {
-                        'success': True,
-                        'message': 'Enregistrement modifié avec succès'
-                    }
-                else:
-                    self._set_headers(400)
-                    response = {
-                        'success': False,
-                        'error': result['error']
-                    }
-                
-                self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-                
-            except Exception as e:
-                self._set_headers(500)
-                response = {
-                    'success': False,
-                    'error': f'Erreur serveur: {str(e)}'
-                }
-                self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-        elif self.path == "/api/ajouter_dece":
-            try:
-                # Lire le corps de la requête
-                content_length = int(self.headers["Content-Length"])
-                post_data = self.rfile.read(content_length)
-                data = json.loads(post_data.decode("utf-8"))
-                
-                print(f"Données de décès reçues: {data}")
-                
-                # Appeler la fonction d'ajout de certificat de décès
-                success, message = ajouter_dece(data)
-                
-                if success:
-                    self._set_headers(200)
-                    response = {
-                        'success': True,
-                        'message': message
-                    }
-                else:
-                    self._set_headers(400)
-                    response = {
-                        'success': False,
-                        'error': message
-                    }
-                
-                self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-                
-            except Exception as e:
-                self._set_headers(500)
-                response = {
-                    'success': False,
-                    'error': f'Erreur serveur: {str(e)}'
-                }
-                self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-        elif self.path == "/api/modifier_dece":
-            try:
-                # Lire le corps de la requête
-                content_length = int(self.headers["Content-Length"])
-                post_data = self.rfile.read(content_length)
-                data = json.loads(post_data.decode("utf-8"))
-                
-                print(f"Données de modification de décès reçues: {data}")
-                
-                # Appeler la fonction de modification de certificat de décès
-                success, message = modifier_dece(data)
-                
-                if success:
-                    self._set_headers(200)
-                    response = {
-                        'success': True,
-                        'message': message
-                    }
-                else:
-                    self._set_headers(400)
-                    response = {
-                        'success': False,
-                        'error': message
-                    }
-                
-                self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-                
-            except Exception as e:
-                self._set_headers(500)
-                response = {
-                    'success': False,
-                    'error': f'Erreur serveur: {str(e)}'
-                }
-                self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-        elif self.path == "/api/supprimer_enregistrement":
-            try:
-                # Lire le corps de la requête
-                content_length = int(self.headers["Content-Length"])
-                post_data = self.rfile.read(content_length)
-                data = json.loads(post_data.decode("utf-8"))
-                
-                print(f"Données de suppression reçues: {data}")
-                
-                # Appeler la fonction de suppression
-                result = supprimer_enregistrement(
-                    table=data.get("table", ""),
-                    record_id=data.get("id", 0)
-                )
-                
-                if result['ok']:
-                    self._set_headers(200)
-                    response = {
-                        'success': True,
-                        'message': 'Enregistrement supprimé avec succès'
-                    }
-                else:
-                    self._set_headers(400)
-                    response = {
-                        'success': False,
-                        'error': result['error']
-                    }
-                
-                self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-                
-            except Exception as e:
-                self._set_headers(500)
-                response = {
-                    'success': False,
-                    'error': f'Erreur serveur: {str(e)}'
-                }
-                self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-        elif self.path == "/api/lister_dece":
-            try:
-                # Lire le corps de la requête
-                content_length = int(self.headers["Content-Length"])
-                post_data = self.rfile.read(content_length)
-                data = json.loads(post_data.decode("utf-8"))
-                
-                print(f"Données de listing reçues: {data}")
-                
-                # Appeler la fonction de listing
-                result = lister_dece_par_periode(
-                    date_debut=data.get("dateDebut", ""),
-                    date_fin=data.get("dateFin", "")
-                )
-                
-                if result['ok']:
-                    self._set_headers(200)
-                    response = {
-                        'success': True,
-                        'data': result['data'],
-                        'total': result['total'],
-                        'returned': result['returned']
-                    }
-                else:
-                    self._set_headers(400)
-                    response = {
-                        'success': False,
-                        'error': result['error']
-                    }
-                
-                self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-                
-            except Exception as e:
-                self._set_headers(500)
-                response = {
-                    'success': False,
-                    'error': f'Erreur serveur: {str(e)}'
-                }
-                self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-        elif self.path == "/api/supprimer_dece":
-            try:
-                # Lire le corps de la requête
-                content_length = int(self.headers["Content-Length"])
-                post_data = self.rfile.read(content_length)
-                data = json.loads(post_data.decode("utf-8"))
-                
-                print(f"Données de suppression de décès reçues: {data}")
-                
-                # Appeler la fonction de suppression spécifique
-                result = supprimer_dece(
-                    record_id=data.get("id", 0)
-                )
-                
-                if result['ok']:
-                    self._set_headers(200)
-                    response = {
-                        'success': True,
-                        'message': 'Certificat de décès supprimé avec succès'
-                    }
-                else:
-                    self._set_headers(400)
-                    response = {
-                        'success': False,
-                        'error': result['error']
-                    }
-                
-                self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-                
-            except Exception as e:
-                self._set_headers(500)
-                response = {
-                    'success': False,
-                    'error': f'Erreur serveur: {str(e)}'
-                }
-                self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-        else:
-            self._set_headers(404)
-            response = {'error': 'Endpoint non trouvé'}
-            self.wfile.write(json.dumps(response).encode())
-    
-    def log_message(self, format, *args):
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] {format % args}")
 
-def ajouter_arret_travail(nom, prenom, medecin, nombre_jours, date_certificat, date_naissance=None, age=None):
-    """Ajouter un nouveau arrêt de travail"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    try:
-        # Vérifier si un arrêt de travail IDENTIQUE existe déjà (tous les champs identiques)
-        cursor.execute('''
-            SELECT COUNT(*) FROM arrets_travail 
-            WHERE nom = ? AND prenom = ? AND medecin = ? 
-            AND nombre_jours = ? AND date_certificat = ? 
-            AND COALESCE(date_naissance, '') = COALESCE(?, '')
-        ''', (nom, prenom, medecin, nombre_jours, date_certificat, date_naissance))
-        
-        count = cursor.fetchone()[0]
-        
-        if count > 0:
-            return False, "Un arrêt de travail identique existe déjà (tous les champs sont identiques)"
-        
-        # Ajouter le nouvel arrêt de travail
-        cursor.execute('''
-            INSERT INTO arrets_travail 
-            (nom, prenom, medecin, nombre_jours, date_certificat, date_naissance, age)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (nom, prenom, medecin, nombre_jours, date_certificat, date_naissance, age))
-        
-        conn.commit()
-        print(f"Arret de travail ajoute: {nom} {prenom} - {nombre_jours} jours")
-        return True, "Arrêt de travail ajouté avec succès"
-    except Exception as e:
-        print(f"Erreur lors de l'ajout: {e}")
-        return False, f"Erreur: {str(e)}"
-    finally:
-        conn.close()
+# Champs d'un certificat de décès acceptés à l'ajout et à la modification
+CHAMPS_DECE = [
+    'nom', 'prenom', 'dateNaissance', 'datePresume', 'wilaya_naissance', 'sexe',
+    'pere', 'mere', 'communeNaissance', 'wilayaResidence', 'place', 'placefr',
+    'DSG', 'DECEMAT', 'DGRO', 'DACC', 'DAVO', 'AGESTATION', 'IDETER', 'GM',
+    'MN', 'AGEGEST', 'POIDNSC', 'AGEMERE', 'DPNAT', 'EMDPNAT', 'communeResidence',
+    'dateDeces', 'heureDeces', 'lieuDeces', 'autresLieuDeces', 'communeDeces',
+    'wilayaDeces', 'causeDeces', 'causeDirecte', 'etatMorbide', 'natureMort',
+    'natureMortAutre', 'obstacleMedicoLegal', 'contamination', 'prothese',
+    'POSTOPP2', 'CIM1', 'CIM2', 'CIM3', 'CIM4', 'CIM5', 'nom_ar', 'prenom_ar',
+    'perear', 'merear', 'lieu_naissance', 'conjoint', 'profession', 'adresse',
+    'date_entree', 'heure_entree', 'date_deces', 'heure_deces', 'wilaya_deces',
+    'medecin', 'code_p', 'code_c', 'code_n'
+]
 
-def ajouter_prolongation(nom, prenom, medecin, nombre_jours, date_certificat, date_naissance=None, age=None):
-    """Ajouter une nouvelle prolongation d'arrêt de travail"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    try:
-        # Vérifier si une prolongation IDENTIQUE existe déjà (tous les champs identiques)
-        cursor.execute('''
-            SELECT COUNT(*) FROM prolongation 
-            WHERE nom = ? AND prenom = ? AND medecin = ? 
-            AND nombre_jours = ? AND date_certificat = ? 
-            AND COALESCE(date_naissance, '') = COALESCE(?, '')
-        ''', (nom, prenom, medecin, nombre_jours, date_certificat, date_naissance))
-        
-        count = cursor.fetchone()[0]
-        
-        if count > 0:
-            return False, "Une prolongation identique existe déjà (tous les champs sont identiques)"
-        
-        # Ajouter la nouvelle prolongation
-        cursor.execute('''
-            INSERT INTO prolongation 
-            (nom, prenom, medecin, nombre_jours, date_certificat, date_naissance, age)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (nom, prenom, medecin, nombre_jours, date_certificat, date_naissance, age))
-        
-        conn.commit()
-        print(f"Prolongation ajoutee: {nom} {prenom} - {nombre_jours} jours")
-        return True, "Prolongation d'arrêt de travail ajoutée avec succès"
-    except Exception as e:
-        print(f"Erreur lors de l'ajout de la prolongation: {e}")
-        return False, f"Erreur: {str(e)}"
-    finally:
-        conn.close()
 
-def ajouter_cbv(nom, prenom, medecin, date_certificat, heure=None, date_naissance=None, titre=None, examen=None):
-    """Ajouter un nouveau certificat CBV"""
-    conn = sqlite3.connect(DB_PATH)
+@dataclass(frozen=True)
+class TypeCertificat:
+    """Description d'une table de certificats : ajouter un type = ajouter une entrée au registre"""
+    table: str
+    champs: dict  # Champ inséré -> valeur par défaut à l'ajout
+    champ_date: str  # Lectures par période, statistiques, index
+    champ_naissance: str  # Clé d'identité patient
+    detail_historique: str  # Colonne résumant le certificat dans l'historique patient
+    route_ajout: str
+    message_ajout: str
+    message_doublon: str = None
+    cle_doublon: tuple = None  # Champs de l'empreinte ; None : pas de dédoublonnage
+    obligatoires: tuple = ()  # Colonnes NOT NULL du schéma
+    alias: dict = field(default_factory=dict)  # Clé du frontend -> colonne
+    insertion_partielle: bool = False  # Seuls les champs fournis sont écrits
+    lecture_created_at: str = "strftime('%Y-%m-%d %H:%M:%S', created_at) as created_at"
+    prefixe_erreur: str = 'Erreur'
+    # L'endpoint d'ajout répond toujours 200 avec success et message (contrat historique)
+    ajout_toujours_200: bool = False
+
+
+REGISTRE_CERTIFICATS = {type_certificat.table: type_certificat for type_certificat in (
+    TypeCertificat(
+        table='arrets_travail',
+        champs={'nom': '', 'prenom': '', 'medecin': '', 'nombre_jours': 1,
+                'date_certificat': '', 'date_naissance': None, 'age': None},
+        champ_date='date_certificat',
+        champ_naissance='date_naissance',
+        detail_historique='nombre_jours',
+        route_ajout='/api/ajouter_arret_travail',
+        message_ajout="Arrêt de travail ajouté avec succès",
+        message_doublon="Un arrêt de travail identique existe déjà (tous les champs sont identiques)",
+        cle_doublon=('nom', 'prenom', 'medecin', 'nombre_jours', 'date_certificat', 'date_naissance'),
+        obligatoires=('nom', 'prenom', 'medecin', 'nombre_jours', 'date_certificat'),
+    ),
+    TypeCertificat(
+        table='prolongation',
+        champs={'nom': '', 'prenom': '', 'medecin': '', 'nombre_jours': 1,
+                'date_certificat': '', 'date_naissance': None, 'age': None},
+        champ_date='date_certificat',
+        champ_naissance='date_naissance',
+        detail_historique='nombre_jours',
+        route_ajout='/api/ajouter_prolongation',
+        message_ajout="Prolongation d'arrêt de travail ajoutée avec succès",
+        message_doublon="Une prolongation identique existe déjà (tous les champs sont identiques)",
+        cle_doublon=('nom', 'prenom', 'medecin', 'nombre_jours', 'date_certificat', 'date_naissance'),
+        obligatoires=('nom', 'prenom', 'medecin', 'nombre_jours', 'date_certificat'),
+    ),
+    TypeCertificat(
+        table='cbv',
+        champs={'nom': '', 'prenom': '', 'medecin': '', 'date_certificat': '',
+                'heure': None, 'date_naissance': None, 'titre': None, 'examen': None},
+        champ_date='date_certificat',
+        champ_naissance='date_naissance',
+        detail_historique='examen',
+        route_ajout='/api/ajouter_cbv',
+        message_ajout="CBV santé ajouté avec succès",
+        message_doublon="Un certificat CBV identique existe déjà (tous les champs sont identiques)",
+        cle_doublon=('nom', 'prenom', 'medecin', 'date_certificat', 'heure', 'date_naissance', 'titre', 'examen'),
+        obligatoires=('nom', 'prenom', 'medecin', 'date_certificat'),
+        ajout_toujours_200=True,
+    ),
+    TypeCertificat(
+        table='antirabique',
+        champs={'nom': '', 'prenom': '', 'medecin': '', 'classe': '', 'type_de_vaccin': '',
+                'shema': '', 'date_de_certificat': '', 'date_de_naissance': None, 'animal': ''},
+        champ_date='date_de_certificat',
+        champ_naissance='date_de_naissance',
+        detail_historique='type_de_vaccin',
+        route_ajout='/api/ajouter_antirabique',
+        message_ajout="Certificat antirabique ajouté avec succès",
+        message_doublon="Un certificat antirabique identique existe déjà (tous les champs sont identiques)",
+        cle_doublon=('nom', 'prenom', 'medecin', 'classe', 'type_de_vaccin', 'shema',
+                     'date_de_certificat', 'date_de_naissance', 'animal'),
+        ajout_toujours_200=True,
+    ),
+    TypeCertificat(
+        table='dece',
+        champs=dict.fromkeys(CHAMPS_DECE),
+        champ_date='date_deces',
+        champ_naissance='dateNaissance',
+        detail_historique='causeDeces',
+        route_ajout='/api/ajouter_dece',
+        message_ajout="Certificat de décès ajouté avec succès",
+        alias={'dateDeces': 'date_deces', 'heureDeces': 'heure_deces'},
+        insertion_partielle=True,
+        lecture_created_at='created_at',
+        prefixe_erreur='Erreur de base de données',
+    ),
+)}
+
+# Vues du registre utilisées par les lectures, migrations et index
+CHAMPS_DATE = {table: t.champ_date for table, t in REGISTRE_CERTIFICATS.items()}
+CHAMPS_NAISSANCE = {table: t.champ_naissance for table, t in REGISTRE_CERTIFICATS.items()}
+CLES_DOUBLON = {table: t.cle_doublon for table, t in REGISTRE_CERTIFICATS.items() if t.cle_doublon}
+# Colonnes INTEGER des clés de doublon : l'empreinte suit la valeur stockée
+COLONNES_ENTIERES = frozenset(('nombre_jours',))
+_NOMBRE_SQL = re.compile(r'[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?')
+
+
+def _valeur_entiere(valeur):
+    """Valeur telle que SQLite la stocke dans une colonne INTEGER
+
+    Un texte numérique (« 03 », « 3.0 », « 3 ») devient le nombre 3 ;
+    tout autre texte est stocké tel quel.
+    """
+    if not isinstance(valeur, str) or not _NOMBRE_SQL.fullmatch(valeur.strip()):
+        return valeur
+    texte = valeur.strip()
+    if texte.lstrip('+-').isdigit() and -2**63 <= int(texte) < 2**63:
+        return int(texte)
+    nombre = float(texte)
+    return int(nombre) if nombre.is_integer() and -2**63 <= nombre < 2**63 else nombre
+
+
+def calculer_empreinte(table, valeurs):
+    """Empreinte normalisée des champs de doublon d'un certificat, sur les valeurs stockées"""
+    parties = []
+    for colonne in CLES_DOUBLON[table]:
+        valeur = valeurs.get(colonne)
+        if colonne in COLONNES_ENTIERES:
+            valeur = _valeur_entiere(valeur)
+        if valeur is None:
+            # Même règle que l'ancien COALESCE(champ, '')
+            valeur = ''
+        elif isinstance(valeur, float) and valeur.is_integer():
+            # 3.0 et 3 sont stockés à l'identique dans une colonne INTEGER
+            valeur = int(valeur)
+        parties.append(str(valeur))
+    return hashlib.sha1('\x1f'.join(parties).encode('utf-8')).hexdigest()
+
+
+def est_doublon(erreur):
+    """Vrai si l'IntegrityError provient de l'index unique sur l'empreinte"""
+    return 'empreinte' in str(erreur)
+
+
+DOUBLONS_SIGNALES_MAX = 100  # Lignes détaillées par table dans le rapport de maintenance
+
+
+def doublons_sans_empreinte():
+    """Doublons présents avant le dédoublonnage par empreinte, par table
+
+    Les migrations ne donnent l'empreinte qu'à une occurrence ; les autres
+    restent à NULL, invisibles à l'index unique, jusqu'à ce qu'un opérateur
+    les supprime. -> {table: {'lignes', 'doublons': [{'id', 'doublon_de'}]}}
+    """
+    conn = get_connection()
+    rapport = {}
+    for table, colonnes in CLES_DOUBLON.items():
+        lignes = conn.execute(f'SELECT COUNT(*) FROM {table} WHERE empreinte IS NULL').fetchone()[0]
+        if not lignes:
+            continue
+        doublons = []
+        for row in conn.execute(f'SELECT id, {", ".join(colonnes)} FROM {table} '
+                                f'WHERE empreinte IS NULL ORDER BY id LIMIT {DOUBLONS_SIGNALES_MAX}').fetchall():
+            conserve = conn.execute(f'SELECT id FROM {table} WHERE empreinte = ?',
+                                    (calculer_empreinte(table, dict(zip(colonnes, row[1:]))),)).fetchone()
+            doublons.append({'id': row[0], 'doublon_de': conserve[0] if conserve else None})
+        rapport[table] = {'lignes': lignes, 'doublons': doublons}
+    return rapport
+
+
+def _signaler_doublons(cursor, table):
+    cursor.execute(f'SELECT COUNT(*) FROM {table} WHERE empreinte IS NULL')
+    lignes = cursor.fetchone()[0]
+    if lignes:
+        journal.warning("Table %s : %s doublons existants sans empreinte (voir /api/maintenance)",
+                        table, lignes)
+
+
+# Formats de date de naissance reconnus, ramenés à AAAA-MM-JJ
+FORMATS_DATE_NAISSANCE = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d', '%d.%m.%Y')
+
+
+def _normaliser_nom(valeur):
+    """Minuscules, sans accents ni ponctuation, espaces réduits"""
+    texte = unicodedata.normalize('NFKD', str(valeur or ''))
+    texte = ''.join(c for c in texte if not unicodedata.combining(c)).casefold()
+    return ' '.join(re.findall(r'\w+', texte))
+
+
+def _normaliser_date_naissance(valeur):
+    texte = str(valeur or '').strip()
+    for format_date in FORMATS_DATE_NAISSANCE:
+        try:
+            return datetime.strptime(texte, format_date).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return texte
+
+
+def calculer_cle_patient(nom, prenom, date_naissance):
+    """Clé d'identité patient : nom|prénom|date de naissance normalisés (None sans nom)"""
+    nom = _normaliser_nom(nom)
+    prenom = _normaliser_nom(prenom)
+    if not nom and not prenom:
+        return None
+    return f'{nom}|{prenom}|{_normaliser_date_naissance(date_naissance)}'
+
+
+def _migration_index_dates(cursor):
+    """Index sur les dates de certificat, created_at et les clés de doublons"""
+    # (date DESC, nom, prenom) suit exactement le ORDER BY des lectures par
+    # période et couvre aussi la recherche de doublons (égalité sur les trois)
+    for table, date_field in (('arrets_travail', 'date_certificat'),
+                              ('prolongation', 'date_certificat'),
+                              ('cbv', 'date_certificat'),
+                              ('antirabique', 'date_de_certificat'),
+                              ('dece', 'date_deces')):
+        cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_{table}_date
+            ON {table} ({date_field} DESC, nom, prenom)
+        ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_dece_created_at ON dece (created_at)')
+
+
+def _migration_empreintes(cursor):
+    """Colonne empreinte + index unique : dédoublonnage atomique à l'insertion"""
+    for table, colonnes in CLES_DOUBLON.items():
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN empreinte TEXT')
+
+        # Calculer l'empreinte des lignes existantes ; si des doublons existent
+        # déjà, seule la première occurrence la reçoit (NULL n'est pas unique) ;
+        # les autres sont signalées par doublons_sans_empreinte
+        vues = set()
+        mises_a_jour = []
+        cursor.execute(f'SELECT id, {", ".join(colonnes)} FROM {table} ORDER BY id')
+        for row in cursor.fetchall():
+            empreinte = calculer_empreinte(table, dict(zip(colonnes, row[1:])))
+            if empreinte not in vues:
+                vues.add(empreinte)
+                mises_a_jour.append((empreinte, row[0]))
+        cursor.executemany(f'UPDATE {table} SET empreinte = ? WHERE id = ?', mises_a_jour)
+        _signaler_doublons(cursor, table)
+
+        cursor.execute(f'CREATE UNIQUE INDEX idx_{table}_empreinte ON {table} (empreinte)')
+
+
+def _ajouter_colonne_si_absente(cursor, table, colonne, definition):
+    """ALTER TABLE ADD COLUMN, sauf si la colonne existe déjà"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    if colonne not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {colonne} {definition}')
+        journal.info("Colonne %s ajoutée à la table %s", colonne, table)
+
+
+def _migration_heure_creation(cursor):
+    """Colonne heure_creation d'antirabique, autrefois ajoutée à chaque insertion"""
+    # Les bases déjà passées par l'ancien ajouter_antirabique l'ont déjà
+    _ajouter_colonne_si_absente(cursor, 'antirabique', 'heure_creation', 'TEXT')
+
+
+def _sql_cumul_ajout(table, ligne):
+    """Ajout d'une ligne (NEW ou OLD) au cumul journalier, en SQL de trigger"""
+    jours = f'COALESCE({ligne}.nombre_jours, 0)' if table in MESURES_STATISTIQUES else '0'
+    return f'''
+        INSERT INTO stats_journalieres (table_source, jour, medecin, nombre, total_jours)
+        VALUES ('{table}', COALESCE({ligne}.{CHAMPS_DATE[table]}, ''), COALESCE({ligne}.medecin, ''), 1, {jours})
+        ON CONFLICT (table_source, jour, medecin)
+        DO UPDATE SET nombre = nombre + 1, total_jours = total_jours + excluded.total_jours;
+    '''
+
+
+def _sql_cumul_retrait(table, ligne):
+    """Retrait d'une ligne du cumul journalier (les cumuls vides sont supprimés)"""
+    jours = f'COALESCE({ligne}.nombre_jours, 0)' if table in MESURES_STATISTIQUES else '0'
+    cle = f'''table_source = '{table}'
+            AND jour = COALESCE({ligne}.{CHAMPS_DATE[table]}, '')
+            AND medecin = COALESCE({ligne}.medecin, '')'''
+    return f'''
+        UPDATE stats_journalieres SET nombre = nombre - 1, total_jours = total_jours - {jours}
+        WHERE {cle};
+        DELETE FROM stats_journalieres WHERE {cle} AND nombre <= 0;
+    '''
+
+
+def _migration_stats_journalieres(cursor):
+    """Cumuls par jour et par médecin, tenus à jour par triggers"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS stats_journalieres (
+        table_source TEXT NOT NULL,
+        jour TEXT NOT NULL,
+        medecin TEXT NOT NULL,
+        nombre INTEGER NOT NULL DEFAULT 0,
+        total_jours INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (table_source, jour, medecin)
+    ) WITHOUT ROWID''')
+
+    for table, date_field in CHAMPS_DATE.items():
+        colonnes = f'{date_field}, medecin' + (', nombre_jours' if table in MESURES_STATISTIQUES else '')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_stats_insert AFTER INSERT ON {table}
+        BEGIN {_sql_cumul_ajout(table, 'NEW')} END''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_stats_delete AFTER DELETE ON {table}
+        BEGIN {_sql_cumul_retrait(table, 'OLD')} END''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_stats_update AFTER UPDATE OF {colonnes} ON {table}
+        BEGIN {_sql_cumul_retrait(table, 'OLD')} {_sql_cumul_ajout(table, 'NEW')} END''')
+
+    _remplir_stats_journalieres(cursor)
+
+
+def _remplir_stats_journalieres(cursor, schema=None):
+    """Recalculer tous les cumuls journaliers à partir des tables
+
+    Avec schema (partition annuelle attachée), ajouter ses lignes aux cumuls
+    existants au lieu de repartir de zéro.
+    """
+    if schema is None:
+        cursor.execute('DELETE FROM stats_journalieres')
+    for table, date_field in CHAMPS_DATE.items():
+        if schema is not None and table not in TABLES_PARTITIONNEES:
+            continue
+        jours = 'SUM(COALESCE(nombre_jours, 0))' if table in MESURES_STATISTIQUES else '0'
+        # WHERE 1 : lève l'ambiguïté de syntaxe entre INSERT ... SELECT et ON CONFLICT
+        cursor.execute(f'''
+            INSERT INTO stats_journalieres (table_source, jour, medecin, nombre, total_jours)
+            SELECT '{table}', COALESCE({date_field}, ''), COALESCE(medecin, ''), COUNT(*), {jours}
+            FROM {schema or 'main'}.{table}
+            WHERE 1
+            GROUP BY COALESCE({date_field}, ''), COALESCE(medecin, '')
+            ON CONFLICT (table_source, jour, medecin)
+            DO UPDATE SET nombre = nombre + excluded.nombre, total_jours = total_jours + excluded.total_jours
+        ''')
+
+
+def reconstruire_stats_journalieres():
+    """Reconstruire les cumuls journaliers (après un import direct en base par exemple)
+
+    Les années archivées y sont ajoutées partition par partition.
+    """
+    conn = get_connection()
     cursor = conn.cursor()
-    
+    for annee in (None, *partitions.annees()):
+        schema = annee and partitions.attacher(conn, annee)
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            _remplir_stats_journalieres(cursor, schema)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    cursor.execute('SELECT COUNT(*) FROM stats_journalieres')
+    return cursor.fetchone()[0]
+
+
+# Index de recherche plein texte : code de chaque table dans le rowid FTS
+# (rowid = id * 8 + code) pour retrouver une entrée sans parcours
+CODES_RECHERCHE = {'arrets_travail': 1, 'prolongation': 2, 'cbv': 3, 'antirabique': 4, 'dece': 5}
+
+# Colonnes indexées dans « autres » (noms en arabe, filiation) pour dece
+AUTRES_CHAMPS_RECHERCHE = {'dece': ('nom_ar', 'prenom_ar', 'pere', 'mere', 'perear', 'merear')}
+
+
+def _sql_recherche_ajout(table, ligne):
+    autres = AUTRES_CHAMPS_RECHERCHE.get(table)
+    autres_sql = " || ' ' || ".join(f"COALESCE({ligne}.{champ}, '')" for champ in autres) if autres else "''"
+    return f'''
+        INSERT INTO recherche_patients
+            (rowid, nom, prenom, medecin, autres, table_source, record_id, date_evenement)
+        VALUES ({ligne}.id * 8 + {CODES_RECHERCHE[table]}, {ligne}.nom, {ligne}.prenom, {ligne}.medecin,
+                {autres_sql}, '{table}', {ligne}.id, {ligne}.{CHAMPS_DATE[table]});
+    '''
+
+
+def _sql_recherche_retrait(table, ligne):
+    return f'''
+        DELETE FROM recherche_patients WHERE rowid = {ligne}.id * 8 + {CODES_RECHERCHE[table]};
+    '''
+
+
+def _migration_recherche_patients(cursor):
+    """Index FTS5 (nom, prénom, médecin...) de toutes les tables, tenu à jour par triggers"""
     try:
-        # Vérifier si un certificat CBV IDENTIQUE existe déjà (tous les champs identiques)
         cursor.execute('''
-            SELECT COUNT(*) FROM cbv 
-            WHERE nom = ? AND prenom = ? AND medecin = ? 
-            AND date_certificat = ? 
-            AND COALESCE(heure, '') = COALESCE(?, '')
-            AND COALESCE(date_naissance, '') = COALESCE(?, '')
-            AND COALESCE(titre, '') = COALESCE(?, '')
-            AND COALESCE(examen, '') = COALESCE(?, '')
-        ''', (nom, prenom, medecin, date_certificat, heure, date_naissance, titre, examen))
-        
-        count = cursor.fetchone()[0]
-        
-        if count > 0:
-            return False, "Un certificat CBV identique existe déjà (tous les champs sont identiques)"
-        
-        # Ajouter le nouveau certificat CBV
-        cursor.execute('''
-            INSERT INTO cbv 
-            (nom, prenom, medecin, date_certificat, heure, date_naissance, titre, examen)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (nom, prenom, medecin, date_certificat, heure, date_naissance, titre, examen))
-        
-        conn.commit()
-        print(f"CBV ajouté: {nom} {prenom} - {titre}")
-        return True, "CBV santé ajouté avec succès"
-    except Exception as e:
-        return False, f"Erreur: {str(e)}"
-    finally:
-        conn.close()
+        CREATE VIRTUAL TABLE IF NOT EXISTS recherche_patients USING fts5(
+            nom, prenom, medecin, autres,
+            table_source UNINDEXED, record_id UNINDEXED, date_evenement UNINDEXED,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )''')
+    except sqlite3.OperationalError as e:
+        # SQLite compilé sans FTS5 : la recherche reste désactivée
+        journal.warning("FTS5 indisponible, recherche désactivée: %s", e)
+        return
 
+    for table, date_field in CHAMPS_DATE.items():
+        colonnes = ['nom', 'prenom', 'medecin', date_field] + list(AUTRES_CHAMPS_RECHERCHE.get(table, ()))
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_recherche_insert AFTER INSERT ON {table}
+        BEGIN {_sql_recherche_ajout(table, 'NEW')} END''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_recherche_delete AFTER DELETE ON {table}
+        BEGIN {_sql_recherche_retrait(table, 'OLD')} END''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_recherche_update AFTER UPDATE OF {', '.join(colonnes)} ON {table}
+        BEGIN {_sql_recherche_retrait(table, 'OLD')} {_sql_recherche_ajout(table, 'NEW')} END''')
 
-def ajouter_antirabique(nom, prenom, medecin, classe, type_de_vaccin, shema, date_de_certificat, date_de_naissance=None, animal=None):
-    """Ajouter un nouveau certificat antirabique"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+        # Indexer les lignes existantes
+        autres = AUTRES_CHAMPS_RECHERCHE.get(table)
+        autres_sql = " || ' ' || ".join(f"COALESCE({champ}, '')" for champ in autres) if autres else "''"
+        cursor.execute(f'''
+            INSERT INTO recherche_patients
+                (rowid, nom, prenom, medecin, autres, table_source, record_id, date_evenement)
+            SELECT id * 8 + {CODES_RECHERCHE[table]}, nom, prenom, medecin, {autres_sql},
+                   '{table}', id, {date_field}
+            FROM {table}
+        ''')
+
+
+def _migration_cle_patient(cursor):
+    """Colonne cle_patient indexée sur les cinq tables (historique patient)"""
+    for table, date_field in CHAMPS_DATE.items():
+        naissance = CHAMPS_NAISSANCE[table]
+        _ajouter_colonne_si_absente(cursor, table, 'cle_patient', 'TEXT')
+        cursor.execute(f'SELECT id, nom, prenom, {naissance} FROM {table}')
+        cursor.executemany(
+            f'UPDATE {table} SET cle_patient = ? WHERE id = ?',
+            [(calculer_cle_patient(row[1], row[2], row[3]), row[0]) for row in cursor.fetchall()]
+        )
+        cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_{table}_patient
+            ON {table} (cle_patient, {date_field})
+        ''')
+
+
+def _migration_modifications(cursor):
+    """Journal des modifications (numéro de séquence croissant) tenu par triggers"""
+    # AUTOINCREMENT : un numéro n'est jamais réutilisé, même après la purge
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS modifications (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_source TEXT NOT NULL,
+        record_id INTEGER NOT NULL,
+        operation TEXT NOT NULL CHECK (operation IN ('insert', 'update', 'delete')),
+        horodatage TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now'))
+    )''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_modifications_horodatage ON modifications (horodatage)')
+
+    for table in REGISTRE_CERTIFICATS:
+        for evenement, ligne in (('insert', 'NEW'), ('update', 'NEW'), ('delete', 'OLD')):
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_modification_{evenement} AFTER {evenement.upper()} ON {table}
+            BEGIN
+                INSERT INTO modifications (table_source, record_id, operation)
+                VALUES ('{table}', {ligne}.id, '{evenement}');
+            END''')
+        # Les lignes existantes sont journalisées comme ajouts : une synchronisation
+        # depuis 0 reçoit toute la base
+        cursor.execute(f'''
+            INSERT INTO modifications (table_source, record_id, operation)
+            SELECT '{table}', id, 'insert' FROM {table} ORDER BY id
+        ''')
+
+
+# Condition des triggers de suppression des tables partitionnées : une ligne
+# déplacée vers sa partition annuelle reste comptée dans les cumuls, trouvée
+# par la recherche et n'est pas une suppression pour les clients synchronisés
+GARDE_ARCHIVAGE = 'WHEN NOT EXISTS (SELECT 1 FROM archivage_en_cours)'
+
+
+def _migration_garde_archivage(cursor):
+    """Triggers de suppression des tables partitionnées désactivés pendant l'archivage"""
+    # Une ligne n'existe que le temps de la transaction d'archivage
+    cursor.execute('CREATE TABLE IF NOT EXISTS archivage_en_cours (annee INTEGER NOT NULL)')
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'recherche_patients'")
+    recherche = cursor.fetchone() is not None
+
+    for table in TABLES_PARTITIONNEES:
+        corps = {
+            'stats': _sql_cumul_retrait(table, 'OLD'),
+            'modification': f"""
+                INSERT INTO modifications (table_source, record_id, operation)
+                VALUES ('{table}', OLD.id, 'delete');""",
+        }
+        if recherche:
+            corps['recherche'] = _sql_recherche_retrait(table, 'OLD')
+        for nom, sql in corps.items():
+            cursor.execute(f'DROP TRIGGER IF EXISTS trg_{table}_{nom}_delete')
+            cursor.execute(f'''
+            CREATE TRIGGER trg_{table}_{nom}_delete AFTER DELETE ON {table} {GARDE_ARCHIVAGE}
+            BEGIN {sql} END''')
+
+
+def _migration_empreintes_stockees(cursor):
+    """Empreintes recalculées sur les valeurs stockées
+
+    Avant la conversion des colonnes INTEGER, un nombre_jours reçu en texte
+    (« 03 ») donnait une autre empreinte que le même nombre déjà en base.
+    Si l'empreinte corrigée est déjà prise, la ligne est un doublon : son
+    empreinte passe à NULL, comme à la migration 2.
+    """
+    for table, colonnes in CLES_DOUBLON.items():
+        cursor.execute(f'SELECT id, empreinte, {", ".join(colonnes)} FROM {table} '
+                       'WHERE empreinte IS NOT NULL ORDER BY id')
+        lignes = cursor.fetchall()
+        prises = {row[1] for row in lignes}
+        corrigees = []
+        for row in lignes:
+            empreinte = calculer_empreinte(table, dict(zip(colonnes, row[2:])))
+            if empreinte != row[1]:
+                corrigees.append((row[0], row[1], empreinte))
+        # Libérer d'abord les anciennes empreintes (index unique)
+        cursor.executemany(f'UPDATE {table} SET empreinte = NULL WHERE id = ?',
+                           [(record_id,) for record_id, _, _ in corrigees])
+        prises.difference_update(ancienne for _, ancienne, _ in corrigees)
+        mises_a_jour = []
+        for record_id, _, empreinte in corrigees:
+            if empreinte not in prises:
+                prises.add(empreinte)
+                mises_a_jour.append((empreinte, record_id))
+        cursor.executemany(f'UPDATE {table} SET empreinte = ? WHERE id = ?', mises_a_jour)
+        _signaler_doublons(cursor, table)
+
+
+# Migrations de schéma, appliquées dans l'ordre ; le numéro de la dernière
+# migration appliquée est stocké dans PRAGMA user_version
+MIGRATIONS = [
+    (1, "Index sur les dates et les clés de doublons", _migration_index_dates),
+    (2, "Empreintes de dédoublonnage", _migration_empreintes),
+    (3, "Colonne heure_creation de la table antirabique", _migration_heure_creation),
+    (4, "Cumuls journaliers par médecin", _migration_stats_journalieres),
+    (5, "Index de recherche plein texte des patients", _migration_recherche_patients),
+    (6, "Clé d'identité patient", _migration_cle_patient),
+    (7, "Journal des modifications (synchronisation)", _migration_modifications),
+    (8, "Garde d'archivage des partitions annuelles", _migration_garde_archivage),
+    (9, "Empreintes recalculées sur les valeurs stockées", _migration_empreintes_stockees),
+]
+
+
+def migrate_db():
+    """Appliquer les migrations de schéma qui ne l'ont pas encore été"""
+    conn = get_connection()
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+
+    for numero, description, migration in MIGRATIONS:
+        if numero <= version:
+            continue
+        journal.info("Migration %s: %s", numero, description)
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            migration(cursor)
+            cursor.execute(f'PRAGMA user_version = {numero}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+def choisir_encodage(accept_encoding):
+    """Encodage de compression préféré parmi ceux acceptés ('br', 'gzip' ou None)"""
+    acceptes = {}
+    for element in (accept_encoding or '').split(','):
+        nom, _, parametres = element.strip().partition(';')
+        qualite = 1.0
+        if parametres.strip().startswith('q='):
+            try:
+                qualite = float(parametres.strip()[2:])
+            except ValueError:
+                qualite = 0.0
+        acceptes[nom.strip().lower()] = qualite
+    candidats = (['br'] if brotli is not None else []) + ['gzip']
+    for encodage in candidats:
+        if acceptes.get(encodage, acceptes.get('*', 0)) > 0:
+            return encodage
+    return None
+
+
+def compresser(corps, encodage):
+    """Compresser un corps complet"""
+    if encodage == 'br':
+        return brotli.compress(corps, quality=COMPRESSION_NIVEAU_BROTLI)
+    return gzip.compress(corps, COMPRESSION_NIVEAU_GZIP)
+
+
+def compresser_flux(morceaux, encodage):
+    """Compresser un flux de morceaux ; chaque morceau est vidé aussitôt vers le client"""
+    if encodage == 'br':
+        compresseur = brotli.Compressor(quality=COMPRESSION_NIVEAU_BROTLI)
+        for morceau in morceaux:
+            if morceau:
+                yield compresseur.process(morceau) + compresseur.flush()
+        yield compresseur.finish()
+    else:
+        # wbits=31 : en-tête et somme de contrôle gzip
+        compresseur = zlib.compressobj(COMPRESSION_NIVEAU_GZIP, zlib.DEFLATED, 31)
+        for morceau in morceaux:
+            if morceau:
+                yield compresseur.compress(morceau) + compresseur.flush(zlib.Z_SYNC_FLUSH)
+        yield compresseur.flush()
+
+
+class ThreadPoolHTTPServer(socketserver.TCPServer):
+    """Serveur TCP qui traite les connexions dans un pool de threads borné
+
+    Un thread n'est occupé que pendant le traitement d'une requête : entre deux
+    requêtes, une connexion keep-alive attend dans un sélecteur (thread
+    « api-attente ») et revient dans le pool dès que le client envoie la suivante.
+    """
+    allow_reuse_address = True
+
+    def __init__(self, server_address, handler_class, workers=WORKERS, queue_size=ACCEPT_QUEUE):
+        # Taille du backlog d'écoute du noyau
+        self.request_queue_size = queue_size
+        super().__init__(server_address, handler_class)
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api-worker')
+        # Connexions en cours + en attente : au-delà, l'acceptation est suspendue
+        # et les clients patientent dans le backlog
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        # Connexions acceptées (en cours ou en attente) et connexions servies par un thread
+        self._lock_compteurs = threading.Lock()
+        self._acceptees = 0
+        self._actives = 0
+        # Connexions keep-alive inactives : socket -> (adresse, gestionnaire, échéance)
+        self._inactives = {}
+        self._a_garer = []
+        self._lock_inactives = threading.Lock()
+        self._selecteur = selectors.DefaultSelector()
+        self._reveil_lecture, self._reveil_ecriture = socket.socketpair()
+        self._reveil_lecture.setblocking(False)
+        self._selecteur.register(self._reveil_lecture, selectors.EVENT_READ)
+        self._arret_attente = False
+        self._thread_attente = threading.Thread(target=self._boucle_attente, name='api-attente', daemon=True)
+        self._thread_attente.start()
+        metriques.jauge('api_connexions', "Connexions acceptées, servies par un thread, en attente "
+                                          "d'un thread ou inactives (keep-alive)", self._profondeurs)
+
+    def _profondeurs(self):
+        with self._lock_compteurs:
+            return {(('etat', 'active'),): self._actives,
+                    (('etat', 'en_attente'),): self._acceptees - self._actives,
+                    (('etat', 'inactive'),): len(self._inactives)}
+
+    def _compter(self, acceptees=0, actives=0):
+        with self._lock_compteurs:
+            self._acceptees += acceptees
+            self._actives += actives
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        self._compter(acceptees=1)
+        try:
+            self._executor.submit(self._process_request_worker, request, client_address)
+        except RuntimeError:
+            # Pool arrêté pendant l'arrêt du serveur
+            self._compter(acceptees=-1)
+            self._slots.release()
+            self.shutdown_request(request)
+
+    def finish_request(self, request, client_address):
+        return self.RequestHandlerClass(request, client_address, self)
+
+    def _process_request_worker(self, request, client_address, gestionnaire=None):
+        self._compter(actives=1)
+        garder = False
+        try:
+            if gestionnaire is None:
+                gestionnaire = self.finish_request(request, client_address)
+            else:
+                gestionnaire.reprendre()
+            # Requêtes déjà reçues (pipeline) : traitées sans repasser par le sélecteur
+            while not gestionnaire.close_connection and gestionnaire.requete_en_tampon():
+                gestionnaire.reprendre()
+            garder = not gestionnaire.close_connection
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self._compter(acceptees=-1, actives=-1)
+            self._slots.release()
+            if garder:
+                self._garer(request, client_address, gestionnaire)
+            else:
+                self.shutdown_request(request)
+
+    def _garer(self, request, client_address, gestionnaire):
+        """Confier une connexion keep-alive inactive au thread d'attente, sans thread du pool"""
+        with self._lock_inactives:
+            if self._arret_attente:
+                self.shutdown_request(request)
+                return
+            self._a_garer.append((request, client_address, gestionnaire))
+        self._reveil_ecriture.send(b'\0')
+
+    def _boucle_attente(self):
+        while not self._arret_attente:
+            for cle, _ in self._selecteur.select(timeout=1.0):
+                if cle.fileobj is self._reveil_lecture:
+                    with contextlib.suppress(BlockingIOError):
+                        self._reveil_lecture.recv(4096)
+                    continue
+                self._selecteur.unregister(cle.fileobj)
+                with self._lock_inactives:
+                    client_address, gestionnaire, _ = self._inactives.pop(cle.fileobj)
+                self._relancer(cle.fileobj, client_address, gestionnaire)
+
+            with self._lock_inactives:
+                a_garer, self._a_garer = self._a_garer, []
+                echeance = time.monotonic() + KEEPALIVE_TIMEOUT
+                for request, client_address, gestionnaire in a_garer:
+                    self._inactives[request] = (client_address, gestionnaire, echeance)
+                    self._selecteur.register(request, selectors.EVENT_READ)
+                maintenant = time.monotonic()
+                expirees = [request for request, (_, _, fin) in self._inactives.items() if fin <= maintenant]
+                for request in expirees:
+                    del self._inactives[request]
+            for request in expirees:
+                self._selecteur.unregister(request)
+                self.shutdown_request(request)
+
+    def _relancer(self, request, client_address, gestionnaire):
+        """Remettre dans le pool une connexion inactive dont la requête suivante arrive"""
+        self._slots.acquire()
+        self._compter(acceptees=1)
+        try:
+            self._executor.submit(self._process_request_worker, request, client_address, gestionnaire)
+        except RuntimeError:
+            self._compter(acceptees=-1)
+            self._slots.release()
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        with self._lock_inactives:
+            self._arret_attente = True
+        self._reveil_ecriture.send(b'\0')
+        self._thread_attente.join()
+        with self._lock_inactives:
+            restantes = list(self._inactives) + [request for request, _, _ in self._a_garer]
+            self._inactives.clear()
+            self._a_garer = []
+        for request in restantes:
+            self.shutdown_request(request)
+        self._selecteur.close()
+        self._reveil_lecture.close()
+        self._reveil_ecriture.close()
+        self._executor.shutdown(wait=True)
+
+class APIHandler(http.server.BaseHTTPRequestHandler):
+    # HTTP/1.1 : connexions persistantes (keep-alive) pour l'extension
+    protocol_version = 'HTTP/1.1'
+    # Attente maximale d'une requête commencée ; une connexion inactive entre
+    # deux requêtes n'occupe pas de thread (ThreadPoolHTTPServer._garer)
+    timeout = KEEPALIVE_TIMEOUT
+    # En-têtes et corps partent en écritures séparées : sans TCP_NODELAY,
+    # Nagle et l'ACK retardé du client ajoutent ~40 ms à chaque réponse keep-alive
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        # Une requête par passage : ThreadPoolHTTPServer garde la connexion
+        # entre deux requêtes et rappelle reprendre()
+        self.close_connection = True
+        self.handle_one_request()
+
+    def finish(self):
+        if self.close_connection:
+            super().finish()
+        elif not self.wfile.closed:
+            self.wfile.flush()
+
+    def reprendre(self):
+        """Traiter la requête suivante d'une connexion keep-alive"""
+        try:
+            self.handle()
+        finally:
+            self.finish()
+
+    def requete_en_tampon(self):
+        """Vrai si des octets de la requête suivante sont déjà lus ou reçus"""
+        self.connection.settimeout(0)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def _set_headers(self, status_code=200, content_length=0, headers=None):
+        self.send_response(status_code)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(content_length))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, If-None-Match')
+        self.send_header('Access-Control-Expose-Headers', 'ETag')
+        self.end_headers()
+
+    def send_response(self, code, message=None):
+        self._statut = code
+        super().send_response(code, message)
+
+    def _send_json(self, response, status_code=200):
+        """Envoyer une réponse JSON avec Content-Length (requis pour le keep-alive)"""
+        with mesurer_phase('serialisation'):
+            body = json.dumps(response, ensure_ascii=False).encode('utf-8')
+        self._send_body(body, status_code)
+
+    def _send_body(self, body, status_code=200, headers=None):
+        """Envoyer un corps JSON, compressé si le client l'accepte et s'il est assez gros"""
+        headers = dict(headers or {}, Vary='Accept-Encoding')
+        encodage = self._encodage_accepte() if len(body) >= COMPRESSION_SEUIL_OCTETS else None
+        if encodage:
+            with mesurer_phase('compression'):
+                body = compresser(body, encodage)
+            headers['Content-Encoding'] = encodage
+        self._set_headers(status_code, len(body), headers)
+        self.wfile.write(body)
+
+    def _encodage_accepte(self):
+        return choisir_encodage(self.headers.get('Accept-Encoding'))
+
+    def _send_json_en_cache(self, data, tables, calculer):
+        """Réponse d'un endpoint de lecture, servie depuis le cache si possible.
+
+        calculer() renvoie (response, status) ; seules les réponses 200 sont
+        mises en cache. Un ETag connu du client donne un 304 sans corps.
+        """
+        # Une entrée par encodage : un succès de cache évite aussi la compression
+        encodage = self._encodage_accepte()
+        cle = (self.path, encodage, json.dumps(data, sort_keys=True, ensure_ascii=False))
+        en_cache = cache_reponses.lire(cle)
+        if en_cache is not None:
+            body, etag, encodage = en_cache
+            status_code = 200
+        else:
+            generations = cache_reponses.generations(tables)
+            response, status_code = calculer()
+            with mesurer_phase('serialisation'):
+                body = json.dumps(response, ensure_ascii=False).encode('utf-8')
+            if status_code != 200:
+                self._send_body(body, status_code)
+                return
+            etag = hashlib.sha1(body).hexdigest()
+            if encodage and len(body) >= COMPRESSION_SEUIL_OCTETS:
+                with mesurer_phase('compression'):
+                    body = compresser(body, encodage)
+                # Chaque représentation compressée a son propre ETag
+                etag = f'"{etag}-{encodage}"'
+            else:
+                encodage = None
+                etag = f'"{etag}"'
+            cache_reponses.stocker(cle, tables, generations, body, etag, encodage)
+
+        etags_client = [valeur.strip().removeprefix('W/')
+                        for valeur in self.headers.get('If-None-Match', '').split(',')]
+        if etag in etags_client or '*' in etags_client:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Access-Control-Expose-Headers', 'ETag')
+            self.end_headers()
+            return
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+        if encodage:
+            headers['Content-Encoding'] = encodage
+        self._set_headers(status_code, len(body), headers)
+        self.wfile.write(body)
     
-    try:
-        # Ajouter la colonne heure_creation si elle n'existe pas
-        cursor.execute("PRAGMA table_info(antirabique)")
-        columns = [column[1] for column in cursor.fetchall()]
-        
-        if 'heure_creation' not in columns:
-            cursor.execute("ALTER TABLE antirabique ADD COLUMN heure_creation TEXT")
-            print("Colonne heure_creation ajoutée à la table antirabique")
-        # Vérifier si un certificat antirabique existe déjà (sans tenir compte de l'heure)
-        cursor.execute('''
-            SELECT COUNT(*) FROM antirabique 
-            WHERE nom = ? AND prenom = ? AND medecin = ? 
-            AND classe = ? AND type_de_vaccin = ? AND shema = ?
-            AND date_de_certificat = ? 
-            AND COALESCE(date_de_naissance, '') = COALESCE(?, '')
-            AND COALESCE(animal, '') = COALESCE(?, '')
-        ''', (nom, prenom, medecin, classe, type_de_vaccin, shema, date_de_certificat, date_de_naissance, animal))
-        
-        count = cursor.fetchone()[0]
-        
-        if count > 0:
-            return False, "Un certificat antirabique identique existe déjà (tous les champs sont identiques)"
-        
-        # Ajouter le nouveau certificat antirabique
-        cursor.execute('''
-            INSERT INTO antirabique 
-            (nom, prenom, medecin, classe, type_de_vaccin, shema, date_de_certificat, date_de_naissance, animal)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (nom, prenom, medecin, classe, type_de_vaccin, shema, date_de_certificat, date_de_naissance, animal))
-        
-        conn.commit()
-        print(f"Certificat antirabique ajouté: {nom} {prenom} - {classe}")
-        return True, "Certificat antirabique ajouté avec succès"
-    except Exception as e:
-        return False, f"Erreur: {str(e)}"
-    finally:
-        conn.close()
+    def _send_chunked(self, chunks, content_type='application/json', headers=None):
+        """Envoyer une réponse en Transfer-Encoding: chunked à partir d'un itérable de bytes"""
+        # HTTP/1.0 ne connaît pas le chunked : corps brut puis fermeture
+        chunked = self.request_version != 'HTTP/1.0'
+        encodage = self._encodage_accepte() if content_type.startswith(TYPES_COMPRESSIBLES) else None
+        if encodage:
+            chunks = compresser_flux(chunks, encodage)
+        self.send_response(200)
+        self.send_header('Content-type', content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if encodage:
+            self.send_header('Content-Encoding', encodage)
+        self.send_header('Vary', 'Accept-Encoding')
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.close_connection = True
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, If-None-Match')
+        self.end_headers()
 
+        try:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                if chunked:
+                    self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                else:
+                    self.wfile.write(chunk)
+        except Exception as e:
+            # Les en-têtes sont partis : interrompre la réponse sans le
+            # morceau final pour que le client la voie incomplète
+            journal.warning("Erreur pendant l'envoi en flux sur %s: %s", self.path, e)
+            self.close_connection = True
+            return
+        if chunked:
+            self.wfile.write(b'0\r\n\r\n')
 
-def recuperer_donnees_entre_dates(table, date_debut, date_fin):
-    """Récupérer les données d'une table entre deux dates"""
-    print(f"Tentative de connexion à la base de données: {DB_PATH}")
+    def do_OPTIONS(self):
+        self._set_headers(200)
     
+    def do_GET(self):
+        self._mesurer(self._traiter_get)
+
+    def do_POST(self):
+        self._mesurer(self._traiter_post)
+
+    def _mesurer(self, traiter):
+        """Traiter la requête en relevant sa durée totale et celle de chaque phase"""
+        self._statut = None
+        mesure_requete.phases = {}
+        debut = time.perf_counter()
+        try:
+            traiter()
+        finally:
+            duree = time.perf_counter() - debut
+            phases, mesure_requete.phases = mesure_requete.phases, None
+            # Chemins inconnus regroupés : pas une série par URL arbitraire
+            routes = ROUTES_GET if self.command == 'GET' else ROUTES_POST
+            endpoint = self.path if self.path in routes else 'inconnu'
+            statut = self._statut or 0
+            metriques.incrementer('api_requetes_total', endpoint=endpoint, methode=self.command, statut=statut)
+            if statut >= 400:
+                metriques.incrementer('api_erreurs_total', endpoint=endpoint, methode=self.command)
+            metriques.observer('api_duree_requete_secondes', duree, endpoint=endpoint)
+            for phase, duree_phase in phases.items():
+                metriques.observer('api_duree_phase_secondes', duree_phase, endpoint=endpoint, phase=phase)
+
+    def _traiter_get(self):
+        route = ROUTES_GET.get(self.path)
+        if route is None:
+            status = 404
+            response = {'error': 'Endpoint non trouvé'}
+            self._send_json(response, status)
+            return
+        self._envoyer(route(), None)
+
+    def _traiter_post(self):
+        route = ROUTES_POST.get(self.path)
+        if route is None:
+            # Le corps n'a pas été lu : fermer la connexion pour ne pas corrompre la suivante
+            self.close_connection = True
+            status = 404
+            response = {'error': 'Endpoint non trouvé'}
+            self._send_json(response, status)
+            return
+
+        fonction, cle_erreur, journaliser = route
+        try:
+            # Lire le corps de la requête
+            with mesurer_phase('lecture'):
+                content_length = int(self.headers["Content-Length"])
+                post_data = self.rfile.read(content_length)
+                data = json.loads(post_data.decode("utf-8"))
+            
+            if journaliser and JOURNAL_CORPS:
+                journal.debug("Données reçues sur %s", self.path, extra={'champs': {'corps': data}})
+            
+            self._envoyer(fonction(data), data)
+            
+        except Exception as e:
+            status = 500
+            response = {
+                'success': False,
+                cle_erreur: f'Erreur serveur: {str(e)}'
+            }
+            self._send_json(response, status)
+
+    def _envoyer(self, resultat, data):
+        """Envoyer le résultat d'une fonction de route"""
+        if isinstance(resultat, ReponseFlux):
+            self._send_chunked(resultat.morceaux, resultat.content_type, resultat.headers)
+        elif isinstance(resultat, ReponseEnCache):
+            self._send_json_en_cache(data, resultat.tables, resultat.calculer)
+        else:
+            response, status = resultat
+            self._send_json(response, status)
+
+    def log_message(self, format, *args):
+        # Le message est formaté par le thread d'écriture
+        journal.info(format, *args, extra={'champs': {'client': self.client_address[0]}})
+
+    def log_error(self, format, *args):
+        journal.warning(format, *args, extra={'champs': {'client': self.client_address[0]}})
+
+@functools.lru_cache(maxsize=None)
+def _sql_insertion(table, colonnes):
+    """Requête INSERT d'une table pour un ensemble de colonnes
+
+    Le texte est construit une seule fois ; le cache de requêtes préparées de
+    chaque connexion (cached_statements) réutilise alors la même requête compilée.
+    """
+    return f'INSERT INTO {table} ({", ".join(colonnes)}) VALUES ({", ".join("?" for _ in colonnes)})'
+
+
+@functools.lru_cache(maxsize=None)
+def _sql_modification(table, colonnes):
+    """Requête UPDATE ... WHERE id = ? d'une table pour un ensemble de colonnes"""
+    return f'UPDATE {table} SET {", ".join(f"{colonne} = ?" for colonne in colonnes)} WHERE id = ?'
+
+
+def _appliquer_alias(type_certificat, data):
+    """Copier les clés du frontend (dateDeces...) vers leurs colonnes"""
+    if not type_certificat.alias:
+        return data
+    data = dict(data)
+    for cle, colonne in type_certificat.alias.items():
+        if cle in data:
+            data[colonne] = data[cle]
+    return data
+
+
+def preparer_insertion(table, data):
+    """Valeurs à insérer pour un certificat (colonnes calculées comprises), ou message d'erreur"""
+    type_certificat = REGISTRE_CERTIFICATS[table]
+    if not isinstance(data, dict):
+        return None, 'Enregistrement non valide (objet JSON attendu)'
+    data = _appliquer_alias(type_certificat, data)
+
+    if type_certificat.insertion_partielle:
+        valeurs = {champ: data[champ] for champ in type_certificat.champs if champ in data}
+        if not valeurs:
+            return None, 'Aucune donnée à insérer'
+    else:
+        valeurs = {champ: data.get(champ, defaut) for champ, defaut in type_certificat.champs.items()}
+        manquants = [champ for champ in type_certificat.obligatoires if valeurs[champ] is None]
+        if manquants:
+            return None, f'Champs obligatoires manquants: {manquants}'
+
+    if type_certificat.cle_doublon:
+        valeurs['empreinte'] = calculer_empreinte(table, valeurs)
+    valeurs['cle_patient'] = calculer_cle_patient(valeurs.get('nom'), valeurs.get('prenom'),
+                                                  valeurs.get(type_certificat.champ_naissance))
+    return valeurs, None
+
+
+def _empreintes_archivees(table, lignes_valeurs):
+    """Empreintes de lignes_valeurs déjà présentes dans la partition de leur année
+
+    L'index unique sur l'empreinte ne couvre que la base courante : un
+    certificat daté d'une année archivée est comparé à sa partition.
+    """
+    if table not in TABLES_PARTITIONNEES or not REGISTRE_CERTIFICATS[table].cle_doublon:
+        return set()
+    archivees = set(partitions.annees())
+    par_annee = {}
+    for valeurs in lignes_valeurs:
+        date = str(valeurs.get(CHAMPS_DATE[table]) or '')
+        if date[:4].isdigit() and int(date[:4]) in archivees:
+            par_annee.setdefault(int(date[:4]), []).append(valeurs['empreinte'])
+    trouvees = set()
+    conn = get_connection()
+    for annee, empreintes in par_annee.items():
+        schema = partitions.attacher(conn, annee)
+        for debut in range(0, len(empreintes), TAILLE_PAQUET_SQL):
+            paquet = empreintes[debut:debut + TAILLE_PAQUET_SQL]
+            trouvees.update(row[0] for row in conn.execute(f'''
+                SELECT empreinte FROM {schema}.{table}
+                WHERE empreinte IN ({', '.join('?' for _ in paquet)})
+            ''', paquet))
+    return trouvees
+
+
+def _introuvable(table, record_id):
+    """Erreur d'une modification ou suppression qui n'a touché aucune ligne
+
+    Les lectures renvoient aussi les années archivées : un id présent dans
+    une partition est signalé en lecture seule plutôt qu'introuvable.
+    """
+    if table in TABLES_PARTITIONNEES:
+        conn = get_connection()
+        for annee in reversed(partitions.annees()):
+            schema = partitions.attacher(conn, annee)
+            if conn.execute(f'SELECT 1 FROM {schema}.{table} WHERE id = ?', (record_id,)).fetchone():
+                return {'ok': False, 'error': f"Enregistrement de l'année archivée {annee} : lecture seule"}
+    return {'ok': False, 'error': 'Aucun enregistrement trouvé avec cet ID'}
+
+
+def ajouter_certificat(table, data):
+    """Ajouter un certificat à partir des champs reçus du frontend"""
+    type_certificat = REGISTRE_CERTIFICATS[table]
+    valeurs, erreur = preparer_insertion(table, data)
+    if erreur:
+        return False, erreur
+
+    def inserer(conn):
+        # Un certificat IDENTIQUE (tous les champs identiques) est rejeté
+        # par l'index unique sur l'empreinte
+        cursor = conn.cursor()
+        cursor.execute(_sql_insertion(table, tuple(valeurs)), tuple(valeurs.values()))
+        return cursor.lastrowid
+
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
+        if type_certificat.message_doublon and _empreintes_archivees(table, [valeurs]):
+            return False, type_certificat.message_doublon
+        record_id = ecrivain.executer(table, inserer)
+        journal.debug("Certificat %s ajouté", table, extra={'champs': {'id': record_id}})
+        return True, type_certificat.message_ajout
+    except sqlite3.IntegrityError as e:
+        if est_doublon(e) and type_certificat.message_doublon:
+            return False, type_certificat.message_doublon
+        journal.error("Erreur lors de l'ajout (%s): %s", table, e)
+        return False, f"{type_certificat.prefixe_erreur}: {str(e)}"
+    except Exception as e:
+        journal.error("Erreur lors de l'ajout (%s): %s", table, e)
+        return False, f"{type_certificat.prefixe_erreur}: {str(e)}"
+
+
+def modifier_certificat(table, data):
+    """Modifier un certificat existant (data contient l'id)
+
+    Pour un type à insertion partielle (dece), seuls les champs fournis sont
+    modifiés ; sinon tous les champs du type sont réécrits.
+    """
+    type_certificat = REGISTRE_CERTIFICATS[table]
+    record_id = data.get('id')
+    if not record_id:
+        return {'ok': False, 'error': 'ID de l\'enregistrement manquant'}
+    data = _appliquer_alias(type_certificat, data)
+
+    def modifier(conn):
         cursor = conn.cursor()
-        print("Connexion à la base de données réussie")
+        if type_certificat.insertion_partielle:
+            valeurs = {champ: data[champ] for champ in type_certificat.champs if champ in data}
+            if not valeurs:
+                return {'ok': False, 'error': 'Aucune donnée à modifier'}
+            # Recalculer la clé patient si l'identité change (champs absents : valeurs actuelles)
+            identite = ('nom', 'prenom', type_certificat.champ_naissance)
+            if any(champ in valeurs for champ in identite):
+                cursor.execute(f'SELECT {", ".join(identite)} FROM {table} WHERE id = ?', (record_id,))
+                actuel = cursor.fetchone()
+                if actuel is not None:
+                    fusion = {**dict(actuel), **{champ: valeurs[champ] for champ in identite if champ in valeurs}}
+                    valeurs['cle_patient'] = calculer_cle_patient(*(fusion[champ] for champ in identite))
+        else:
+            valeurs = {champ: data.get(champ) for champ in type_certificat.champs}
+            # L'empreinte suit les champs modifiés pour garder le dédoublonnage exact
+            if type_certificat.cle_doublon:
+                valeurs['empreinte'] = calculer_empreinte(table, valeurs)
+            valeurs['cle_patient'] = calculer_cle_patient(valeurs['nom'], valeurs['prenom'],
+                                                          valeurs[type_certificat.champ_naissance])
+
+        cursor.execute(_sql_modification(table, tuple(valeurs)), tuple(valeurs.values()) + (record_id,))
+
+        # Vérifier si la modification a réussi (None : voir _introuvable)
+        if cursor.rowcount == 0:
+            return None
+        return {'ok': True, 'message': 'Enregistrement modifié avec succès'}
+
+    try:
+        resultat = ecrivain.executer(table, modifier)
+        return _introuvable(table, record_id) if resultat is None else resultat
+    except sqlite3.IntegrityError as e:
+        if est_doublon(e):
+            return {'ok': False, 'error': 'Un enregistrement identique existe déjà (tous les champs sont identiques)'}
+        return {'ok': False, 'error': f'Erreur lors de la modification: {str(e)}'}
     except Exception as e:
-        print(f"Erreur de connexion à la base de données: {e}")
-        return {'ok': False, 'error': f'Erreur de connexion à la base de données: {str(e)}'}
-    
-    # Vérifier que la table est valide
-    tables_valides = ['arrets_travail', 'prolongation', 'cbv', 'antirabique', 'dece']
+        return {'ok': False, 'error': f'Erreur lors de la modification: {str(e)}'}
+
+
+def _verifier_table(table):
+    """Message d'erreur si la table n'est pas dans le registre, sinon None"""
+    if table not in REGISTRE_CERTIFICATS:
+        return f'Table non valide. Tables valides: {list(REGISTRE_CERTIFICATS)}'
+    return None
+
+
+# Champs lisibles par table (projection « fields » des lectures)
+CHAMPS_LECTURE = {table: ['id'] + list(t.champs) + ['created_at'] for table, t in REGISTRE_CERTIFICATS.items()}
+
+# Formats de réponse des lectures : objets (un dict par ligne) ou colonnes
+# (liste des colonnes puis une liste de valeurs par ligne)
+FORMATS_REPONSE = ('objects', 'columnar')
+
+
+def _colonne_lecture(table, champ):
+    """Expression SELECT d'un champ lu"""
+    type_certificat = REGISTRE_CERTIFICATS[table]
+    if champ in type_certificat.alias:
+        return f'{type_certificat.alias[champ]} AS {champ}'
+    if champ == 'created_at':
+        return type_certificat.lecture_created_at
+    return champ
+
+
+def _projection(table, champs=None):
+    """Colonnes SELECT d'une lecture, limitées à champs si fourni
+
+    Les colonnes de tri et de pagination (id, nom, prenom, date, created_at)
+    sont toujours incluses. ValueError si un champ est inconnu.
+    """
+    if champs is None:
+        champs = CHAMPS_LECTURE[table]
+    elif not isinstance(champs, list) or any(champ not in CHAMPS_LECTURE[table] for champ in champs):
+        raise ValueError(f'Champs non valides. Champs valides: {CHAMPS_LECTURE[table]}')
+    champs = dict.fromkeys(['id'] + champs + ['nom', 'prenom', CHAMPS_DATE[table], 'created_at'])
+    return ', '.join(_colonne_lecture(table, champ) for champ in champs)
+
+
+def _valider_format(format_reponse):
+    if format_reponse not in FORMATS_REPONSE:
+        raise ValueError(f'Format non valide. Formats valides: {list(FORMATS_REPONSE)}')
+
+
+def _mettre_en_forme(result, cursor, rows, format_reponse):
+    """Ajouter les lignes à result, en objets ou en colonnes"""
+    if format_reponse == 'columnar':
+        result['columns'] = [description[0] for description in cursor.description]
+        result['data'] = [list(row) for row in rows]
+    else:
+        result['data'] = [dict(row) for row in rows]
+    return result
+
+
+# Colonnes renvoyées par les lectures par période, par table
+COLONNES_LECTURE = {table: _projection(table) for table in CHAMPS_LECTURE}
+
+TAILLE_LOT_LECTURE = 500  # Lignes lues par fetchmany() en mode flux
+
+
+def _valider_periode(table, date_debut, date_fin):
+    """Vérifier la table et les dates d'une lecture par période (None si valide)"""
+    tables_valides = list(CHAMPS_DATE)
     if table not in tables_valides:
-        conn.close()
-        return {'ok': False, 'error': f'Table non valide. Tables valides: {tables_valides}'}
+        return f'Table non valide. Tables valides: {tables_valides}'
     
     try:
         # Valider les dates
         datetime.strptime(date_debut, '%Y-%m-%d')
         datetime.strptime(date_fin, '%Y-%m-%d')
-    except ValueError:
-        conn.close()
-        return {'ok': False, 'error': 'Format de date invalide. Utilisez AAAA-MM-JJ.'}
-    
+    except (TypeError, ValueError):
+        return 'Format de date invalide. Utilisez AAAA-MM-JJ.'
+    if len(partitions.annees_periode(table, date_debut, date_fin)) > PARTITIONS_ATTACHEES_MAX:
+        return f'Période trop longue : plus de {PARTITIONS_ATTACHEES_MAX} années archivées'
+    return None
+
+
+def _encoder_curseur(table, row):
+    """Jeton de pagination : position (date, nom, prenom, id) de la dernière ligne"""
+    position = [row[CHAMPS_DATE[table]], row['nom'], row['prenom'], row['id']]
+    return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+
+
+def _decoder_curseur(jeton, longueur=4):
+    """Position encodée par _encoder_curseur (ValueError si le jeton est invalide)"""
     try:
-        # Construire la requête selon la table
-        if table == 'antirabique':
-            date_field = 'date_de_certificat'
-        elif table == 'dece':
-            date_field = 'date_deces'
+        position = json.loads(base64.urlsafe_b64decode(jeton.encode('ascii')))
+    except Exception:
+        raise ValueError('Curseur de pagination invalide')
+    if not isinstance(position, list) or len(position) != longueur:
+        raise ValueError('Curseur de pagination invalide')
+    return position
+
+
+def _condition_apres(table, position):
+    """Condition SQL « strictement après position » dans l'ordre de lecture
+
+    L'ordre est date DESC, nom ASC, prenom ASC, id ASC ; en ASC, SQLite place
+    les NULL en premier.
+    """
+    date_field = CHAMPS_DATE[table]
+    date_valeur, nom, prenom, record_id = position
+
+    condition, params = 'id > ?', [record_id]
+    for colonne, valeur in (('prenom', prenom), ('nom', nom)):
+        if valeur is None:
+            condition = f'{colonne} IS NOT NULL OR ({colonne} IS NULL AND ({condition}))'
         else:
-            date_field = 'date_certificat'
-        
-        # Compter le nombre total de résultats
+            condition = f'{colonne} > ? OR ({colonne} = ? AND ({condition}))'
+            params = [valeur, valeur] + params
+    condition = f'{date_field} < ? OR ({date_field} = ? AND ({condition}))'
+    params = [date_valeur, date_valeur] + params
+    return f'({condition})', params
+
+
+def _executer_lecture_periode(cursor, table, date_debut, date_fin, position=None, limite=None, select_sql=None):
+    """Lancer la requête de lecture par période (suite d'un curseur éventuel)"""
+    date_field = CHAMPS_DATE[table]
+    conditions = [f'{date_field} BETWEEN ? AND ?']
+    params = [date_debut, date_fin]
+    if position is not None:
+        # Borne haute ramenée à la position : l'index reprend là où la page
+        # précédente s'est arrêtée au lieu de re-parcourir le début de la plage
+        params[1] = min(date_fin, position[0])
+        condition, params_position = _condition_apres(table, position)
+        conditions.append(condition)
+        params.extend(params_position)
+
+    ordre = f'{date_field} DESC, nom ASC, prenom ASC, id ASC'
+    source, params = _sql_sources(cursor.connection, table, ' AND '.join(conditions), params,
+                                  date_debut, date_fin, ordre, limite)
+    query = f'''
+        SELECT {select_sql or COLONNES_LECTURE[table]}
+        FROM {source}
+        ORDER BY {ordre}
+    '''
+    if limite is not None:
+        query += ' LIMIT ?'
+        params.append(limite)
+    cursor.execute(query, params)
+
+
+def _compter_periode(cursor, table, date_debut, date_fin):
+    """Nombre de lignes de la période, partitions comprises (un COUNT par base)"""
+    date_field = CHAMPS_DATE[table]
+    total = 0
+    for schema in partitions.schemas(cursor.connection, table, date_debut, date_fin):
         cursor.execute(f'''
             SELECT COUNT(*) as total 
-            FROM {table} 
+            FROM {schema}.{table} 
             WHERE {date_field} BETWEEN ? AND ?
         ''', (date_debut, date_fin))
-        total = cursor.fetchone()['total']
-        
-        # Récupérer les données
-        if table == 'arrets_travail' or table == 'prolongation':
-            cursor.execute(f'''
-                SELECT 
-                    id, nom, prenom, medecin, nombre_jours,
-                    {date_field}, date_naissance, age,
-                    strftime('%Y-%m-%d %H:%M:%S', created_at) as created_at
-                FROM {table} 
-                WHERE {date_field} BETWEEN ? AND ?
-                ORDER BY {date_field} DESC, nom ASC, prenom ASC
-            ''', (date_debut, date_fin))
-        elif table == 'cbv':
-            cursor.execute(f'''
-                SELECT 
-                    id, nom, prenom, medecin, {date_field}, heure, date_naissance, titre, examen,
-                    strftime('%Y-%m-%d %H:%M:%S', created_at) as created_at
-                FROM {table} 
-                WHERE {date_field} BETWEEN ? AND ?
-                ORDER BY {date_field} DESC, nom ASC, prenom ASC
-            ''', (date_debut, date_fin))
-        elif table == 'antirabique':
-            cursor.execute(f'''
-                SELECT 
-                    id, nom, prenom, medecin, classe, type_de_vaccin, shema, {date_field}, date_de_naissance, animal,
-                    strftime('%Y-%m-%d %H:%M:%S', created_at) as created_at
-                FROM {table} 
-                WHERE {date_field} BETWEEN ? AND ?
-                ORDER BY {date_field} DESC, nom ASC, prenom ASC
-            ''', (date_debut, date_fin))
-        elif table == 'dece':
-            cursor.execute(f'''
-                SELECT *
-                FROM {table} 
-                WHERE {date_field} BETWEEN ? AND ?
-                ORDER BY {date_field} DESC, nom ASC, prenom ASC
-            ''', (date_debut, date_fin))
-        
-        results = [dict(row) for row in cursor.fetchall()]
-        
-        if table == 'dece':
-            for cert in results:
-                if 'date_deces' in cert:
-                    cert['dateDeces'] = cert['date_deces']
-                if 'heure_deces' in cert:
-                    cert['heureDeces'] = cert['heure_deces']
-        conn.close()
-        
-        return {
-            'ok': True,
-            'data': results,
-            'total': total,
-            'returned': len(results)
-        }
-    except Exception as e:
-        conn.close()
-        return {'ok': False, 'error': f'Erreur lors de la récupération des données: {str(e)}'}
+        total += cursor.fetchone()['total']
+    return total
 
-def modifier_enregistrement(table, update_data):
-    """Modifier un enregistrement dans une table"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+
+def recuperer_donnees_entre_dates(table, date_debut, date_fin, limit=None, cursor_token=None,
+                                  champs=None, format_reponse='objects'):
+    """Récupérer les données d'une table entre deux dates
+
+    Sans limit, toute la période est renvoyée. Avec limit, une page est
+    renvoyée avec next_cursor à repasser en cursor_token pour la suivante.
+    champs restreint les colonnes lues, format_reponse choisit l'encodage
+    des lignes (voir FORMATS_REPONSE).
+    """
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+    except Exception as e:
+        journal.error("Erreur de connexion à la base de données %s: %s", DB_PATH, e)
+        return {'ok': False, 'error': f'Erreur de connexion à la base de données: {str(e)}'}
+    
+    erreur = _valider_periode(table, date_debut, date_fin)
+    if erreur:
+        return {'ok': False, 'error': erreur}
     
     try:
-        # Vérifier que la table est valide
-        tables_valides = ['arrets_travail', 'prolongation', 'cbv', 'antirabique']
-        if table not in tables_valides:
-            conn.close()
-            return {'ok': False, 'error': f'Table non valide. Tables valides: {tables_valides}'}
-        
-        record_id = update_data.get('id')
-        if not record_id:
-            conn.close()
-            return {'ok': False, 'error': 'ID de l\'enregistrement manquant'}
-        
-        # Construire la requête de modification selon la table
-        if table == 'arrets_travail' or table == 'prolongation':
-            cursor.execute('''
-                UPDATE arrets_travail 
-                SET nom = ?, prenom = ?, medecin = ?, nombre_jours = ?, 
-                    date_certificat = ?, date_naissance = ?, age = ?
-                WHERE id = ?
-            ''' if table == 'arrets_travail' else '''
-                UPDATE prolongation 
-                SET nom = ?, prenom = ?, medecin = ?, nombre_jours = ?, 
-                    date_certificat = ?, date_naissance = ?, age = ?
-                WHERE id = ?
-            ''', (
-                update_data.get('nom'),
-                update_data.get('prenom'),
-                update_data.get('medecin'),
-                update_data.get('nombre_jours'),
-                update_data.get('date_certificat'),
-                update_data.get('date_naissance'),
-                update_data.get('age'),
-                record_id
-            ))
-            
-        elif table == 'cbv':
-            cursor.execute('''
-                UPDATE cbv 
-                SET nom = ?, prenom = ?, medecin = ?, date_certificat = ?, 
-                    heure = ?, date_naissance = ?, titre = ?, examen = ?
-                WHERE id = ?
-            ''', (
-                update_data.get('nom'),
-                update_data.get('prenom'),
-                update_data.get('medecin'),
-                update_data.get('date_certificat'),
-                update_data.get('heure'),
-                update_data.get('date_naissance'),
-                update_data.get('titre'),
-                update_data.get('examen'),
-                record_id
-            ))
-            
-        elif table == 'antirabique':
-            cursor.execute('''
-                UPDATE antirabique 
-                SET nom = ?, prenom = ?, medecin = ?, classe = ?, 
-                    type_de_vaccin = ?, shema = ?, date_de_certificat = ?, 
-                    date_de_naissance = ?, animal = ?
-                WHERE id = ?
-            ''', (
-                update_data.get('nom'),
-                update_data.get('prenom'),
-                update_data.get('medecin'),
-                update_data.get('classe'),
-                update_data.get('type_de_vaccin'),
-                update_data.get('shema'),
-                update_data.get('date_de_certificat'),
-                update_data.get('date_de_naissance'),
-                update_data.get('animal'),
-                record_id
-            ))
+        position = _decoder_curseur(cursor_token) if cursor_token else None
+        colonnes = _projection(table, champs)
+        _valider_format(format_reponse)
+        if limit is not None:
+            limit = int(limit)
+            if limit <= 0:
+                raise ValueError('limit doit être un entier positif')
+    except (TypeError, ValueError) as e:
+        return {'ok': False, 'error': str(e)}
+    
+    try:
+        # Compter le nombre total de résultats (sur toute la période)
+        total = _compter_periode(cursor, table, date_debut, date_fin)
         
-        # Vérifier si la modification a réussi
-        if cursor.rowcount == 0:
-            conn.close()
-            return {'ok': False, 'error': 'Aucun enregistrement trouvé avec cet ID'}
+        # Récupérer les données (une ligne de plus pour savoir s'il reste une page)
+        _executer_lecture_periode(cursor, table, date_debut, date_fin, position,
+                                  None if limit is None else limit + 1, colonnes)
+        rows = cursor.fetchall()
         
-        conn.commit()
-        conn.close()
-        
-        return {'ok': True, 'message': 'Enregistrement modifié avec succès'}
+        has_more = limit is not None and len(rows) > limit
+        if has_more:
+            rows = rows[:limit]
         
+        result = _mettre_en_forme({'ok': True}, cursor, rows, format_reponse)
+        result['total'] = total
+        result['returned'] = len(rows)
+        if limit is not None:
+            result['has_more'] = has_more
+            result['next_cursor'] = _encoder_curseur(table, rows[-1]) if has_more else None
+        return result
     except Exception as e:
-        conn.close()
-        return {'ok': False, 'error': f'Erreur lors de la modification: {str(e)}'}
+        return {'ok': False, 'error': f'Erreur lors de la récupération des données: {str(e)}'}
+
+
+def flux_donnees_entre_dates(table, date_debut, date_fin, colonnes=None, format_reponse='objects'):
+    """Générer la réponse JSON d'une lecture par période, morceau par morceau
+
+    Les lignes sont encodées au fil du curseur SQLite : la mémoire utilisée
+    ne dépend pas de la taille de la période. La période, les colonnes
+    (_projection) et le format doivent avoir été validés.
+    """
+    cursor = get_connection().cursor()
+    total = _compter_periode(cursor, table, date_debut, date_fin)
+    _executer_lecture_periode(cursor, table, date_debut, date_fin, select_sql=colonnes)
+
+    en_tete = f'{{"success": true, "total": {total}, '
+    if format_reponse == 'columnar':
+        noms = [description[0] for description in cursor.description]
+        en_tete += f'"columns": {json.dumps(noms, ensure_ascii=False)}, '
+        encoder = list
+    else:
+        encoder = dict
+    yield (en_tete + '"data": [').encode('utf-8')
+
+    returned = 0
+    while True:
+        rows = cursor.fetchmany(TAILLE_LOT_LECTURE)
+        if not rows:
+            break
+        morceau = ', '.join(
+            json.dumps(encoder(row), ensure_ascii=False) for row in rows
+        )
+        yield ((', ' if returned else '') + morceau).encode('utf-8')
+        returned += len(rows)
+
+    yield f'], "returned": {returned}}}'.encode('utf-8')
+
+# Dimensions de regroupement autorisées pour les statistiques, par table
+DIMENSIONS_STATISTIQUES = {
+    'arrets_travail': ('medecin',),
+    'prolongation': ('medecin',),
+    'cbv': ('medecin', 'examen', 'titre'),
+    'antirabique': ('medecin', 'classe', 'type_de_vaccin', 'shema', 'animal'),
+    'dece': ('medecin', 'sexe', 'wilayaDeces', 'communeDeces', 'lieuDeces',
+             'causeDeces', 'natureMort', 'CIM1'),
+}
+
+# Agrégats calculés en plus du nombre de certificats
+MESURES_STATISTIQUES = {
+    'arrets_travail': {'total_jours': 'SUM(nombre_jours)', 'moyenne_jours': 'AVG(nombre_jours)'},
+    'prolongation': {'total_jours': 'SUM(nombre_jours)', 'moyenne_jours': 'AVG(nombre_jours)'},
+}
+
+# Découpage temporel : expression SQL de la période à partir du champ de date
+PERIODES_STATISTIQUES = {
+    'jour': "date({champ})",
+    'semaine': "date({champ}, '-6 days', 'weekday 1')",  # lundi de la semaine
+    'mois': "strftime('%Y-%m', {champ})",
+}
+
+
+def calculer_statistiques(table, date_debut, date_fin, grouper_par=None, periode=None):
+    """Agréger une table sur une période (GROUP BY en SQL)
+
+    grouper_par : liste de dimensions de DIMENSIONS_STATISTIQUES ;
+    periode : 'jour', 'semaine' ou 'mois' pour découper la période.
+    """
+    erreur = _valider_periode(table, date_debut, date_fin)
+    if erreur:
+        return {'ok': False, 'error': erreur}
+
+    grouper_par = grouper_par or []
+    if isinstance(grouper_par, str):
+        grouper_par = [grouper_par]
+    inconnues = [dimension for dimension in grouper_par if dimension not in DIMENSIONS_STATISTIQUES[table]]
+    if inconnues:
+        return {'ok': False, 'error': f'Dimensions non valides: {inconnues}. '
+                                      f'Dimensions valides: {list(DIMENSIONS_STATISTIQUES[table])}'}
+    if periode is not None and periode not in PERIODES_STATISTIQUES:
+        return {'ok': False, 'error': f'Période non valide. Périodes valides: {list(PERIODES_STATISTIQUES)}'}
+
+    # Regroupement par période et/ou médecin : lu dans les cumuls journaliers
+    if set(grouper_par) <= {'medecin'}:
+        return _statistiques_depuis_cumuls(table, date_debut, date_fin, grouper_par, periode)
+
+    date_field = CHAMPS_DATE[table]
+    cles = []
+    if periode is not None:
+        cles.append((PERIODES_STATISTIQUES[periode].format(champ=date_field), 'periode'))
+    cles.extend((dimension, dimension) for dimension in grouper_par)
+
+    select = [f'{expression} AS {alias}' for expression, alias in cles]
+    select.append('COUNT(*) AS nombre')
+    select.extend(f'{expression} AS {alias}' for alias, expression in MESURES_STATISTIQUES.get(table, {}).items())
 
-def ajouter_dece(data):
-    """Ajouter un nouveau certificat de décès"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
     try:
-        # Map frontend keys to DB keys (snake_case)
-        if 'dateDeces' in data:
-            data['date_deces'] = data['dateDeces']
-        if 'heureDeces' in data:
-            data['heure_deces'] = data['heureDeces']
-
-        # Construire la requête d'insertion dynamiquement
-        columns = []
-        values = []
-        
-        # Liste de tous les champs possibles
-        all_fields = [
-            'nom', 'prenom', 'dateNaissance', 'datePresume', 'wilaya_naissance', 'sexe',
-            'pere', 'mere', 'communeNaissance', 'wilayaResidence', 'place', 'placefr',
-            'DSG', 'DECEMAT', 'DGRO', 'DACC', 'DAVO', 'AGESTATION', 'IDETER', 'GM',
-            'MN', 'AGEGEST', 'POIDNSC', 'AGEMERE', 'DPNAT', 'EMDPNAT', 'communeResidence',
-            'dateDeces', 'heureDeces', 'lieuDeces', 'autresLieuDeces', 'communeDeces',
-            'wilayaDeces', 'causeDeces', 'causeDirecte', 'etatMorbide', 'natureMort',
-            'natureMortAutre', 'obstacleMedicoLegal', 'contamination', 'prothese',
-            'POSTOPP2', 'CIM1', 'CIM2', 'CIM3', 'CIM4', 'CIM5', 'nom_ar', 'prenom_ar',
-            'perear', 'merear', 'lieu_naissance', 'conjoint', 'profession', 'adresse',
-            'date_entree', 'heure_entree', 'date_deces', 'heure_deces', 'wilaya_deces',
-            'medecin', 'code_p', 'code_c', 'code_n'
-        ]
-        
-        for field in all_fields:
-            if field in data:
-                columns.append(field)
-                values.append(data[field])
-        
-        if not columns:
-            return False, "Aucune donnée à insérer"
-        
-        # Créer la requête SQL
-        placeholders = ', '.join(['?' for _ in columns])
-        columns_str = ', '.join(columns)
-        
+        cursor = get_connection().cursor()
+        source, params = _sql_sources(cursor.connection, table, f'{date_field} BETWEEN ? AND ?',
+                                      (date_debut, date_fin), date_debut, date_fin)
         query = f'''
-            INSERT INTO dece ({columns_str})
-            VALUES ({placeholders})
+            SELECT {', '.join(select)}
+            FROM {source}
         '''
-        
-        cursor.execute(query, values)
-        conn.commit()
-        return True, "Certificat de décès ajouté avec succès"
+        if cles:
+            aliases = ', '.join(alias for _, alias in cles)
+            query += f' GROUP BY {aliases} ORDER BY {aliases}'
+        cursor.execute(query, params)
+        data = [dict(row) for row in cursor.fetchall()]
     except Exception as e:
-        return False, f"Erreur de base de données: {str(e)}"
-    finally:
-        conn.close()
+        return {'ok': False, 'error': f'Erreur lors du calcul des statistiques: {str(e)}'}
+
+    return {
+        'ok': True,
+        'data': data,
+        'total': sum(ligne['nombre'] for ligne in data)
+    }
+
+
+def _statistiques_depuis_cumuls(table, date_debut, date_fin, grouper_par, periode):
+    """Statistiques par période/médecin calculées sur stats_journalieres"""
+    cles = []
+    if periode is not None:
+        cles.append((PERIODES_STATISTIQUES[periode].format(champ='jour'), 'periode'))
+    # Les cumuls stockent un médecin NULL en '' (clé primaire) : rendu à
+    # NULL, comme dans le calcul par GROUP BY
+    cles.extend((f"NULLIF({dimension}, '')", dimension) for dimension in grouper_par)
+
+    select = [f'{expression} AS {alias}' for expression, alias in cles]
+    select.append('SUM(nombre) AS nombre')
+    if table in MESURES_STATISTIQUES:
+        select.append('SUM(total_jours) AS total_jours')
+        select.append('CAST(SUM(total_jours) AS REAL) / SUM(nombre) AS moyenne_jours')
+
+    query = f'''
+        SELECT {', '.join(select)}
+        FROM stats_journalieres
+        WHERE table_source = ? AND jour BETWEEN ? AND ?
+    '''
+    if cles:
+        aliases = ', '.join(alias for _, alias in cles)
+        query += f' GROUP BY {aliases} ORDER BY {aliases}'
+
+    try:
+        cursor = get_connection().cursor()
+        cursor.execute(query, (table, date_debut, date_fin))
+        data = [dict(row) for row in cursor.fetchall()]
+    except Exception as e:
+        return {'ok': False, 'error': f'Erreur lors du calcul des statistiques: {str(e)}'}
+
+    # Sans regroupement, SUM() sur une période vide renvoie une ligne de NULL
+    if not cles and data and data[0]['nombre'] is None:
+        data = [dict(data[0], nombre=0)]
+    return {
+        'ok': True,
+        'data': data,
+        'total': sum(ligne['nombre'] for ligne in data)
+    }
+
+
+TAILLE_MAX_PAGE_RECHERCHE = 100  # Résultats maximum par page de recherche
+
+
+def rechercher_patients(texte, tables=None, limit=20, offset=0):
+    """Rechercher un patient dans toutes les tables (préfixes, sans accents ni casse)
+
+    Chaque mot saisi doit correspondre au début d'un mot du nom, du prénom,
+    du médecin ou (pour dece) des noms en arabe et de la filiation. Les
+    résultats sont classés par pertinence (bm25, nom et prénom en priorité).
+    """
+    termes = re.findall(r'\w+', texte or '')
+    if not termes:
+        return {'ok': False, 'error': 'Texte de recherche vide'}
+    try:
+        limit = int(limit)
+        offset = int(offset)
+    except (TypeError, ValueError):
+        return {'ok': False, 'error': 'limit et offset doivent être des entiers'}
+    if not 0 < limit <= TAILLE_MAX_PAGE_RECHERCHE or offset < 0:
+        return {'ok': False, 'error': f'limit doit être entre 1 et {TAILLE_MAX_PAGE_RECHERCHE}, offset positif'}
+
+    # "terme"* : recherche par préfixe, les guillemets neutralisent la syntaxe FTS5
+    conditions = ['recherche_patients MATCH ?']
+    params = [' '.join(f'"{terme}"*' for terme in termes)]
+    if tables:
+        inconnues = [table for table in tables if table not in CODES_RECHERCHE]
+        if inconnues:
+            return {'ok': False, 'error': f'Tables non valides: {inconnues}'}
+        conditions.append(f"table_source IN ({', '.join('?' for _ in tables)})")
+        params.extend(tables)
+
+    try:
+        cursor = get_connection().cursor()
+        cursor.execute(f'''
+            SELECT table_source AS "table", record_id AS id, nom, prenom, medecin,
+                   date_evenement, bm25(recherche_patients, 10.0, 10.0, 1.0, 5.0) AS score
+            FROM recherche_patients
+            WHERE {' AND '.join(conditions)}
+            ORDER BY score
+            LIMIT ? OFFSET ?
+        ''', params + [limit + 1, offset])
+        rows = [dict(row) for row in cursor.fetchall()]
+    except sqlite3.OperationalError as e:
+        if 'no such table' in str(e):
+            return {'ok': False, 'error': 'Recherche indisponible (SQLite sans FTS5)'}
+        return {'ok': False, 'error': f'Erreur lors de la recherche: {str(e)}'}
+
+    return {
+        'ok': True,
+        'data': rows[:limit],
+        'returned': min(len(rows), limit),
+        'has_more': len(rows) > limit
+    }
+
+
+def historique_patient(nom, prenom, date_naissance=None):
+    """Historique chronologique d'un patient sur les cinq tables, en une requête"""
+    cle = calculer_cle_patient(nom, prenom, date_naissance)
+    if cle is None:
+        return {'ok': False, 'error': 'Nom ou prénom du patient manquant'}
+
+    def branche(schema, table):
+        return f'''
+        SELECT '{table}' AS "table", id, {CHAMPS_DATE[table]} AS date, nom, prenom, medecin,
+               {REGISTRE_CERTIFICATS[table].detail_historique} AS detail,
+               strftime('%Y-%m-%d %H:%M:%S', created_at) AS created_at
+        FROM {schema}.{table}
+        WHERE cle_patient = ?'''
+
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        # Une branche par table, chacune servie par l'index (cle_patient, date)
+        branches = [branche('main', table) for table in CHAMPS_DATE]
+        cursor.execute(' UNION ALL '.join(branches) + ' ORDER BY date, created_at, id',
+                       [cle] * len(branches))
+        data = [dict(row) for row in cursor.fetchall()]
+        # Années archivées : une requête par partition, quel que soit leur nombre
+        annees = partitions.annees()
+        for annee in annees:
+            branches = [branche(partitions.attacher(conn, annee), table) for table in TABLES_PARTITIONNEES]
+            cursor.execute(' UNION ALL '.join(branches), [cle] * len(branches))
+            data.extend(dict(row) for row in cursor.fetchall())
+        if annees:
+            # Même ordre que SQLite : NULL en premier
+            data.sort(key=lambda ligne: tuple((ligne[cle_tri] is not None, ligne[cle_tri] or '')
+                                              for cle_tri in ('date', 'created_at', 'id')))
+    except Exception as e:
+        return {'ok': False, 'error': f'Erreur lors de la récupération de l\'historique: {str(e)}'}
+
+    return {'ok': True, 'cle_patient': cle, 'data': data, 'total': len(data)}
+
+
+# Colonnes exportées par défaut (colonne, en-tête), dans l'ordre du tableau
+# affiché par recuperer-donnees.js
+COLONNES_EXPORT = {
+    'arrets_travail': [
+        ('nom', 'Nom'), ('prenom', 'Prénom'), ('medecin', 'Médecin'),
+        ('nombre_jours', 'Nombre de jours'), ('date_certificat', 'Date certificat'),
+        ('date_naissance', 'Date naissance'), ('age', 'Âge'), ('created_at', 'Créé le'),
+    ],
+    'prolongation': [
+        ('nom', 'Nom'), ('prenom', 'Prénom'), ('medecin', 'Médecin'),
+        ('nombre_jours', 'Nombre de jours'), ('date_certificat', 'Date certificat'),
+        ('date_naissance', 'Date naissance'), ('age', 'Âge'), ('created_at', 'Créé le'),
+    ],
+    'cbv': [
+        ('nom', 'Nom'), ('prenom', 'Prénom'), ('medecin', 'Médecin'),
+        ('date_certificat', 'Date certificat'), ('heure', 'Heure'),
+        ('date_naissance', 'Date naissance'), ('titre', 'Titre'), ('examen', 'Examen'),
+        ('created_at', 'Créé le'),
+    ],
+    'antirabique': [
+        ('nom', 'Nom'), ('prenom', 'Prénom'), ('medecin', 'Médecin'), ('classe', 'Classe'),
+        ('type_de_vaccin', 'Type vaccin'), ('shema', 'Schéma'),
+        ('date_de_certificat', 'Date certificat'), ('date_de_naissance', 'Date naissance'),
+        ('animal', 'Animal'), ('created_at', 'Créé le'),
+    ],
+    'dece': [
+        ('nom', 'Nom'), ('prenom', 'Prénom'), ('date_deces', 'Date de décès'),
+        ('heure_deces', 'Heure de décès'), ('lieuDeces', 'Lieu de décès'),
+        ('causeDeces', 'Cause de décès'), ('medecin', 'Médecin'),
+    ],
+}
+
+
+def _colonnes_exportables(table):
+    """Colonnes qu'un export peut demander pour une table"""
+    colonnes = ['id'] + [colonne for colonne, _ in COLONNES_EXPORT[table]]
+    if table == 'dece':
+        colonnes += [champ for champ in CHAMPS_DECE if champ not in colonnes] + ['created_at']
+    return colonnes
+
+
+def preparer_export(table, date_debut, date_fin, format_export, colonnes=None):
+    """Valider une demande d'export ; renvoie {'ok', 'colonnes': [(colonne, en-tête)]}"""
+    erreur = _valider_periode(table, date_debut, date_fin)
+    if erreur:
+        return {'ok': False, 'error': erreur}
+    if format_export not in ('csv', 'xlsx'):
+        return {'ok': False, 'error': 'Format non valide. Formats valides: csv, xlsx'}
+
+    if not colonnes:
+        return {'ok': True, 'colonnes': COLONNES_EXPORT[table]}
+
+    en_tetes = dict(COLONNES_EXPORT[table])
+    autorisees = _colonnes_exportables(table)
+    inconnues = [colonne for colonne in colonnes if colonne not in autorisees]
+    if inconnues:
+        return {'ok': False, 'error': f'Colonnes non valides: {inconnues}'}
+    return {'ok': True, 'colonnes': [(colonne, en_tetes.get(colonne, colonne)) for colonne in colonnes]}
+
+
+def _iterer_lignes_export(table, date_debut, date_fin, colonnes):
+    """Lignes (tuples) d'un export, lues par lots au fil du curseur"""
+    select = ', '.join(
+        "strftime('%Y-%m-%d %H:%M:%S', created_at)" if colonne == 'created_at' else f'"{colonne}"'
+        for colonne, _ in colonnes
+    )
+    cursor = get_connection().cursor()
+    _executer_lecture_periode(cursor, table, date_debut, date_fin, select_sql=select)
+    while True:
+        rows = cursor.fetchmany(TAILLE_LOT_LECTURE)
+        if not rows:
+            break
+        for row in rows:
+            yield tuple(row)
+
+
+def flux_export_csv(table, date_debut, date_fin, colonnes):
+    """Générer un export CSV (UTF-8 avec BOM pour Excel), lot par lot"""
+    tampon = io.StringIO()
+    writer = csv.writer(tampon)
+    tampon.write('\ufeff')
+    writer.writerow([en_tete for _, en_tete in colonnes])
+
+    for numero, ligne in enumerate(_iterer_lignes_export(table, date_debut, date_fin, colonnes), 1):
+        writer.writerow(['' if valeur is None else valeur for valeur in ligne])
+        if numero % TAILLE_LOT_LECTURE == 0:
+            yield tampon.getvalue().encode('utf-8')
+            tampon.seek(0)
+            tampon.truncate()
+    yield tampon.getvalue().encode('utf-8')
+
+
+class _TamponFlux(io.RawIOBase):
+    """Sortie non repositionnable pour zipfile, vidée au fil de l'écriture"""
+
+    def __init__(self):
+        super().__init__()
+        self._morceaux = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._morceaux.append(bytes(data))
+        return len(data)
+
+    def vider(self):
+        data = b''.join(self._morceaux)
+        self._morceaux = []
+        return data
+
+
+# Caractères interdits en XML 1.0 (contrôles hors tabulation et sauts de ligne)
+_CARACTERES_INTERDITS_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_XLSX_CONTENT_TYPES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+</Types>'''
+
+_XLSX_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>'''
+
+_XLSX_WORKBOOK = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="Données" sheetId="1" r:id="rId1"/></sheets>
+</workbook>'''
+
+_XLSX_WORKBOOK_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+</Relationships>'''
+
+
+def _cellule_xlsx(valeur):
+    if valeur is None:
+        return '<c/>'
+    if isinstance(valeur, (int, float)) and not isinstance(valeur, bool):
+        return f'<c><v>{valeur}</v></c>'
+    texte = xml_escape(_CARACTERES_INTERDITS_XML.sub('', str(valeur)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texte}</t></is></c>'
+
+
+def _ligne_xlsx(numero, valeurs):
+    return f'<row r="{numero}">{"".join(_cellule_xlsx(valeur) for valeur in valeurs)}</row>'
+
+
+def flux_export_xlsx(table, date_debut, date_fin, colonnes):
+    """Générer un classeur XLSX en mémoire constante
+
+    Les cellules sont écrites en chaînes inline (pas de table de chaînes
+    partagées à construire) et l'archive est produite au fil de l'eau : les
+    entrées zip utilisent des descripteurs de données, sans retour en arrière.
+    """
+    sortie = _TamponFlux()
+    with zipfile.ZipFile(sortie, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _XLSX_CONTENT_TYPES)
+        archive.writestr('_rels/.rels', _XLSX_RELS)
+        archive.writestr('xl/workbook.xml', _XLSX_WORKBOOK)
+        archive.writestr('xl/_rels/workbook.xml.rels', _XLSX_WORKBOOK_RELS)
+        yield sortie.vider()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as feuille:
+            entete = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                      '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                      '<sheetData>')
+            feuille.write((entete + _ligne_xlsx(1, [en_tete for _, en_tete in colonnes])).encode('utf-8'))
+
+            lot = []
+            for numero, ligne in enumerate(_iterer_lignes_export(table, date_debut, date_fin, colonnes), 2):
+                lot.append(_ligne_xlsx(numero, ligne))
+                if len(lot) == TAILLE_LOT_LECTURE:
+                    feuille.write(''.join(lot).encode('utf-8'))
+                    lot = []
+                    yield sortie.vider()
+            feuille.write((''.join(lot) + '</sheetData></worksheet>').encode('utf-8'))
+        yield sortie.vider()
+    yield sortie.vider()
+
+
+TAILLE_MAX_LOT = 10000  # Enregistrements acceptés par appel à /api/ajouter_lot
+TAILLE_PAQUET_SQL = 500  # Paramètres par requête IN (...), sous la limite de SQLite
+
+
+def ajouter_lot(table, records):
+    """Ajouter un lot de certificats en une seule transaction
+
+    Renvoie le résultat de chaque enregistrement (inserted, duplicate ou
+    invalid) dans l'ordre du lot. Les doublons sont détectés par empreinte,
+    contre la base et les années archivées comme à l'intérieur du lot.
+    """
+    erreur = _verifier_table(table)
+    if erreur:
+        return {'ok': False, 'error': erreur}
+    if not isinstance(records, list):
+        return {'ok': False, 'error': 'records doit être une liste'}
+    if len(records) > TAILLE_MAX_LOT:
+        return {'ok': False, 'error': f'Lot trop volumineux (maximum {TAILLE_MAX_LOT} enregistrements)'}
+
+    resultats = []
+    lignes = []
+    for index, record in enumerate(records):
+        valeurs, erreur = preparer_insertion(table, record)
+        if erreur:
+            resultats.append({'index': index, 'status': 'invalid', 'error': erreur})
+        else:
+            resultat = {'index': index, 'status': 'inserted'}
+            resultats.append(resultat)
+            lignes.append((resultat, valeurs))
+    archivees = set()
+
+    def inserer_lot(conn):
+        # Le thread écrivain est seul à écrire : aucune insertion concurrente
+        # entre la lecture des empreintes existantes et l'insertion du lot
+        cursor = conn.cursor()
+        if REGISTRE_CERTIFICATS[table].cle_doublon:
+            existantes = set(archivees)
+            empreintes = [valeurs['empreinte'] for _, valeurs in lignes]
+            for debut in range(0, len(empreintes), TAILLE_PAQUET_SQL):
+                paquet = empreintes[debut:debut + TAILLE_PAQUET_SQL]
+                cursor.execute(f'''
+                    SELECT empreinte FROM {table}
+                    WHERE empreinte IN ({', '.join('?' for _ in paquet)})
+                ''', paquet)
+                existantes.update(row[0] for row in cursor.fetchall())
+
+            a_inserer = []
+            for resultat, valeurs in lignes:
+                if valeurs['empreinte'] in existantes:
+                    resultat['status'] = 'duplicate'
+                else:
+                    existantes.add(valeurs['empreinte'])
+                    a_inserer.append(valeurs)
+        else:
+            a_inserer = [valeurs for _, valeurs in lignes]
+
+        # Insertion partielle : une requête par ensemble de colonnes fournies
+        paquets = {}
+        for valeurs in a_inserer:
+            paquets.setdefault(tuple(valeurs), []).append(tuple(valeurs.values()))
+        for colonnes, lignes_valeurs in paquets.items():
+            cursor.executemany(_sql_insertion(table, colonnes), lignes_valeurs)
 
-def modifier_dece(data):
-    """Modifier un certificat de décès existant"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
     try:
-        # Vérifier que l'ID est présent
-        if 'id' not in data or not data['id']:
-            return False, "ID du certificat manquant"
-        
-        cert_id = data['id']
-        
-        # Map frontend keys to DB keys (snake_case)
-        if 'dateDeces' in data:
-            data['date_deces'] = data['dateDeces']
-        if 'heureDeces' in data:
-            data['heure_deces'] = data['heureDeces']
-
-        # Construire la requête de mise à jour dynamiquement
-        columns = []
-        values = []
-        
-        # Liste de tous les champs possibles (hors ID)
-        all_fields = [
-            'nom', 'prenom', 'dateNaissance', 'datePresume', 'wilaya_naissance', 'sexe',
-            'pere', 'mere', 'communeNaissance', 'wilayaResidence', 'place', 'placefr',
-            'DSG', 'DECEMAT', 'DGRO', 'DACC', 'DAVO', 'AGESTATION', 'IDETER', 'GM',
-            'MN', 'AGEGEST', 'POIDNSC', 'AGEMERE', 'DPNAT', 'EMDPNAT', 'communeResidence',
-            'dateDeces', 'heureDeces', 'lieuDeces', 'autresLieuDeces', 'communeDeces',
-            'wilayaDeces', 'causeDeces', 'causeDirecte', 'etatMorbide', 'natureMort',
-            'natureMortAutre', 'obstacleMedicoLegal', 'contamination', 'prothese',
-            'POSTOPP2', 'CIM1', 'CIM2', 'CIM3', 'CIM4', 'CIM5', 'nom_ar', 'prenom_ar',
-            'perear', 'merear', 'lieu_naissance', 'conjoint', 'profession', 'adresse',
-            'date_entree', 'heure_entree', 'date_deces', 'heure_deces', 'wilaya_deces',
-            'medecin', 'code_p', 'code_c', 'code_n'
-        ]
-        
-        for field in all_fields:
-            if field in data and field != 'id':
-                columns.append(f"{field} = ?")
-                values.append(data[field])
-        
-        if not columns:
-            return False, "Aucune donnée à modifier"
-        
-        # Ajouter l'ID à la fin des valeurs
-        values.append(cert_id)
-        
-        # Créer la requête SQL
-        columns_str = ', '.join(columns)
-        
-        query = f'''
-            UPDATE dece 
-            SET {columns_str}
-            WHERE id = ?
-        '''
-        
-        cursor.execute(query, values)
-        conn.commit()
-        
-        if cursor.rowcount == 0:
-            return False, "Aucun certificat trouvé avec cet ID"
-        
-        return True, "Certificat de décès modifié avec succès"
+        archivees.update(_empreintes_archivees(table, [valeurs for _, valeurs in lignes]))
+        ecrivain.executer(table, inserer_lot)
     except Exception as e:
-        return False, f"Erreur de base de données: {str(e)}"
-    finally:
-        conn.close()
+        return {'ok': False, 'error': f'Erreur lors de l\'ajout du lot: {str(e)}'}
+
+    compteurs = {'inserted': 0, 'duplicate': 0, 'invalid': 0}
+    for resultat in resultats:
+        compteurs[resultat['status']] += 1
+    journal.info("Lot %s: %s ajoutés, %s doublons, %s invalides",
+                 table, compteurs['inserted'], compteurs['duplicate'], compteurs['invalid'])
+    return {'ok': True, 'results': resultats, **compteurs}
 
 
-def lister_dece(limit=20, offset=0):
-    """Lister les certificats de décès"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+TAILLE_MAX_PAGE_DECE = 500  # Lignes maximum par page de lister_dece
+
+
+def lister_dece(limit=20, cursor_token=None, total='aucun', champs=None, format_reponse='objects', offset=None):
+    """Lister les certificats de décès, du plus récent au plus ancien
+
+    Pagination par curseur sur (created_at, id), servie par idx_dece_created_at
+    (l'index contient le rowid) : chaque page reprend directement après la
+    précédente, quelle que soit sa profondeur. total vaut 'aucun', 'exact'
+    (COUNT(*)) ou 'approximatif' (estimation par les bornes de id).
+    champs et format_reponse : voir recuperer_donnees_entre_dates.
+    Avec offset (pagination historique), la page est lue par OFFSET dans le
+    même ordre et la réponse porte total (exact) et offset comme avant les curseurs.
+    Seule la base courante est listée : les années archivées dans les
+    partitions annuelles se lisent par période (lister_dece_par_periode).
+    """
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return {'ok': False, 'error': 'Le paramètre limit doit être un entier'}
+    if limit < 1 or limit > TAILLE_MAX_PAGE_DECE:
+        return {'ok': False, 'error': f'Le paramètre limit doit être compris entre 1 et {TAILLE_MAX_PAGE_DECE}'}
+    if total not in ('aucun', 'exact', 'approximatif'):
+        return {'ok': False, 'error': "Le paramètre total doit valoir 'aucun', 'exact' ou 'approximatif'"}
+
+    try:
+        colonnes = _projection('dece', champs)
+        _valider_format(format_reponse)
+        position = _decoder_curseur(cursor_token, 2) if cursor_token else None
+    except ValueError as e:
+        return {'ok': False, 'error': str(e)}
+    if offset is not None:
+        try:
+            offset = int(offset)
+        except (TypeError, ValueError):
+            offset = -1
+        if offset < 0:
+            return {'ok': False, 'error': 'Le paramètre offset doit être un entier positif'}
+
+    conn = get_connection()
     cursor = conn.cursor()
 
-    cursor.execute('SELECT COUNT(*) as total FROM dece')
-    total = cursor.fetchone()['total']
+    if offset is not None:
+        try:
+            cursor.execute('SELECT COUNT(*) as total FROM dece')
+            nombre = cursor.fetchone()['total']
+            cursor.execute(f'''
+                SELECT {colonnes}
+                FROM dece
+                ORDER BY created_at IS NULL, created_at DESC, id DESC
+                LIMIT ? OFFSET ?
+            ''', (limit, offset))
+            rows = cursor.fetchall()
+            result = _mettre_en_forme({'ok': True}, cursor, rows, format_reponse)
+            result.update({
+                'total': nombre,
+                'returned': len(rows),
+                'has_more': offset + len(rows) < nombre,
+                'offset': offset,
+                'limit': limit
+            })
+            return result
+        except Exception as e:
+            return {'ok': False, 'error': f'Erreur lors de la récupération des données: {str(e)}'}
 
-    cursor.execute('''
-        SELECT *
-        FROM dece 
-        ORDER BY created_at DESC
-        LIMIT ? OFFSET ?
-    ''', (limit, offset))
+    try:
+        # Une ligne de plus que demandé pour savoir s'il reste une page.
+        # Les created_at NULL viennent en dernier (ordre DESC) et sont lus à part :
+        # la comparaison de ligne (created_at, id) < (?, ?) les exclut, et la
+        # première page les écarte explicitement
+        rows = []
+        if position is None or position[0] is not None:
+            condition, params = (('(created_at, id) < (?, ?)', list(position)) if position
+                                 else ('created_at IS NOT NULL', []))
+            cursor.execute(f'''
+                SELECT {colonnes}
+                FROM dece
+                WHERE {condition}
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+            ''', params + [limit + 1])
+            rows = cursor.fetchall()
+        if len(rows) <= limit:
+            dernier_id = position[1] if position and position[0] is None else None
+            cursor.execute(f'''
+                SELECT {colonnes}
+                FROM dece
+                WHERE created_at IS NULL {'AND id < ?' if dernier_id is not None else ''}
+                ORDER BY id DESC
+                LIMIT ?
+            ''', ([dernier_id] if dernier_id is not None else []) + [limit + 1 - len(rows)])
+            rows += cursor.fetchall()
 
-    results = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        result = _mettre_en_forme({'ok': True}, cursor, rows, format_reponse)
+        result.update({
+            'returned': len(rows),
+            'has_more': has_more,
+            'next_cursor': None,
+            'limit': limit
+        })
+        if has_more:
+            position = [rows[-1]['created_at'], rows[-1]['id']]
+            result['next_cursor'] = base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
 
-    return {
-        'ok': True,
-        'data': results,
-        'total': total,
-        'returned': len(results),
-        'has_more': (offset + len(results)) < total,
-        'offset': offset,
-        'limit': limit
-    }
+        if total == 'exact':
+            cursor.execute('SELECT COUNT(*) as total FROM dece')
+            result['total'] = cursor.fetchone()['total']
+        elif total == 'approximatif':
+            # Majorant sans parcours : exact tant qu'aucune ligne n'a été supprimée
+            cursor.execute('SELECT COALESCE(MAX(id) - MIN(id) + 1, 0) as total FROM dece')
+            result['total'] = cursor.fetchone()['total']
+        return result
+    except Exception as e:
+        return {'ok': False, 'error': f'Erreur lors de la récupération des données: {str(e)}'}
 
 def supprimer_enregistrement(table, record_id):
     """Supprimer un enregistrement d'une table"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    try:
-        # Vérifier que la table est valide
-        tables_valides = ['arrets_travail', 'prolongation', 'cbv', 'antirabique', 'dece']
-        if table not in tables_valides:
-            conn.close()
-            return {'ok': False, 'error': f'Table non valide. Tables valides: {tables_valides}'}
-        
-        if not record_id:
-            conn.close()
-            return {'ok': False, 'error': 'ID de l\'enregistrement manquant'}
-        
-        # Supprimer l'enregistrement
+    # Vérifier que la table est valide
+    erreur = _verifier_table(table)
+    if erreur:
+        return {'ok': False, 'error': erreur}
+
+    if not record_id:
+        return {'ok': False, 'error': 'ID de l\'enregistrement manquant'}
+
+    def supprimer(conn):
+        cursor = conn.cursor()
         cursor.execute(f'DELETE FROM {table} WHERE id = ?', (record_id,))
-        
-        # Vérifier si la suppression a réussi
+        # Vérifier si la suppression a réussi (None : voir _introuvable)
         if cursor.rowcount == 0:
-            conn.close()
-            return {'ok': False, 'error': 'Aucun enregistrement trouvé avec cet ID'}
-        
-        conn.commit()
-        conn.close()
-        
+            return None
         return {'ok': True, 'message': 'Enregistrement supprimé avec succès'}
-        
+
+    try:
+        resultat = ecrivain.executer(table, supprimer)
+        return _introuvable(table, record_id) if resultat is None else resultat
     except Exception as e:
-        conn.close()
         return {'ok': False, 'error': f'Erreur lors de la suppression: {str(e)}'}
 
 
@@ -1187,68 +2948,1048 @@ def supprimer_dece(record_id):
     """Supprimer un certificat de décès"""
     return supprimer_enregistrement('dece', record_id)
 
-def lister_dece_par_periode(date_debut, date_fin):
+def lister_dece_par_periode(date_debut, date_fin, champs=None, format_reponse='objects'):
     """Lister les certificats de décès dans une période donnée"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    erreur = _valider_periode('dece', date_debut, date_fin)
+    if erreur:
+        return {'ok': False, 'error': erreur}
+
+    conn = get_connection()
     cursor = conn.cursor()
 
+    try:
+        colonnes = _projection('dece', champs)
+        _valider_format(format_reponse)
+    except ValueError as e:
+        return {'ok': False, 'error': str(e)}
+
     try:
         # Compter le nombre total de résultats
-        cursor.execute('''
-            SELECT COUNT(*) as total 
-            FROM dece 
-            WHERE date_deces BETWEEN ? AND ?
-        ''', (date_debut, date_fin))
-        total = cursor.fetchone()['total']
-        
-        # Récupérer les données
-        cursor.execute('''
-            SELECT *
-            FROM dece 
-            WHERE date_deces BETWEEN ? AND ?
-            ORDER BY date_deces DESC, nom ASC, prenom ASC
-        ''', (date_debut, date_fin))
+        total = _compter_periode(cursor, 'dece', date_debut, date_fin)
         
-        results = [dict(row) for row in cursor.fetchall()]
-        
-        # Remapper certains champs pour correspondre au format attendu
-        for cert in results:
-            if 'date_deces' in cert:
-                cert['dateDeces'] = cert['date_deces']
-            if 'heure_deces' in cert:
-                cert['heureDeces'] = cert['heure_deces']
+        # Récupérer les données (base courante et partitions des années de la période)
+        # Les alias dateDeces/heureDeces attendus par le frontend sont
+        # produits par la projection
+        _executer_lecture_periode(cursor, 'dece', date_debut, date_fin, select_sql=colonnes)
+        rows = cursor.fetchall()
         
+        result = _mettre_en_forme({'ok': True}, cursor, rows, format_reponse)
+        result['total'] = total
+        result['returned'] = len(rows)
+        return result
+    except Exception as e:
+        return {'ok': False, 'error': f'Erreur lors de la récupération des données: {str(e)}'}
+
+
+TAILLE_MAX_PAGE_MODIFICATIONS = 5000  # Entrées du journal lues par appel à /api/modifications
+MODIFICATIONS_CONSERVATION_JOURS = 90  # Au-delà, le journal est purgé (resynchronisation complète)
+
+
+def lister_modifications(since=0, limit=500, tables=None):
+    """Modifications postérieures au numéro de séquence since, par ordre de séquence
+
+    Chaque entrée porte la ligne actuelle (insert, update) ou seulement l'id
+    (delete). Une entrée suivie d'une autre sur le même enregistrement dans la
+    page est omise, tout comme un ajout dont la ligne a disparu : la
+    suppression arrive plus loin dans le journal. Repasser next_since pour la
+    page suivante.
+
+    since=-1 renvoie seulement la tête du journal (last_seq, next_since) ; la
+    réponse resync_required la porte aussi. Le client la note AVANT sa relecture
+    complète puis reprend depuis elle : les modifications faites pendant la
+    relecture lui sont renvoyées (réappliquer une ligne est sans effet).
+    """
+    try:
+        since = int(since)
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return {'ok': False, 'error': 'Les paramètres since et limit doivent être des entiers'}
+    if since < -1 or limit < 1 or limit > TAILLE_MAX_PAGE_MODIFICATIONS:
+        return {'ok': False, 'error': f'since doit être positif (ou -1) et limit compris entre 1 et {TAILLE_MAX_PAGE_MODIFICATIONS}'}
+    if tables is None:
+        tables = list(REGISTRE_CERTIFICATS)
+    elif not isinstance(tables, list) or any(_verifier_table(table) for table in tables):
+        return {'ok': False, 'error': f'Tables non valides. Tables valides: {list(REGISTRE_CERTIFICATS)}'}
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('SELECT MIN(seq) FROM modifications')
+        premier = cursor.fetchone()[0]
+        cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'modifications'")
+        dernier = cursor.fetchone()[0]
+        if since == -1:
+            return {'ok': True, 'data': [], 'returned': 0, 'has_more': False,
+                    'next_since': dernier, 'last_seq': dernier}
+        # Entrées purgées entre since et le début du journal, ou since venu d'une
+        # autre base (restauration) : le client doit tout relire
+        if since > dernier or (since < dernier and (premier is None or since + 1 < premier)):
+            return {'ok': False, 'resync_required': True, 'last_seq': dernier,
+                    'error': 'Numéro de séquence absent du journal (purgé ou autre base) : resynchronisation complète nécessaire'}
+
+        cursor.execute(f'''
+            SELECT seq, table_source, record_id, operation, horodatage
+            FROM modifications
+            WHERE seq > ? AND table_source IN ({', '.join('?' for _ in tables)})
+            ORDER BY seq
+            LIMIT ?
+        ''', [since, *tables, limit])
+        entrees = cursor.fetchall()
+
+        # Dernière entrée de la page pour chaque enregistrement
+        dernieres = {}
+        for entree in entrees:
+            dernieres[(entree['table_source'], entree['record_id'])] = entree
+        lignes = {}
+        for table in tables:
+            ids = [record_id for (source, record_id), entree in dernieres.items()
+                   if source == table and entree['operation'] != 'delete']
+            for debut in range(0, len(ids), TAILLE_PAQUET_SQL):
+                paquet = ids[debut:debut + TAILLE_PAQUET_SQL]
+                cursor.execute(f'''
+                    SELECT {COLONNES_LECTURE[table]} FROM {table}
+                    WHERE id IN ({', '.join('?' for _ in paquet)})
+                ''', paquet)
+                lignes.update(((table, row['id']), dict(row)) for row in cursor.fetchall())
+            # Enregistrements déplacés depuis dans une partition annuelle
+            for annee in partitions.annees_periode(table):
+                manquants = [record_id for record_id in ids if (table, record_id) not in lignes]
+                if not manquants:
+                    break
+                schema = partitions.attacher(conn, annee)
+                for debut in range(0, len(manquants), TAILLE_PAQUET_SQL):
+                    paquet = manquants[debut:debut + TAILLE_PAQUET_SQL]
+                    cursor.execute(f'''
+                        SELECT {COLONNES_LECTURE[table]} FROM {schema}.{table}
+                        WHERE id IN ({', '.join('?' for _ in paquet)})
+                    ''', paquet)
+                    lignes.update(((table, row['id']), dict(row)) for row in cursor.fetchall())
+
+        data = []
+        for entree in sorted(dernieres.values(), key=lambda entree: entree['seq']):
+            cle = (entree['table_source'], entree['record_id'])
+            if entree['operation'] != 'delete' and cle not in lignes:
+                continue
+            data.append({'seq': entree['seq'], 'table': entree['table_source'], 'id': entree['record_id'],
+                         'operation': entree['operation'], 'changed_at': entree['horodatage'],
+                         'record': lignes.get(cle)})
+
+        return {'ok': True, 'data': data, 'returned': len(data),
+                'has_more': len(entrees) == limit,
+                # Sans entrée retenue, rien d'autre n'est à lire jusqu'à last_seq
+                'next_since': entrees[-1]['seq'] if entrees else max(since, dernier),
+                'last_seq': dernier}
+    except Exception as e:
+        return {'ok': False, 'error': f'Erreur lors de la lecture des modifications: {str(e)}'}
+
+
+def purger_modifications():
+    """Supprimer les entrées du journal des modifications plus anciennes que la conservation"""
+    def purger(conn):
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM modifications WHERE horodatage < datetime('now', ?)",
+                       (f'-{MODIFICATIONS_CONSERVATION_JOURS} days',))
+        return cursor.rowcount
+
+    return {'entrees_supprimees': ecrivain.executer('modifications', purger),
+            'conservation_jours': MODIFICATIONS_CONSERVATION_JOURS}
+
+
+def _creer_table_partition(conn, table):
+    """Créer (ou compléter après une migration) table et ses index dans la partition attachée"""
+    cursor = conn.execute("SELECT type, sql FROM main.sqlite_master WHERE tbl_name = ? AND sql IS NOT NULL "
+                          "AND type IN ('table', 'index') ORDER BY type DESC", (table,))
+    for type_objet, sql in cursor.fetchall():
+        if type_objet == 'table':
+            sql = re.sub(r'^CREATE TABLE\s+\S+', f'CREATE TABLE IF NOT EXISTS partition.{table}', sql)
+        else:
+            sql = re.sub(r'^CREATE (UNIQUE )?INDEX\s+(\S+)', r'CREATE \1INDEX IF NOT EXISTS partition.\2', sql)
+        conn.execute(sql)
+    presentes = set(_colonnes_table(conn, 'partition', table))
+    for ligne in conn.execute(f'PRAGMA main.table_info({table})').fetchall():
+        if ligne[1] not in presentes:
+            conn.execute(f'ALTER TABLE partition.{table} ADD COLUMN {ligne[1]} {ligne[2]}')
+
+
+def archiver_annee(annee):
+    """Déplacer une année close de TABLES_PARTITIONNEES dans sa partition annee-AAAA.db
+
+    Une nouvelle partition est remplie sous un nom temporaire, renommée,
+    puis les lignes copiées sont supprimées de la base courante (garde
+    d'archivage : cumuls, recherche et journal des modifications inchangés).
+    Relancer la commande sur une année déjà archivée y ajoute les lignes
+    saisies depuis, dans une seule transaction. Une interruption laisse au
+    pire des lignes dans les deux bases : relancer termine le déplacement.
+    Une ligne que l'empreinte écarte de la copie, doublon d'une ligne déjà
+    archivée, est supprimée sans garde, comme une suppression ordinaire ;
+    « restants » compte les lignes de l'année encore dans la base courante.
+    """
+    annee = int(annee)
+    if annee >= datetime.now().year:
+        raise ValueError(f"L'année {annee} n'est pas close")
+    os.makedirs(partitions.dossier(), exist_ok=True)
+    chemin = partitions.chemin(annee)
+    nouvelle = not os.path.exists(chemin)
+    bornes = (f'{annee}-01-01', f'{annee + 1}-01-01')
+    lignes = {}
+    doublons = {}
+    restants = {}
+
+    conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+    try:
+        conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+        # Les lecteurs ne voient une nouvelle partition qu'une fois complète
+        conn.execute('ATTACH DATABASE ? AS partition', (chemin + '.partiel' if nouvelle else chemin,))
+        # Journal classique : une partition lue en mode=ro ne doit pas être en WAL
+        conn.execute('PRAGMA partition.journal_mode=DELETE')
+        conn.execute('BEGIN IMMEDIATE')
+        for table in TABLES_PARTITIONNEES:
+            _creer_table_partition(conn, table)
+            date_field = CHAMPS_DATE[table]
+            colonnes = ', '.join(_colonnes_table(conn, 'main', table))
+            lignes[table] = conn.execute(f'''
+                INSERT OR IGNORE INTO partition.{table} ({colonnes})
+                SELECT {colonnes} FROM main.{table}
+                WHERE {date_field} >= ? AND {date_field} < ?
+            ''', bornes).rowcount
+        if nouvelle:
+            conn.execute('COMMIT')
+            conn.execute('ANALYZE partition')
+            conn.execute('DETACH DATABASE partition')
+            os.replace(chemin + '.partiel', chemin)
+            conn.execute('ATTACH DATABASE ? AS partition', (chemin,))
+            conn.execute('BEGIN IMMEDIATE')
+
+        conn.execute('INSERT INTO archivage_en_cours (annee) VALUES (?)', (annee,))
+        for table in TABLES_PARTITIONNEES:
+            date_field = CHAMPS_DATE[table]
+            conn.execute(f'''
+                DELETE FROM main.{table}
+                WHERE {date_field} >= ? AND {date_field} < ? AND id IN (SELECT id FROM partition.{table})
+            ''', bornes)
+        conn.execute('DELETE FROM archivage_en_cours')
+        for table in TABLES_PARTITIONNEES:
+            date_field = CHAMPS_DATE[table]
+            if REGISTRE_CERTIFICATS[table].cle_doublon:
+                doublons[table] = conn.execute(f'''
+                    DELETE FROM main.{table}
+                    WHERE {date_field} >= ? AND {date_field} < ?
+                      AND empreinte IN (SELECT empreinte FROM partition.{table})
+                ''', bornes).rowcount
+            restants[table] = conn.execute(f'''
+                SELECT COUNT(*) FROM main.{table} WHERE {date_field} >= ? AND {date_field} < ?
+            ''', bornes).fetchone()[0]
+        conn.execute('COMMIT')
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
         conn.close()
-        
+
+    if any(restants.values()):
+        journal.warning("Année %s : lignes restées dans la base courante", annee, extra={'champs': restants})
+    return {'annee': annee, 'fichier': chemin, 'lignes': lignes, 'doublons_supprimes': doublons,
+            'restants': restants, 'octets': os.path.getsize(chemin)}
+
+
+def sauvegarder_partitions(dossier):
+    """Copier dans dossier les partitions absentes ou modifiées depuis la dernière copie
+
+    Une partition ne change qu'à l'archivage : elle n'est sauvegardée qu'une fois.
+    """
+    copiees = []
+    destination = os.path.join(dossier, 'partitions')
+    for annee in partitions.annees():
+        source = partitions.chemin(annee)
+        copie = os.path.join(destination, os.path.basename(source))
+        etat = os.stat(source)
+        if os.path.exists(copie) and (os.path.getsize(copie), os.path.getmtime(copie)) == (etat.st_size, etat.st_mtime):
+            continue
+        os.makedirs(destination, exist_ok=True)
+        shutil.copy2(source, copie + '.partiel')
+        os.replace(copie + '.partiel', copie)
+        copiees.append(copie)
+    return copiees
+
+
+# Maintenance : sauvegardes en ligne, statistiques du planificateur, vacuum incrémental
+MAINTENANCE_FENETRE = '01:00-05:00'  # Heures où les tâches échues sont lancées ('' : à toute heure)
+MAINTENANCE_VERIFICATION_S = 60  # Intervalle de vérification des tâches échues
+SAUVEGARDE_DOSSIER = None  # None : dossier « sauvegardes » à côté de la base
+SAUVEGARDE_PAGES_PAR_ETAPE = 256  # Pages copiées par étape de l'API de sauvegarde
+SAUVEGARDE_PAUSE_S = 0.05  # Pause entre deux étapes : les écritures passent entre les deux
+SAUVEGARDES_CONSERVEES = 7
+ANALYSE_LIMITE_LIGNES = 1000  # PRAGMA analysis_limit : ANALYZE approché, borné par index
+VACUUM_PAGES_PAR_ETAPE = 500  # Pages libérées par transaction de vacuum incrémental
+VACUUM_PAUSE_S = 0.05
+# Tâche -> intervalle (heures) entre deux exécutions
+MAINTENANCE_INTERVALLES_H = {'sauvegarde': 24, 'optimisation': 6, 'purge_modifications': 24, 'vacuum': 24}
+
+
+def _dossier_sauvegardes():
+    return SAUVEGARDE_DOSSIER or os.path.join(os.path.dirname(DB_PATH), 'sauvegardes')
+
+
+def lister_sauvegardes():
+    """Sauvegardes présentes, de la plus récente à la plus ancienne"""
+    dossier = _dossier_sauvegardes()
+    if not os.path.isdir(dossier):
+        return []
+    sauvegardes = []
+    for nom in os.listdir(dossier):
+        if nom.startswith('data-') and nom.endswith('.db'):
+            chemin = os.path.join(dossier, nom)
+            sauvegardes.append({'fichier': chemin, 'octets': os.path.getsize(chemin),
+                                'date': datetime.fromtimestamp(os.path.getmtime(chemin)).isoformat(timespec='seconds')})
+    return sorted(sauvegardes, key=lambda sauvegarde: sauvegarde['fichier'], reverse=True)
+
+
+def sauvegarder_base():
+    """Copie cohérente de la base par l'API de sauvegarde SQLite, par petites étapes
+
+    La copie est lue par une connexion dédiée ; entre deux étapes le verrou de
+    lecture est relâché et le thread écrivain continue (WAL : une étape ne le
+    bloque pas non plus). Si la base change entre deux étapes, SQLite reprend
+    la copie. Le fichier n'est renommé qu'après un quick_check réussi.
+    """
+    dossier = _dossier_sauvegardes()
+    os.makedirs(dossier, exist_ok=True)
+    # Microsecondes : une sauvegarde manuelle et une planifiée ne s'écrasent
+    # pas, et l'ordre des noms reste celui des dates
+    chemin = os.path.join(dossier, f"data-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.db")
+    partiel = chemin + '.partiel'
+    etapes = 0
+
+    def progression(statut, restantes, total):
+        nonlocal etapes
+        etapes += 1
+
+    source = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+    destination = sqlite3.connect(partiel)
+    try:
+        source.backup(destination, pages=SAUVEGARDE_PAGES_PAR_ETAPE, progress=progression,
+                      sleep=SAUVEGARDE_PAUSE_S)
+        verification = destination.execute('PRAGMA quick_check').fetchone()[0]
+        pages = destination.execute('PRAGMA page_count').fetchone()[0]
+    finally:
+        destination.close()
+        source.close()
+    if verification != 'ok':
+        os.remove(partiel)
+        raise RuntimeError(f'Sauvegarde invalide: {verification}')
+    os.replace(partiel, chemin)
+
+    supprimees = []
+    for sauvegarde in lister_sauvegardes()[SAUVEGARDES_CONSERVEES:]:
+        os.remove(sauvegarde['fichier'])
+        supprimees.append(sauvegarde['fichier'])
+    return {'fichier': chemin, 'octets': os.path.getsize(chemin), 'pages': pages,
+            'etapes': etapes, 'supprimees': supprimees, 'partitions': sauvegarder_partitions(dossier)}
+
+
+def optimiser_base():
+    """PRAGMA optimize sur toutes les tables : ANALYZE (borné) de celles qui en ont besoin"""
+    def optimiser(conn):
+        conn.execute(f'PRAGMA analysis_limit={ANALYSE_LIMITE_LIGNES}')
+        # 0x10000 : examiner toutes les tables, pas seulement celles lues par cette connexion
+        conn.execute('PRAGMA optimize(0x10002)')
+        return conn.execute('SELECT COUNT(DISTINCT tbl) FROM sqlite_stat1').fetchone()[0]
+
+    return {'tables_analysees': ecrivain.executer(None, optimiser)}
+
+
+def _etape_vacuum(conn):
+    # incremental_vacuum libère une page par pas d'exécution, mais sqlite3
+    # s'arrête au premier pas (aucune colonne) : une page par exécution
+    libres = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    for _ in range(min(libres, VACUUM_PAGES_PAR_ETAPE)):
+        conn.execute('PRAGMA incremental_vacuum(1)')
+    return conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+def vacuum_incremental():
+    """Rendre les pages libres au système, par petites transactions du thread écrivain"""
+    conn = get_connection()
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        return {'pages_liberees': 0,
+                'remarque': 'auto_vacuum incrémental inactif (voir --activer-vacuum-incremental)'}
+    libres = debut = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    etapes = 0
+    while libres:
+        libres = ecrivain.executer(None, _etape_vacuum)
+        etapes += 1
+        time.sleep(VACUUM_PAUSE_S)
+    # Le fichier ne raccourcit qu'au report du WAL dans la base ; PASSIVE
+    # n'attend ni les lecteurs ni l'écrivain
+    occupe, _, reportees = conn.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+    return {'pages_liberees': debut, 'etapes': etapes,
+            'octets_liberes': debut * conn.execute('PRAGMA page_size').fetchone()[0],
+            'checkpoint_complet': occupe == 0 and reportees >= 0, 'octets_fichier': os.path.getsize(DB_PATH)}
+
+
+def activer_vacuum_incremental():
+    """Passer une base existante en auto_vacuum incrémental (VACUUM complet, une seule fois)
+
+    Commande explicite (--activer-vacuum-incremental), serveur arrêté : VACUUM
+    bloque les écritures le temps de réécrire le fichier et demande autant
+    d'espace disque libre que la base. Une base neuve est créée directement
+    en mode incrémental.
+    """
+    conn = get_connection()
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        return False
+    journal.info("Conversion de la base en vacuum incrémental (VACUUM complet)...")
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+    return True
+
+
+def _lire_fenetre(fenetre):
+    """'HH:MM-HH:MM' -> (début, fin) en minutes depuis minuit ; '' -> None (à toute heure)"""
+    if not fenetre:
+        return None
+    try:
+        bornes = []
+        for borne in fenetre.split('-'):
+            heures, minutes = (int(valeur) for valeur in borne.strip().split(':'))
+            if not (0 <= heures < 24 and 0 <= minutes < 60):
+                raise ValueError(borne)
+            bornes.append(heures * 60 + minutes)
+        debut, fin = bornes
+    except ValueError:
+        raise ValueError(f"Fenêtre de maintenance non valide: {fenetre} (format HH:MM-HH:MM)")
+    return debut, fin
+
+
+class PlanificateurMaintenance:
+    """Thread qui lance les tâches de maintenance échues pendant la fenêtre autorisée
+
+    Une seule tâche s'exécute à la fois, qu'elle soit planifiée ou demandée
+    par /api/maintenance. Le rapport garde la dernière exécution de chaque
+    tâche et un historique récent.
+    """
+
+    def __init__(self, fenetre=MAINTENANCE_FENETRE, intervalles_h=None):
+        self.taches = {'sauvegarde': sauvegarder_base, 'optimisation': optimiser_base,
+                       'purge_modifications': purger_modifications, 'vacuum': vacuum_incremental}
+        self.intervalles_h = dict(intervalles_h or MAINTENANCE_INTERVALLES_H)
+        self.fenetre = _lire_fenetre(fenetre)
+        self._derniers = {}  # tâche -> rapport de la dernière exécution
+        self._historique = deque(maxlen=50)
+        self._lock = threading.Lock()
+        self._arret = threading.Event()
+        self._thread = None
+
+    def demarrer(self):
+        # Après un redémarrage, la dernière sauvegarde est celle du dossier
+        sauvegardes = lister_sauvegardes()
+        if sauvegardes:
+            self._derniers.setdefault('sauvegarde', {'tache': 'sauvegarde', 'debut': sauvegardes[0]['date'],
+                                                     'ok': True, 'fichier': sauvegardes[0]['fichier']})
+        self._thread = threading.Thread(target=self._boucle, name='maintenance', daemon=True)
+        self._thread.start()
+
+    def arreter(self):
+        self._arret.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def dans_fenetre(self, maintenant=None):
+        if self.fenetre is None:
+            return True
+        maintenant = maintenant or datetime.now()
+        minute = maintenant.hour * 60 + maintenant.minute
+        debut, fin = self.fenetre
+        # Une fenêtre comme 22:00-02:00 passe minuit
+        return debut <= minute < fin if debut <= fin else minute >= debut or minute < fin
+
+    def _echue(self, tache):
+        dernier = self._derniers.get(tache)
+        if dernier is None:
+            return True
+        ecoule = datetime.now() - datetime.fromisoformat(dernier['debut'])
+        return ecoule.total_seconds() >= self.intervalles_h[tache] * 3600
+
+    def _boucle(self):
+        while not self._arret.wait(MAINTENANCE_VERIFICATION_S):
+            if not self.dans_fenetre():
+                continue
+            for tache in self.taches:
+                if self._arret.is_set():
+                    return
+                if self._echue(tache):
+                    self.executer(tache)
+
+    def executer(self, tache):
+        """Exécuter une tâche maintenant et renvoyer son rapport"""
+        with self._lock:
+            debut = datetime.now()
+            chrono = time.perf_counter()
+            try:
+                details = self.taches[tache]()
+                ok = True
+            except Exception as e:
+                details = {'erreur': str(e)}
+                ok = False
+            rapport = {'tache': tache, 'debut': debut.isoformat(timespec='seconds'),
+                       'duree_s': round(time.perf_counter() - chrono, 3), 'ok': ok, **details}
+            self._derniers[tache] = rapport
+            self._historique.append(rapport)
+        metriques.incrementer('maintenance_executions_total', tache=tache, resultat='succes' if ok else 'echec')
+        if ok:
+            journal.info("Maintenance %s terminée en %.1f s", tache, rapport['duree_s'], extra={'champs': details})
+        else:
+            journal.error("Maintenance %s en échec: %s", tache, details['erreur'])
+        return rapport
+
+    def rapport(self):
+        with self._lock:
+            derniers = dict(self._derniers)
+            historique = list(self._historique)
+        fenetre = self.fenetre and '%02d:%02d-%02d:%02d' % (*divmod(self.fenetre[0], 60), *divmod(self.fenetre[1], 60))
         return {
-            'ok': True,
-            'data': results,
-            'total': total,
-            'returned': len(results)
+            'actif': self._thread is not None and self._thread.is_alive(),
+            'fenetre': fenetre,
+            'taches': {tache: {'intervalle_h': self.intervalles_h[tache], 'derniere': derniers.get(tache)}
+                       for tache in self.taches},
+            'historique': historique[::-1],
+            'sauvegardes': lister_sauvegardes(),
+            'doublons_sans_empreinte': doublons_sans_empreinte(),
         }
-    except Exception as e:
-        conn.close()
-        return {'ok': False, 'error': f'Erreur lors de la récupération des données: {str(e)}'}
 
-def main():
-    print(f"Demarrage de l'API locale pour les certificats medicaux...")
-    print(f"Disponible sur: http://localhost:{PORT}")
-    print(f"Base de donnees: {DB_PATH}")
-    print("=" * 50)
-    
-    # Vérifier si la base de données existe, sinon la créer
-    if not os.path.exists(DB_PATH):
-        print("Base de données non trouvée, création en cours...")
-        init_db()
-        print("Base de données créée avec succès!")
-    
-    with socketserver.TCPServer(("", PORT), APIHandler) as httpd:
-        print("Serveur démarré. Appuyez sur Ctrl+C pour arrêter.")
+
+planificateur = PlanificateurMaintenance()
+metriques.decrire('maintenance_executions_total', 'counter', "Tâches de maintenance exécutées, par résultat")
+
+
+# Routage des endpoints : chemin -> fonction, résolu par un seul accès au dict.
+# Une fonction de route reçoit le corps JSON décodé et renvoie (response, status),
+# une ReponseFlux (envoi chunked) ou une ReponseEnCache (cache des lectures).
+ROUTES_GET = {}
+ROUTES_POST = {}
+
+ReponseFlux = namedtuple('ReponseFlux', 'morceaux content_type headers',
+                         defaults=('application/json', None))
+ReponseEnCache = namedtuple('ReponseEnCache', 'tables calculer')
+
+
+def route_get(chemin):
+    """Enregistrer un endpoint GET : fonction() -> (response, status)"""
+    def enregistrer(fonction):
+        ROUTES_GET[chemin] = fonction
+        return fonction
+    return enregistrer
+
+
+def route_post(chemin, cle_erreur='error', journaliser=True):
+    """Enregistrer un endpoint POST : fonction(data) -> réponse
+
+    cle_erreur est la clé du message en cas d'erreur serveur (500) ;
+    journaliser=False exclut le corps reçu du journal, même avec --log-corps (lots volumineux).
+    """
+    def enregistrer(fonction):
+        ROUTES_POST[chemin] = (fonction, cle_erreur, journaliser)
+        return fonction
+    return enregistrer
+
+
+def _reponse(result, cles=(), **champs):
+    """(response, status) d'un résultat {'ok': ...} : 200 avec les clés demandées, sinon 400"""
+    if not result['ok']:
+        return {'success': False, 'error': result['error']}, 400
+    response = {'success': True, **champs}
+    response.update((cle, result[cle]) for cle in cles if cle in result)
+    return response, 200
+
+
+@route_get('/api/test')
+def _route_test():
+    return {'success': True, 'message': 'API locale fonctionnelle'}, 200
+
+
+@route_get('/api/metrics')
+def _route_metrics():
+    return ReponseFlux([metriques.exporter().encode('utf-8')], 'text/plain; version=0.0.4; charset=utf-8')
+
+
+@route_get('/api/maintenance')
+def _route_rapport_maintenance():
+    return {'success': True, 'data': planificateur.rapport()}, 200
+
+
+@route_post('/api/maintenance')
+def _route_executer_maintenance(data):
+    tache = data.get('tache', '')
+    if tache not in planificateur.taches:
+        return {'success': False, 'error': f'Tâche non valide. Tâches valides: {list(planificateur.taches)}'}, 400
+    rapport = planificateur.executer(tache)
+    if not rapport['ok']:
+        return {'success': False, 'error': rapport['erreur'], 'data': rapport}, 500
+    return {'success': True, 'data': rapport}, 200
+
+
+@route_post('/api/modifications')
+def _route_modifications(data):
+    def calculer():
+        result = lister_modifications(
+            since=data.get("since", 0),
+            limit=data.get("limit", 500),
+            tables=data.get("tables")
+        )
+        if result.get('resync_required'):
+            return {'success': False, 'error': result['error'], 'resync_required': True,
+                    'last_seq': result['last_seq']}, 410
+        return _reponse(result, ('data', 'returned', 'has_more', 'next_since', 'last_seq'))
+
+    return ReponseEnCache(tuple(REGISTRE_CERTIFICATS) + ('modifications',), calculer)
+
+
+def _route_ajouter(table, data):
+    success, message = ajouter_certificat(table, data)
+    if REGISTRE_CERTIFICATS[table].ajout_toujours_200:
+        return {'success': success, 'message': message}, 200
+    if success:
+        return {'success': True, 'message': message}, 200
+    return {'success': False, 'error': message}, 400
+
+
+# Un endpoint d'ajout par type de certificat du registre
+for _type_certificat in REGISTRE_CERTIFICATS.values():
+    route_post(_type_certificat.route_ajout,
+               cle_erreur='message' if _type_certificat.ajout_toujours_200 else 'error')(
+        functools.partial(_route_ajouter, _type_certificat.table))
+
+
+@route_post('/api/modifier_enregistrement')
+def _route_modifier_enregistrement(data):
+    table = data.get("table", "")
+    erreur = _verifier_table(table)
+    if erreur:
+        return {'success': False, 'error': erreur}, 400
+    return _reponse(modifier_certificat(table, data.get("data", {})),
+                    message='Enregistrement modifié avec succès')
+
+
+@route_post('/api/modifier_dece')
+def _route_modifier_dece(data):
+    return _reponse(modifier_certificat('dece', data), message='Certificat de décès modifié avec succès')
+
+
+@route_post('/api/supprimer_enregistrement')
+def _route_supprimer_enregistrement(data):
+    return _reponse(supprimer_enregistrement(table=data.get("table", ""), record_id=data.get("id", 0)),
+                    message='Enregistrement supprimé avec succès')
+
+
+@route_post('/api/supprimer_dece')
+def _route_supprimer_dece(data):
+    return _reponse(supprimer_dece(record_id=data.get("id", 0)),
+                    message='Certificat de décès supprimé avec succès')
+
+
+@route_post('/api/recuperer_donnees')
+def _route_recuperer_donnees(data):
+    # Mode flux : les lignes sont envoyées au fil de la lecture
+    if data.get("stream"):
+        erreur = _valider_periode(data.get("table", ""), data.get("date_debut", ""), data.get("date_fin", ""))
+        if not erreur:
+            try:
+                colonnes = _projection(data["table"], data.get("fields"))
+                _valider_format(data.get("format", "objects"))
+            except ValueError as e:
+                erreur = str(e)
+        if erreur:
+            return {'success': False, 'error': erreur}, 400
+        return ReponseFlux(flux_donnees_entre_dates(
+            table=data["table"],
+            date_debut=data["date_debut"],
+            date_fin=data["date_fin"],
+            colonnes=colonnes,
+            format_reponse=data.get("format", "objects")
+        ))
+
+    def calculer():
+        return _reponse(recuperer_donnees_entre_dates(
+            table=data.get("table", ""),
+            date_debut=data.get("date_debut", ""),
+            date_fin=data.get("date_fin", ""),
+            limit=data.get("limit"),
+            cursor_token=data.get("cursor"),
+            champs=data.get("fields"),
+            format_reponse=data.get("format", "objects")
+        ), ('data', 'columns', 'total', 'returned', 'has_more', 'next_cursor'))
+
+    return ReponseEnCache((data.get("table", ""),), calculer)
+
+
+@route_post('/api/lister_dece')
+def _route_lister_dece(data):
+    def calculer():
+        # Sans période : registre complet paginé par curseur
+        if "dateDebut" not in data and "dateFin" not in data:
+            result = lister_dece(
+                limit=data.get("limit", 20),
+                cursor_token=data.get("cursor"),
+                total=data.get("total", "aucun"),
+                champs=data.get("fields"),
+                format_reponse=data.get("format", "objects"),
+                offset=data.get("offset")
+            )
+        else:
+            result = lister_dece_par_periode(
+                date_debut=data.get("dateDebut", ""),
+                date_fin=data.get("dateFin", ""),
+                champs=data.get("fields"),
+                format_reponse=data.get("format", "objects")
+            )
+        return _reponse(result, ('data', 'columns', 'total', 'returned', 'has_more', 'next_cursor',
+                                 'offset', 'limit'))
+
+    return ReponseEnCache(('dece',), calculer)
+
+
+@route_post('/api/ajouter_lot', journaliser=False)
+def _route_ajouter_lot(data):
+    records = data.get("records")
+    journal.info("Lot reçu: table %s, %s enregistrements",
+                 data.get('table', ''), len(records) if isinstance(records, list) else 0)
+    return _reponse(ajouter_lot(table=data.get("table", ""), records=records),
+                    ('inserted', 'duplicate', 'invalid', 'results'))
+
+
+@route_post('/api/statistiques')
+def _route_statistiques(data):
+    def calculer():
+        return _reponse(calculer_statistiques(
+            table=data.get("table", ""),
+            date_debut=data.get("date_debut", ""),
+            date_fin=data.get("date_fin", ""),
+            grouper_par=data.get("grouper_par"),
+            periode=data.get("periode")
+        ), ('data', 'total'))
+
+    return ReponseEnCache((data.get("table", ""),), calculer)
+
+
+@route_post('/api/rechercher')
+def _route_rechercher(data):
+    return _reponse(rechercher_patients(
+        texte=data.get("q", ""),
+        tables=data.get("tables"),
+        limit=data.get("limit", 20),
+        offset=data.get("offset", 0)
+    ), ('data', 'returned', 'has_more'))
+
+
+@route_post('/api/historique_patient')
+def _route_historique_patient(data):
+    return _reponse(historique_patient(
+        nom=data.get("nom", ""),
+        prenom=data.get("prenom", ""),
+        date_naissance=data.get("date_naissance")
+    ), ('cle_patient', 'data', 'total'))
+
+
+@route_post('/api/exporter')
+def _route_exporter(data):
+    table = data.get("table", "")
+    format_export = data.get("format", "xlsx")
+    result = preparer_export(
+        table=table,
+        date_debut=data.get("date_debut", ""),
+        date_fin=data.get("date_fin", ""),
+        format_export=format_export,
+        colonnes=data.get("colonnes")
+    )
+    if not result['ok']:
+        return {'success': False, 'error': result['error']}, 400
+
+    # Le fichier est produit au fil de la lecture, jamais en entier en mémoire
+    if format_export == 'csv':
+        flux = flux_export_csv(table, data["date_debut"], data["date_fin"], result['colonnes'])
+        content_type = 'text/csv; charset=utf-8'
+    else:
+        flux = flux_export_xlsx(table, data["date_debut"], data["date_fin"], result['colonnes'])
+        content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    nom_fichier = f"donnees_{table}_{datetime.now().strftime('%Y-%m-%d')}.{format_export}"
+    return ReponseFlux(flux, content_type, {
+        'Content-Disposition': f'attachment; filename="{nom_fichier}"',
+        'Access-Control-Expose-Headers': 'Content-Disposition'
+    })
+
+
+# Mode asyncio : les sockets sont servies par une boucle d'événements, seul le
+# traitement d'une requête complète (routes, SQLite) occupe un thread du pool
+TAILLE_MAX_ENTETES = 64 * 1024  # Octets maximum de la ligne de requête et des en-têtes
+TAILLE_MORCEAU_SORTIE = 64 * 1024  # Octets accumulés par le thread avant remise à la boucle
+_CONTENT_LENGTH = re.compile(rb'\r\ncontent-length:[ \t]*(\d+)', re.IGNORECASE)
+
+
+class SortieAsync:
+    """wfile d'APIHandler en mode asyncio : les octets sont remis à la boucle par morceaux
+
+    File bornée : un client lent freine la production d'une réponse en flux
+    au lieu de la laisser grossir en mémoire.
+    """
+
+    def __init__(self, boucle, file):
+        self._boucle = boucle
+        self._file = file
+        self._tampon = []
+        self._taille = 0
+        self.fermee = False  # Client parti : les écritures suivantes échouent
+
+    def write(self, donnees):
+        if self.fermee:
+            raise BrokenPipeError("Connexion fermée par le client")
+        self._tampon.append(bytes(donnees))
+        self._taille += len(donnees)
+        if self._taille >= TAILLE_MORCEAU_SORTIE:
+            self.envoyer()
+        return len(donnees)
+
+    def flush(self):
+        # Appelé aussi en fin de requête par handle_one_request : la fin de la
+        # réponse reste dans le tampon et part avec le résultat du thread
+        if self._taille >= TAILLE_MORCEAU_SORTIE:
+            self.envoyer()
+
+    def envoyer(self):
+        if self._tampon:
+            asyncio.run_coroutine_threadsafe(self._file.put(self.reste()), self._boucle).result()
+
+    def reste(self):
+        """Octets non remis à la boucle (vide le tampon)"""
+        morceau = b''.join(self._tampon)
+        self._tampon = []
+        self._taille = 0
+        return morceau
+
+
+def _traiter_requete_async(requete, sortie, client_address):
+    """Exécuter APIHandler sur une requête déjà lue (dans un thread du pool)
+
+    Renvoie (fin de la réponse, True si la connexion doit être fermée).
+    """
+    gestionnaire = APIHandler.__new__(APIHandler)
+    gestionnaire.client_address = client_address
+    gestionnaire.server = None
+    gestionnaire.rfile = io.BytesIO(requete)
+    gestionnaire.wfile = sortie
+    gestionnaire.close_connection = True
+    gestionnaire.handle_one_request()
+    return sortie.reste(), gestionnaire.close_connection
+
+
+class ServeurAsync:
+    """Serveur HTTP/1.1 asyncio : mêmes routes et même APIHandler que le mode threads
+
+    Les connexions keep-alive inactives ne coûtent qu'une coroutine ; les
+    requêtes en cours sont bornées à workers + queue_size, au-delà la lecture
+    des requêtes suivantes attend.
+    """
+
+    def __init__(self, workers=WORKERS, queue_size=ACCEPT_QUEUE):
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api-worker')
+        self._places = asyncio.Semaphore(workers + queue_size)
+        self._ouvertes = 0
+        self._actives = 0
+        metriques.jauge('api_connexions', "Connexions ouvertes (keep-alive comprises) et requêtes en traitement",
+                        lambda: {(('etat', 'ouverte'),): self._ouvertes,
+                                 (('etat', 'active'),): self._actives})
+
+    async def servir(self, port):
+        serveur = await asyncio.start_server(self._connexion, '', port, limit=TAILLE_MAX_ENTETES,
+                                             reuse_address=True)
+        async with serveur:
+            await serveur.serve_forever()
+
+    def fermer(self):
+        self._executor.shutdown(wait=True)
+
+    async def _connexion(self, reader, writer):
+        self._ouvertes += 1
+        client_address = writer.get_extra_info('peername')[:2]
+        try:
+            while await self._requete(reader, writer, client_address):
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+            pass
+        finally:
+            self._ouvertes -= 1
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def _requete(self, reader, writer, client_address):
+        """Lire puis traiter une requête ; renvoie False pour fermer la connexion"""
+        try:
+            entetes = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEPALIVE_TIMEOUT)
+        except asyncio.IncompleteReadError:
+            return False  # Client parti entre deux requêtes
+        longueur = _CONTENT_LENGTH.search(entetes)
+        corps = b''
+        if longueur:
+            corps = await asyncio.wait_for(reader.readexactly(int(longueur.group(1))), KEEPALIVE_TIMEOUT)
+
+        async with self._places:
+            self._actives += 1
+            try:
+                return not await self._repondre(entetes + corps, writer, client_address)
+            finally:
+                self._actives -= 1
+
+    async def _repondre(self, requete, writer, client_address):
+        """Traiter la requête dans le pool en écrivant la réponse au fil des morceaux"""
+        boucle = asyncio.get_running_loop()
+        file = asyncio.Queue(maxsize=4)
+        sortie = SortieAsync(boucle, file)
+        traitement = boucle.run_in_executor(self._executor, _traiter_requete_async,
+                                            requete, sortie, client_address)
+        try:
+            while True:
+                lecture = asyncio.ensure_future(file.get())
+                termines, _ = await asyncio.wait({lecture, traitement}, return_when=asyncio.FIRST_COMPLETED)
+                if lecture not in termines:
+                    lecture.cancel()
+                    break
+                writer.write(lecture.result())
+                await writer.drain()
+            while not file.empty():
+                writer.write(file.get_nowait())
+            reste, fermer = await traitement
+            writer.write(reste)
+            await writer.drain()
+        except ConnectionError:
+            # Débloquer le thread qui attend de la place dans la file
+            sortie.fermee = True
+            while not traitement.done():
+                while not file.empty():
+                    file.get_nowait()
+                await asyncio.wait({traitement}, timeout=0.05)
+            raise
+        return fermer
+
+
+async def _servir_asyncio(port, workers, queue_size):
+    serveur = ServeurAsync(workers, queue_size)
+    try:
+        await serveur.servir(port)
+    finally:
+        serveur.fermer()
+
+
+def main(argv=None):
+    global DB_PATH, JOURNAL_CORPS, SAUVEGARDE_DOSSIER, PARTITIONS_DOSSIER, planificateur
+    parser = argparse.ArgumentParser(description="API locale pour les certificats médicaux")
+    parser.add_argument('--port', type=int, default=PORT, help="Port d'écoute")
+    parser.add_argument('--db', default=DB_PATH, help="Fichier de la base SQLite")
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help="Nombre de threads de traitement des requêtes")
+    parser.add_argument('--queue', type=int, default=ACCEPT_QUEUE,
+                        help="Nombre maximal de connexions en attente d'un thread")
+    parser.add_argument('--mode', choices=('threads', 'asyncio'), default='threads',
+                        help="threads : un thread par connexion ; asyncio : boucle d'événements, "
+                             "un thread seulement pendant le traitement d'une requête")
+    parser.add_argument('--fenetre-ecriture-ms', type=float, default=ECRITURE_FENETRE_MS,
+                        help="Attente (ms) d'autres écritures à valider dans la même transaction")
+    parser.add_argument('--maintenance-fenetre', default=MAINTENANCE_FENETRE,
+                        help="Plage HH:MM-HH:MM des tâches de maintenance planifiées ('' : à toute heure)")
+    parser.add_argument('--sans-maintenance', action='store_true',
+                        help="Ne pas planifier la maintenance (POST /api/maintenance reste disponible)")
+    parser.add_argument('--dossier-sauvegardes', default=SAUVEGARDE_DOSSIER,
+                        help="Dossier des sauvegardes (par défaut: « sauvegardes » à côté de la base)")
+    parser.add_argument('--dossier-partitions', default=PARTITIONS_DOSSIER,
+                        help="Dossier des partitions annuelles (par défaut: « partitions » à côté de la base)")
+    parser.add_argument('--reconstruire-stats', action='store_true',
+                        help="Recalculer les cumuls journaliers puis quitter")
+    parser.add_argument('--activer-vacuum-incremental', action='store_true',
+                        help="Convertir la base en auto_vacuum incrémental (VACUUM complet, "
+                             "espace disque égal à la base) puis quitter")
+    parser.add_argument('--archiver-annee', type=int, metavar='ANNEE',
+                        help=f"Déplacer l'année close ANNEE de {', '.join(TABLES_PARTITIONNEES)} "
+                             "dans sa partition puis quitter")
+    parser.add_argument('--log-niveau', default=JOURNAL_NIVEAU,
+                        choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'), help="Niveau du journal")
+    parser.add_argument('--log-fichier', default=JOURNAL_FICHIER,
+                        help="Fichier journal (rotation par taille) en plus de la sortie standard")
+    parser.add_argument('--log-json', action='store_true', help="Journal en lignes JSON")
+    parser.add_argument('--log-echantillon', type=int, default=JOURNAL_ECHANTILLON_DEBUG,
+                        help="N'écrire qu'une entrée DEBUG sur N")
+    parser.add_argument('--log-corps', action='store_true',
+                        help="Journaliser le corps des requêtes POST (niveau DEBUG, champs sensibles masqués)")
+    args = parser.parse_args(argv)
+    DB_PATH = os.path.abspath(args.db)
+    JOURNAL_CORPS = args.log_corps
+    ecrivain.fenetre = args.fenetre_ecriture_ms / 1000
+    SAUVEGARDE_DOSSIER = args.dossier_sauvegardes and os.path.abspath(args.dossier_sauvegardes)
+    PARTITIONS_DOSSIER = args.dossier_partitions and os.path.abspath(args.dossier_partitions)
+    try:
+        planificateur = PlanificateurMaintenance(args.maintenance_fenetre)
+    except ValueError as e:
+        parser.error(str(e))
+    configurer_journalisation(args.log_niveau, args.log_fichier, args.log_json, args.log_echantillon)
+
+    try:
+        journal.info("Demarrage de l'API locale pour les certificats medicaux...")
+        journal.info("Disponible sur: http://localhost:%s", args.port)
+        journal.info("Base de donnees: %s", DB_PATH)
+        journal.info("Mode: %s - Threads: %s - File d'attente: %s", args.mode, args.workers, args.queue)
+
+        # Créer la base si nécessaire puis appliquer les migrations, y compris
+        # sur une base existante
+        if not os.path.exists(DB_PATH):
+            journal.info("Base de données non trouvée, création en cours...")
+            init_db()
+            # Base vide : le VACUUM de conversion est immédiat
+            activer_vacuum_incremental()
+            journal.info("Base de données créée avec succès!")
+        else:
+            init_db()
+        migrate_db()
+
+        if args.activer_vacuum_incremental:
+            if not activer_vacuum_incremental():
+                journal.info("La base est déjà en vacuum incrémental")
+            db_pool.close_all()
+            return
+
+        if args.reconstruire_stats:
+            nombre = reconstruire_stats_journalieres()
+            journal.info("Cumuls journaliers reconstruits: %s lignes", nombre)
+            db_pool.close_all()
+            return
+
+        if args.archiver_annee is not None:
+            try:
+                rapport = archiver_annee(args.archiver_annee)
+            except ValueError as e:
+                journal.error("%s", e)
+                sys.exit(1)
+            journal.info("Année %s archivée dans %s", rapport['annee'], rapport['fichier'],
+                         extra={'champs': rapport})
+            db_pool.close_all()
+            return
+
+        if not args.sans_maintenance:
+            planificateur.demarrer()
+        journal.info("Serveur démarré. Appuyez sur Ctrl+C pour arrêter.")
         try:
-            httpd.serve_forever()
+            if args.mode == 'asyncio':
+                asyncio.run(_servir_asyncio(args.port, args.workers, args.queue))
+            else:
+                with ThreadPoolHTTPServer(("", args.port), APIHandler,
+                                          workers=args.workers, queue_size=args.queue) as httpd:
+                    httpd.serve_forever()
         except KeyboardInterrupt:
-            print("\nArrêt du serveur...")
+            journal.info("Arrêt du serveur...")
+        planificateur.arreter()
+        ecrivain.arreter()
+        db_pool.close_all()
+    finally:
+        arreter_journalisation()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Banc de mesure de l'API locale (api_simple.py)
+
+Démarre le serveur sur une base temporaire remplie de données synthétiques,
+puis mesure le débit et les latences (p50/p95/p99) de chaque scénario sous
+plusieurs niveaux de concurrence. Les résultats sont écrits en JSON pour être
+comparés d'un commit à l'autre.
+
+    python benchmark_api.py --lignes 5000 --concurrence 1,4,16 --sortie resultats.json
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+API_SIMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api_simple.py')
+
+NOMS = ['Benali', 'Bouzid', 'Haddad', 'Khelifi', 'Mansouri', 'Saidi', 'Touati', 'Zerrouki',
+        'Belkacem', 'Cherif', 'Djebbar', 'Ferhat', 'Guerfi', 'Hamidi', 'Larbi', 'Meziane']
+PRENOMS = ['Amine', 'Fatima', 'Karim', 'Nadia', 'Yacine', 'Samira', 'Mohamed', 'Amel',
+           'Hélène', 'Sofiane', 'Leila', 'Rachid', 'Imane', 'Walid', 'Meriem', 'Nabil']
+MEDECINS = ['Dr Amrani', 'Dr Bensaid', 'Dr Chaoui', 'Dr Derradji', 'Dr Essaid']
+WILAYAS = ['Alger', 'Oran', 'Constantine', 'Blida', 'Sétif', 'Tlemcen', 'Béjaïa', 'Batna']
+CAUSES = [('Infarctus du myocarde', 'I21'), ('Accident vasculaire cérébral', 'I64'),
+          ('Insuffisance cardiaque', 'I50'), ('Pneumopathie', 'J18'),
+          ('Cancer du poumon', 'C34'), ('Diabète compliqué', 'E11'),
+          ('Insuffisance rénale chronique', 'N18'), ('Traumatisme crânien', 'S06')]
+
+DEBUT_PERIODE = date(2024, 1, 1)
+JOURS_PERIODE = 365
+
+
+def _date(alea):
+    return (DEBUT_PERIODE + timedelta(days=alea.randrange(JOURS_PERIODE))).isoformat()
+
+
+def _naissance(alea):
+    return (date(1935, 1, 1) + timedelta(days=alea.randrange(30000))).isoformat()
+
+
+def generer_arret(alea, numero):
+    """Arrêt de travail synthétique ; numero, ajouté au nom (clé de doublon), le rend unique"""
+    return {
+        'nom': f'{alea.choice(NOMS)} {numero}', 'prenom': alea.choice(PRENOMS), 'medecin': alea.choice(MEDECINS),
+        'nombre_jours': alea.randint(1, 30), 'date_certificat': _date(alea),
+        'date_naissance': _naissance(alea), 'age': str(numero),
+    }
+
+
+def generer_dece(alea, numero):
+    """Certificat de décès synthétique avec les champs usuels renseignés"""
+    cause, cim = alea.choice(CAUSES)
+    wilaya = alea.choice(WILAYAS)
+    return {
+        'nom': alea.choice(NOMS), 'prenom': alea.choice(PRENOMS), 'dateNaissance': _naissance(alea),
+        'sexe': alea.choice(['M', 'F']), 'pere': alea.choice(PRENOMS), 'mere': alea.choice(PRENOMS),
+        'communeNaissance': wilaya, 'wilaya_naissance': wilaya, 'wilayaResidence': wilaya,
+        'communeResidence': wilaya, 'dateDeces': _date(alea),
+        'heureDeces': f'{alea.randrange(24):02d}:{alea.randrange(60):02d}',
+        'lieuDeces': alea.choice(['Hôpital', 'Domicile', 'Voie publique']),
+        'communeDeces': wilaya, 'wilayaDeces': wilaya, 'causeDeces': cause,
+        'causeDirecte': cause, 'natureMort': 'Naturelle', 'CIM1': cim,
+        'nom_ar': 'بن علي', 'prenom_ar': 'محمد', 'profession': 'Retraité',
+        'adresse': f'{numero} rue de la République', 'medecin': alea.choice(MEDECINS),
+    }
+
+
+def port_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class Client:
+    """Connexion keep-alive vers l'API"""
+
+    def __init__(self, port):
+        self.connexion = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+
+    def post(self, chemin, data):
+        corps = json.dumps(data).encode('utf-8')
+        self.connexion.request('POST', chemin, corps, {'Content-Type': 'application/json'})
+        reponse = self.connexion.getresponse()
+        contenu = reponse.read()
+        return reponse.status, contenu
+
+    def fermer(self):
+        self.connexion.close()
+
+
+def demarrer_serveur(db_path, port, workers, mode='threads'):
+    """Lancer api_simple.py sur db_path et attendre qu'il réponde"""
+    processus = subprocess.Popen(
+        [sys.executable, API_SIMPLE, '--db', db_path, '--port', str(port), '--workers', str(workers),
+         '--queue', str(max(workers * 4, 32)), '--mode', mode],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    limite = time.monotonic() + 30
+    while time.monotonic() < limite:
+        if processus.poll() is not None:
+            raise RuntimeError(f'Le serveur s\'est arrêté (code {processus.returncode})')
+        try:
+            connexion = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connexion.request('GET', '/api/test')
+            if connexion.getresponse().status == 200:
+                connexion.close()
+                return processus
+        except OSError:
+            time.sleep(0.1)
+    processus.kill()
+    raise RuntimeError('Le serveur ne répond pas')
+
+
+def remplir_base(port, alea, lignes, lignes_dece):
+    """Données initiales par /api/ajouter_lot"""
+    client = Client(port)
+    for table, generateur, nombre in (('arrets_travail', generer_arret, lignes),
+                                      ('prolongation', generer_arret, lignes),
+                                      ('dece', generer_dece, lignes_dece)):
+        for debut in range(0, nombre, 5000):
+            lot = [generateur(alea, numero) for numero in range(debut, min(nombre, debut + 5000))]
+            status, contenu = client.post('/api/ajouter_lot', {'table': table, 'records': lot})
+            if status != 200:
+                raise RuntimeError(f'Remplissage de {table} impossible: {contenu[:200]!r}')
+    client.fermer()
+
+
+def percentile(valeurs_triees, p):
+    """Percentile par rang le plus proche"""
+    if not valeurs_triees:
+        return None
+    rang = max(0, min(len(valeurs_triees) - 1, int(round(p / 100 * len(valeurs_triees) + 0.5)) - 1))
+    return valeurs_triees[rang]
+
+
+def executer_scenario(port, scenario, concurrence, requetes):
+    """Répartir les requêtes du scénario entre les threads et mesurer chaque appel"""
+    latences = []
+    erreurs = [0]
+    verrou = threading.Lock()
+    depart = threading.Barrier(concurrence + 1)
+
+    def travail(indice):
+        client = Client(port)
+        requete = scenario['preparer'](indice)
+        mesures = []
+        nombre_erreurs = 0
+        depart.wait()
+        for _ in range(indice, requetes, concurrence):
+            chemin, data = requete()
+            debut = time.perf_counter()
+            try:
+                status, contenu = client.post(chemin, data)
+            except OSError:
+                client.fermer()
+                client = Client(port)
+                status, contenu = 0, b''
+            mesures.append(time.perf_counter() - debut)
+            if status not in scenario.get('statuts', (200,)):
+                nombre_erreurs += 1
+            scenario.get('apres', lambda *args: None)(indice, status, contenu)
+        client.fermer()
+        with verrou:
+            latences.extend(mesures)
+            erreurs[0] += nombre_erreurs
+
+    threads = [threading.Thread(target=travail, args=(indice,)) for indice in range(concurrence)]
+    for thread in threads:
+        thread.start()
+    depart.wait()
+    debut = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    duree = time.perf_counter() - debut
+
+    latences.sort()
+    return {
+        'scenario': scenario['nom'],
+        'concurrence': concurrence,
+        'requetes': len(latences),
+        'erreurs': erreurs[0],
+        'duree_s': round(duree, 4),
+        'debit_rps': round(len(latences) / duree, 1) if duree else None,
+        'latence_ms': {
+            'moyenne': round(sum(latences) / len(latences) * 1000, 3) if latences else None,
+            'p50': round(percentile(latences, 50) * 1000, 3) if latences else None,
+            'p95': round(percentile(latences, 95) * 1000, 3) if latences else None,
+            'p99': round(percentile(latences, 99) * 1000, 3) if latences else None,
+            'max': round(latences[-1] * 1000, 3) if latences else None,
+        },
+    }
+
+
+def construire_scenarios(db_path, graine):
+    """Scénarios mesurés, chacun avec un générateur de requêtes par thread"""
+    compteur = iter(range(10 ** 9))
+    verrou_compteur = threading.Lock()
+    ids_crees = []
+    verrou_ids = threading.Lock()
+
+    def numero_unique():
+        with verrou_compteur:
+            return next(compteur)
+
+    def ajout(indice):
+        alea = random.Random(f'ajout-{graine}-{indice}')
+
+        def requete():
+            # Numéros distincts de ceux du remplissage : aucun doublon involontaire
+            return '/api/ajouter_arret_travail', generer_arret(alea, f'bench-{numero_unique()}')
+        return requete
+
+    def doublon(indice):
+        certificat = generer_arret(random.Random(graine), 0)
+        certificat['age'] = 'bench-doublon'
+        return lambda: ('/api/ajouter_arret_travail', certificat)
+
+    def lecture_periode(indice):
+        alea = random.Random(f'lecture-{graine}-{indice}')
+
+        def requete():
+            # Fenêtres variées : la plupart des lectures manquent le cache de réponses
+            debut = DEBUT_PERIODE + timedelta(days=alea.randrange(JOURS_PERIODE - 30))
+            fin = debut + timedelta(days=alea.randint(1, 30))
+            return '/api/recuperer_donnees', {'table': 'dece', 'date_debut': debut.isoformat(),
+                                              'date_fin': fin.isoformat(), 'limit': 100}
+        return requete
+
+    def pagination(indice):
+        etat = {'curseur': None}
+
+        def requete():
+            data = {'limit': 50, 'fields': ['nom', 'prenom', 'dateDeces', 'causeDeces']}
+            if etat['curseur']:
+                data['cursor'] = etat['curseur']
+            return '/api/lister_dece', data
+        pagination.etats[indice] = etat
+        return requete
+    pagination.etats = {}
+
+    def apres_pagination(indice, status, contenu):
+        etat = pagination.etats[indice]
+        try:
+            etat['curseur'] = json.loads(contenu).get('next_cursor') if status == 200 else None
+        except ValueError:
+            etat['curseur'] = None
+
+    def suppression(indice):
+        def requete():
+            with verrou_ids:
+                record_id = ids_crees.pop() if ids_crees else 0
+            return '/api/supprimer_enregistrement', {'table': 'arrets_travail', 'id': record_id}
+        return requete
+
+    def avant_suppression(requetes):
+        # Identifiants des arrêts créés par le scénario d'ajout
+        conn = sqlite3.connect(db_path)
+        ids_crees[:] = [row[0] for row in conn.execute(
+            "SELECT id FROM arrets_travail WHERE age LIKE 'bench-%' ORDER BY id DESC LIMIT ?", (requetes,))]
+        conn.close()
+
+    return [
+        {'nom': 'ajout', 'preparer': ajout},
+        {'nom': 'doublon', 'preparer': doublon, 'statuts': (400,)},
+        {'nom': 'lecture_periode', 'preparer': lecture_periode},
+        {'nom': 'pagination', 'preparer': pagination, 'apres': apres_pagination},
+        {'nom': 'suppression', 'preparer': suppression, 'avant': avant_suppression},
+    ]
+
+
+def version_git():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(API_SIMPLE), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banc de mesure de l'API locale")
+    parser.add_argument('--lignes', type=int, default=5000,
+                        help="Lignes générées pour arrets_travail et prolongation")
+    parser.add_argument('--lignes-dece', type=int, default=5000, help="Certificats de décès générés")
+    parser.add_argument('--requetes', type=int, default=1000, help="Requêtes par scénario et par niveau")
+    parser.add_argument('--concurrence', default='1,8',
+                        help="Niveaux de concurrence, séparés par des virgules")
+    parser.add_argument('--scenarios', default=None,
+                        help="Scénarios à exécuter (par défaut: tous), séparés par des virgules")
+    parser.add_argument('--workers', type=int, default=8, help="Threads du serveur")
+    parser.add_argument('--mode', choices=('threads', 'asyncio'), default='threads', help="Mode du serveur")
+    parser.add_argument('--graine', type=int, default=42, help="Graine des données synthétiques")
+    parser.add_argument('--sortie', default=None, help="Fichier JSON des résultats (par défaut: stdout)")
+    args = parser.parse_args(argv)
+
+    niveaux = [int(niveau) for niveau in args.concurrence.split(',') if niveau.strip()]
+    dossier = tempfile.mkdtemp(prefix='bench_certificats_')
+    db_path = os.path.join(dossier, 'data.db')
+    port = port_libre()
+
+    serveur = demarrer_serveur(db_path, port, args.workers, args.mode)
+    try:
+        print(f"Génération des données ({args.lignes} arrêts/prolongations, {args.lignes_dece} décès)...",
+              file=sys.stderr)
+        remplir_base(port, random.Random(args.graine), args.lignes, args.lignes_dece)
+
+        scenarios = construire_scenarios(db_path, args.graine)
+        if args.scenarios:
+            noms = set(args.scenarios.split(','))
+            scenarios = [scenario for scenario in scenarios if scenario['nom'] in noms]
+
+        resultats = []
+        for concurrence in niveaux:
+            for scenario in scenarios:
+                if 'avant' in scenario:
+                    scenario['avant'](args.requetes)
+                resultat = executer_scenario(port, scenario, concurrence, args.requetes)
+                resultats.append(resultat)
+                latence = resultat['latence_ms']
+                print(f"{scenario['nom']:<16} c={concurrence:<3} {resultat['debit_rps']:>9} req/s  "
+                      f"p50={latence['p50']} ms  p95={latence['p95']} ms  p99={latence['p99']} ms  "
+                      f"erreurs={resultat['erreurs']}", file=sys.stderr)
+    finally:
+        serveur.terminate()
+        serveur.wait(timeout=10)
+        shutil.rmtree(dossier, ignore_errors=True)
+
+    rapport = {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'commit': version_git(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'plateforme': platform.platform(),
+            'parametres': vars(args),
+        },
+        'resultats': resultats,
+    }
+    texte = json.dumps(rapport, ensure_ascii=False, indent=2)
+    if args.sortie:
+        with open(args.sortie, 'w', encoding='utf-8') as fichier:
+            fichier.write(texte)
+    else:
+        print(texte)
+
+
+if __name__ == '__main__':
+    main()
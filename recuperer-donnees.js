@@ -686,12 +686,17 @@ document.addEventListener('DOMContentLoaded', function() {
     }
     
     // Fonction pour exporter vers Excel
-    exportExcelBtn.addEventListener('click', function() {
+    exportExcelBtn.addEventListener('click', async function() {
         if (currentData.length === 0) {
             showError('Aucune donnée à exporter');
             return;
         }
         
+        // Export généré par le serveur (en flux, sans charger les données dans l'onglet)
+        if (await exporterDepuisServeur('xlsx')) {
+            return;
+        }
+        
         // Afficher un message pour indiquer que toutes les données seront exportées
         const totalItems = currentData.length;
         const currentRowsPerPage = window.currentRowsPerPage || rowsPerPage;
@@ -779,6 +784,46 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
     
+    // Fonction pour exporter via l'API (/api/exporter) ; renvoie false en cas d'échec
+    async function exporterDepuisServeur(format) {
+        const table = document.getElementById('table').value;
+        const requestData = {
+            table: table,
+            date_debut: document.getElementById('dateDebut').value,
+            date_fin: document.getElementById('dateFin').value,
+            format: format
+        };
+        
+        try {
+            const response = await fetch('http://127.0.0.1:5000/api/exporter', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify(requestData)
+            });
+            
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            
+            const blob = await response.blob();
+            const dateStr = new Date().toISOString().split('T')[0];
+            const fileName = `donnees_${table}_${dateStr}.${format}`;
+            const link = document.createElement('a');
+            link.href = URL.createObjectURL(blob);
+            link.download = fileName;
+            link.click();
+            setTimeout(() => URL.revokeObjectURL(link.href), 1000);
+            
+            showSuccess(`Fichier ${fileName} téléchargé avec succès`);
+            return true;
+        } catch (error) {
+            console.error('Erreur export serveur, export local utilisé:', error);
+            return false;
+        }
+    }
+    
     // Fonction pour exporter vers CSV (fallback)
     function exportToCSV() {
         const table = document.getElementById('table').value;
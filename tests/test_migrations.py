@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Migration d'une base créée par l'ancien init_db, puis vérification de ce que
+les migrations et leurs triggers tiennent à jour : empreintes de doublon,
+cumuls journaliers, index de recherche, journal des modifications et
+archivage d'une année dans sa partition.
+
+    python -m pytest -q tests
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import api_simple as api  # noqa: E402
+
+# Schéma de la version d'origine (avant les migrations versionnées)
+COLONNES_DECE_ORIGINE = (
+    'nom', 'prenom', 'dateNaissance', 'datePresume', 'wilaya_naissance', 'sexe', 'pere', 'mere',
+    'communeNaissance', 'wilayaResidence', 'place', 'placefr', 'DSG', 'DECEMAT', 'DGRO', 'DACC',
+    'DAVO', 'AGESTATION', 'IDETER', 'GM', 'MN', 'AGEGEST', 'POIDNSC', 'AGEMERE', 'DPNAT', 'EMDPNAT',
+    'communeResidence', 'dateDeces', 'heureDeces', 'lieuDeces', 'autresLieuDeces', 'communeDeces',
+    'wilayaDeces', 'causeDeces', 'causeDirecte', 'etatMorbide', 'natureMort', 'natureMortAutre',
+    'obstacleMedicoLegal', 'contamination', 'prothese', 'POSTOPP2', 'CIM1', 'CIM2', 'CIM3', 'CIM4',
+    'CIM5', 'nom_ar', 'prenom_ar', 'perear', 'merear', 'lieu_naissance', 'conjoint', 'profession',
+    'adresse', 'date_entree', 'heure_entree', 'date_deces', 'heure_deces', 'wilaya_deces', 'medecin',
+    'code_p', 'code_c', 'code_n',
+)
+
+SCHEMA_ORIGINE = [
+    '''CREATE TABLE arrets_travail (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, nom TEXT NOT NULL, prenom TEXT NOT NULL,
+        medecin TEXT NOT NULL, nombre_jours INTEGER NOT NULL, date_certificat DATE NOT NULL,
+        date_naissance TEXT, age INTEGER, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''',
+    '''CREATE TABLE prolongation (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, nom TEXT NOT NULL, prenom TEXT NOT NULL,
+        medecin TEXT NOT NULL, nombre_jours INTEGER NOT NULL, date_certificat DATE NOT NULL,
+        date_naissance TEXT, age INTEGER, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''',
+    '''CREATE TABLE cbv (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, nom TEXT NOT NULL, prenom TEXT NOT NULL,
+        medecin TEXT NOT NULL, date_certificat DATE NOT NULL, heure TEXT, date_naissance TEXT,
+        titre TEXT, examen TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''',
+    '''CREATE TABLE antirabique (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, nom TEXT, prenom TEXT, medecin TEXT, classe TEXT,
+        type_de_vaccin TEXT, shema TEXT, date_de_certificat DATE, date_de_naissance TEXT,
+        animal TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''',
+    'CREATE TABLE dece (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+    + ', '.join(f'{colonne} TEXT' for colonne in COLONNES_DECE_ORIGINE)
+    + ', created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)',
+]
+
+# Lignes saisies avec l'ancienne version ; la deuxième est un doublon de la
+# première (« 03 » stocké comme l'entier 3)
+LIGNES_ORIGINE = [
+    ('arrets_travail', {'nom': 'Benali', 'prenom': 'Amine', 'medecin': 'Dr Amrani', 'nombre_jours': 3,
+                        'date_certificat': '2021-03-10', 'date_naissance': '1980-01-01'}),
+    ('arrets_travail', {'nom': 'Benali', 'prenom': 'Amine', 'medecin': 'Dr Amrani', 'nombre_jours': '03',
+                        'date_certificat': '2021-03-10', 'date_naissance': '1980-01-01'}),
+    ('arrets_travail', {'nom': 'Haddad', 'prenom': 'Nadia', 'medecin': 'Dr Bensaid', 'nombre_jours': 5,
+                        'date_certificat': '2024-05-02'}),
+    ('prolongation', {'nom': 'Haddad', 'prenom': 'Nadia', 'medecin': 'Dr Bensaid', 'nombre_jours': 7,
+                      'date_certificat': '2024-05-07'}),
+    ('cbv', {'nom': 'Khelifi', 'prenom': 'Yacine', 'medecin': 'Dr Chaoui', 'date_certificat': '2024-02-01'}),
+    ('antirabique', {'nom': 'Saidi', 'prenom': 'Karim', 'classe': 'II', 'date_de_certificat': '2024-03-03'}),
+    ('dece', {'nom': 'Touati', 'prenom': 'Leila', 'date_deces': '2021-07-01', 'nom_ar': 'تواتي'}),
+    ('dece', {'nom': 'Zerrouki', 'prenom': 'Rachid', 'date_deces': '2024-01-15', 'medecin': 'Dr Amrani'}),
+]
+
+
+def creer_base_migree(dossier):
+    """Base d'origine remplie de LIGNES_ORIGINE, puis démarrage : init_db() et migrations"""
+    chemin = os.path.join(dossier, 'data.db')
+    conn = sqlite3.connect(chemin)
+    for sql in SCHEMA_ORIGINE:
+        conn.execute(sql)
+    for table, valeurs in LIGNES_ORIGINE:
+        conn.execute(f'INSERT INTO {table} ({", ".join(valeurs)}) VALUES ({", ".join("?" for _ in valeurs)})',
+                     tuple(valeurs.values()))
+    conn.commit()
+    conn.close()
+
+    api.DB_PATH = chemin
+    api.init_db()
+    api.migrate_db()
+    return api.get_connection()
+
+
+def fermer_base():
+    api.ecrivain.arreter()
+    api.db_pool.close_all()
+
+
+class BaseMigree(unittest.TestCase):
+    def setUp(self):
+        self.dossier = tempfile.mkdtemp(prefix='test_migrations_')
+        self.conn = creer_base_migree(self.dossier)
+
+    def tearDown(self):
+        fermer_base()
+        shutil.rmtree(self.dossier, ignore_errors=True)
+
+    def compter(self, table, condition='1', params=()):
+        return self.conn.execute(f'SELECT COUNT(*) FROM {table} WHERE {condition}', params).fetchone()[0]
+
+
+class TestMigrations(BaseMigree):
+    def test_version_du_schema(self):
+        self.assertEqual(self.conn.execute('PRAGMA user_version').fetchone()[0], api.MIGRATIONS[-1][0])
+
+    def test_empreintes(self):
+        for table, colonnes in api.CLES_DOUBLON.items():
+            for row in self.conn.execute(f'SELECT id, empreinte, {", ".join(colonnes)} FROM {table}'):
+                if row['empreinte'] is not None:
+                    self.assertEqual(row['empreinte'], api.calculer_empreinte(table, dict(zip(colonnes, row[2:]))))
+        # Le doublon d'origine reste sans empreinte et est signalé
+        self.assertEqual(api.doublons_sans_empreinte(),
+                         {'arrets_travail': {'lignes': 1, 'doublons': [{'id': 2, 'doublon_de': 1}]}})
+
+        for nombre_jours in (3, '03', '3.0', ' 3'):
+            succes, _ = api.ajouter_certificat('arrets_travail', dict(LIGNES_ORIGINE[0][1], nombre_jours=nombre_jours))
+            self.assertFalse(succes, nombre_jours)
+        succes, _ = api.ajouter_certificat('arrets_travail', dict(LIGNES_ORIGINE[0][1], nombre_jours='4'))
+        self.assertTrue(succes)
+
+    def test_cumuls_journaliers(self):
+        for table, date_field in api.CHAMPS_DATE.items():
+            jours = 'COALESCE(nombre_jours, 0)' if table in api.MESURES_STATISTIQUES else '0'
+            attendu = self.conn.execute(f'''
+                SELECT COALESCE({date_field}, ''), COALESCE(medecin, ''), COUNT(*), SUM({jours})
+                FROM {table} GROUP BY 1, 2 ORDER BY 1, 2''').fetchall()
+            cumuls = self.conn.execute('''
+                SELECT jour, medecin, nombre, total_jours FROM stats_journalieres
+                WHERE table_source = ? ORDER BY jour, medecin''', (table,)).fetchall()
+            self.assertEqual([tuple(row) for row in cumuls], [tuple(row) for row in attendu], table)
+
+        # Cumuls et GROUP BY rendent la même forme (médecin NULL compris)
+        cumuls = api.calculer_statistiques('dece', '2021-01-01', '2024-12-31', grouper_par=['medecin'])
+        group_by = api.calculer_statistiques('dece', '2021-01-01', '2024-12-31', grouper_par=['medecin', 'sexe'])
+        self.assertEqual([ligne['medecin'] for ligne in cumuls['data']], [None, 'Dr Amrani'])
+        self.assertEqual([ligne['medecin'] for ligne in group_by['data']], [None, 'Dr Amrani'])
+
+    def test_recherche_patients(self):
+        total = sum(self.compter(table) for table in api.CHAMPS_DATE)
+        self.assertEqual(self.compter('recherche_patients'), total)
+
+        resultat = api.rechercher_patients('benal amin')
+        self.assertEqual(sorted((ligne['table'], ligne['id']) for ligne in resultat['data']),
+                         [('arrets_travail', 1), ('arrets_travail', 2)])
+        # Colonne « autres » de dece : noms en arabe
+        self.assertEqual([ligne['id'] for ligne in api.rechercher_patients('تواتي')['data']], [1])
+
+        api.supprimer_enregistrement('cbv', 1)
+        self.assertEqual(api.rechercher_patients('khelifi')['data'], [])
+
+    def test_journal_des_modifications(self):
+        # Lignes existantes journalisées comme ajouts : une synchronisation depuis 0 reçoit tout
+        initial = api.lister_modifications(since=0, limit=500)
+        self.assertEqual(sorted((entree['table'], entree['id']) for entree in initial['data']),
+                         sorted((table, row[0]) for table in api.CHAMPS_DATE
+                                for row in self.conn.execute(f'SELECT id FROM {table}')))
+        depuis = initial['last_seq']
+
+        self.assertTrue(api.ajouter_certificat('cbv', {'nom': 'Ferhat', 'prenom': 'Amel', 'medecin': 'Dr Essaid',
+                                                       'date_certificat': '2024-06-01'})[0])
+        record_id = self.conn.execute("SELECT id FROM cbv WHERE nom = 'Ferhat'").fetchone()[0]
+        self.assertTrue(api.modifier_certificat('cbv', {'id': record_id, 'nom': 'Ferhat', 'prenom': 'Amel',
+                                                        'medecin': 'Dr Derradji',
+                                                        'date_certificat': '2024-06-01'})['ok'])
+        self.assertTrue(api.supprimer_enregistrement('prolongation', 1)['ok'])
+
+        suite = api.lister_modifications(since=depuis, limit=500)
+        self.assertEqual([(entree['table'], entree['id'], entree['operation']) for entree in suite['data']],
+                         [('cbv', record_id, 'update'), ('prolongation', 1, 'delete')])
+        self.assertEqual(suite['data'][0]['record']['medecin'], 'Dr Derradji')
+        self.assertEqual([entree['seq'] for entree in suite['data']],
+                         sorted(entree['seq'] for entree in suite['data']))
+        self.assertGreater(suite['data'][0]['seq'], depuis)
+        self.assertEqual(suite['next_since'], suite['last_seq'])
+
+
+class TestArchivage(BaseMigree):
+    def lire(self):
+        return (api.calculer_statistiques('arrets_travail', '2021-01-01', '2024-12-31', periode='mois')['data'],
+                api.calculer_statistiques('dece', '2021-01-01', '2024-12-31', grouper_par=['medecin'])['data'],
+                api.recuperer_donnees_entre_dates('arrets_travail', '2021-01-01', '2021-12-31')['total'],
+                api.recuperer_donnees_entre_dates('dece', '2021-01-01', '2024-12-31')['total'],
+                api.rechercher_patients('touati')['returned'])
+
+    def test_archiver_annee(self):
+        avant = self.lire()
+        dernier = api.lister_modifications(since=-1)['last_seq']
+
+        rapport = api.archiver_annee(2021)
+        self.assertEqual(rapport['lignes'], {'dece': 1, 'arrets_travail': 2})
+        self.assertEqual(rapport['restants'], {'dece': 0, 'arrets_travail': 0})
+        self.assertTrue(os.path.exists(api.partitions.chemin(2021)))
+
+        # Lignes déplacées : lectures, cumuls et recherche inchangés, aucune suppression journalisée
+        self.assertEqual(self.compter('arrets_travail', "date_certificat LIKE '2021%'"), 0)
+        self.assertEqual(self.compter('dece', "date_deces LIKE '2021%'"), 0)
+        self.assertEqual(self.lire(), avant)
+        self.assertEqual(api.lister_modifications(since=dernier)['data'], [])
+
+        # Année archivée : lecture seule, doublons refusés
+        erreur = api.supprimer_enregistrement('arrets_travail', 1)['error']
+        self.assertIn('lecture seule', erreur)
+        self.assertIn('lecture seule', api.modifier_certificat('dece', {'id': 1, 'nom': 'X'})['error'])
+        self.assertFalse(api.ajouter_certificat('arrets_travail', LIGNES_ORIGINE[0][1])[0])
+
+        # Relancer l'archivage n'a plus rien à déplacer
+        rapport = api.archiver_annee(2021)
+        self.assertEqual(rapport['lignes'], {'dece': 0, 'arrets_travail': 0})
+
+
+if __name__ == '__main__':
+    unittest.main()